@@ -1,17 +1,61 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, abort, Response, has_request_context
 from datetime import datetime, timedelta
+from functools import lru_cache
 import qrcode
 import io
-import base64
+import hashlib
+import hmac
 import json
 import uuid
-from database import Database
+import os
+import threading
+from database import (EXPORTS, GATE_ENTRY_GRACE, GROUP_COMMIT_MAX_BATCH, OVERSTAY_INTERVAL_SECONDS,
+                      SWEEP_INTERVAL_SECONDS, Database, GroupCommitWriter, PeriodicJob, SlowQueryLog, SpotFeedGap)
+import exports
+import metrics
+from qr_token import TOKEN_VERSION, InvalidQRCode, derive_key, encode_token, parse_qr
 
 app = Flask(__name__)
 app.secret_key = 'university-parking-secret-key-2025-secure'
 
-# Initialize database
-db = Database()
+def current_route():
+    """Route being served, as recorded in the slow-query log"""
+    if has_request_context() and request.url_rule:
+        return f'{request.method} {request.url_rule.rule}'
+    return None
+
+# Slow-query log, off unless PARKING_SLOW_QUERY_MS is set (0 logs every statement)
+slow_query_log = None
+if os.environ.get('PARKING_SLOW_QUERY_MS'):
+    slow_query_log = SlowQueryLog(os.environ.get('PARKING_SLOW_QUERY_LOG', 'slow_queries.jsonl'),
+                                  threshold_ms=float(os.environ['PARKING_SLOW_QUERY_MS']),
+                                  source=current_route)
+
+# Initialize database; PARKING_SPOT_STRATEGY=best_fit packs bookings into the tightest free gap
+db = Database(os.environ.get('PARKING_DB_PATH', 'parking.db'),
+              spot_strategy=os.environ.get('PARKING_SPOT_STRATEGY', 'first_fit'),
+              interval_backend=os.environ.get('PARKING_INTERVAL_BACKEND', 'memory'),
+              slow_query_log=slow_query_log)
+
+# Request and query instrumentation, exposed at /metrics
+registry = metrics.Registry()
+metrics.instrument_app(app, registry)
+metrics.instrument_database(db, registry)
+metrics.track_occupancy(db, registry)
+
+# Group commit for gate scans and bookings, off unless PARKING_GROUP_COMMIT_MS is set:
+# one writer thread per worker commits whatever arrived within that many milliseconds
+group_writer = None
+if os.environ.get('PARKING_GROUP_COMMIT_MS'):
+    group_writer = GroupCommitWriter(
+        db, max_batch=int(os.environ.get('PARKING_GROUP_COMMIT_BATCH', GROUP_COMMIT_MAX_BATCH)),
+        max_delay=float(os.environ['PARKING_GROUP_COMMIT_MS']) / 1000)
+
+def write(method, *args):
+    """Call a Database write method, through the group-commit writer when it is on"""
+    if group_writer is None:
+        return method(*args)
+    return group_writer.submit(method, *args).result()
 
 # Pricing configuration
 PRICING = {
@@ -20,6 +64,38 @@ PRICING = {
 }
 
 FINE_MULTIPLIER = 2  # Fine is 2x the hourly rate
+# Late-exit fine per vehicle type, charged once per booking
+FINE_RATES = {vehicle_type: rate * FINE_MULTIPLIER for vehicle_type, rate in PRICING.items()}
+
+# Background jobs, each a thread per worker started from the first request (0 turns one off):
+# PARKING_SWEEP_SECONDS releases spots held by no-shows and expired reservations (or run
+# sweep_reservations.py from cron instead), PARKING_OVERSTAY_SECONDS fines cars parked past
+# their exit time
+background_jobs = [
+    PeriodicJob('reservation-sweeper', float(os.environ.get('PARKING_SWEEP_SECONDS', SWEEP_INTERVAL_SECONDS)),
+                db.sweep_reservations),
+    PeriodicJob('overstay-fines', float(os.environ.get('PARKING_OVERSTAY_SECONDS', OVERSTAY_INTERVAL_SECONDS)),
+                lambda: db.accrue_overstay_fines(FINE_RATES)),
+]
+
+@app.before_request
+def start_background_jobs():
+    for job in background_jobs:
+        job.start()
+
+QR_CACHE_SIZE = 512  # Rendered QR PNGs kept in memory per worker
+QR_FORMAT = os.environ.get('PARKING_QR_FORMAT', 'token')  # 'token' (compact, signed) or 'json' (legacy)
+QR_KEY = derive_key(app.secret_key)
+
+# Live status stream: each open stream holds a worker thread, so cap them and end them
+# periodically (browsers reconnect and resume); refused clients fall back to polling
+LIVE_STREAM_LIMIT = int(os.environ.get('PARKING_LIVE_STREAM_LIMIT', 32))
+LIVE_STREAM_SECONDS = 300
+LIVE_STREAM_HEARTBEAT_SECONDS = 15
+live_streams = threading.BoundedSemaphore(LIVE_STREAM_LIMIT)
+
+# Bearer token a Prometheus scraper sends to /metrics; without one only admin sessions can read it
+METRICS_TOKEN = os.environ.get('PARKING_METRICS_TOKEN')
 
 @app.route('/')
 def index():
@@ -66,21 +142,85 @@ def dashboard():
         return redirect(url_for('login'))
     
     user_id = session['user_id']
-    bookings = db.get_user_bookings(user_id)
+    page = db.get_user_bookings_page(user_id, keyset_cursor(request.args.get('before')))
     pending_fines = db.get_pending_fines(user_id)
     
-    # Find active booking
-    active_booking = None
-    for booking in bookings:
-        if booking[10] == 'active':  # status is at index 10
-            active_booking = booking
-            break
-    
     return render_template('dashboard.html', 
                          user_name=session['user_name'],
-                         active_booking=active_booking,
+                         active_booking=db.get_active_booking(user_id),
                          pending_fines=pending_fines,
-                         bookings=bookings[:5])  # Show last 5 bookings
+                         bookings=page.bookings,
+                         older=cursor_param(page.before))
+
+def keyset_cursor(value):
+    """(epoch, id) from a ?before=<epoch>,<id> page cursor; None if absent or malformed"""
+    try:
+        epoch, row_id = value.split(',')
+        return int(epoch), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+def cursor_param(before):
+    """?before= value for a page's (epoch, id) cursor, the inverse of keyset_cursor()"""
+    return '{},{}'.format(*before) if before else None
+
+def qr_payload(booking_id, user_id, vehicle_type, vehicle_number, entry_time, exit_time, spot_number):
+    """Text encoded in a booking's QR code and read back by the gate scanners"""
+    if QR_FORMAT == 'json':
+        return json.dumps({
+            'booking_id': booking_id,
+            'user_id': user_id,
+            'vehicle_type': vehicle_type,
+            'vehicle_number': vehicle_number,
+            'entry_time': datetime.fromisoformat(str(entry_time)).isoformat(),
+            'exit_time': datetime.fromisoformat(str(exit_time)).isoformat()
+        })
+    return encode_token(QR_KEY, booking_id, spot_number, vehicle_type, entry_time, exit_time)
+
+def qr_version(booking_id, vehicle_type, vehicle_number, entry_time, exit_time):
+    """Changes whenever the QR payload would (a booking keeps its spot once booked), including
+    when the token format does: the PNG is served immutable under this version"""
+    fields = '|'.join([QR_FORMAT, str(TOKEN_VERSION), booking_id, vehicle_type, vehicle_number,
+                       datetime.fromisoformat(str(entry_time)).isoformat(),
+                       datetime.fromisoformat(str(exit_time)).isoformat()])
+    return hmac.new(QR_KEY, fields.encode(), hashlib.sha256).hexdigest()[:12]
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def render_qr_png(payload):
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def qr_image_url(booking_id, vehicle_type, vehicle_number, entry_time, exit_time):
+    """Versioned QR image URL, safe to cache for as long as the version matches"""
+    return url_for('booking_qr', booking_id=booking_id,
+                   v=qr_version(booking_id, vehicle_type, vehicle_number, entry_time, exit_time))
+
+@app.template_global()
+def qr_url(booking):
+    """qr_image_url() for a BookingRow"""
+    return qr_image_url(booking.booking_id, booking.vehicle_type, booking.vehicle_number,
+                        booking.entry_time, booking.exit_time)
+
+def gate_check(qr, action_type):
+    """Reject a signed token outside its validity window without a database lookup.
+
+    Returns an error message, or None. Legacy JSON codes are not signed and
+    are only checked against the database.
+    """
+    if not qr.signed or action_type != 'entry':
+        return None
+    now = datetime.now()
+    if now < qr.valid_from - GATE_ENTRY_GRACE:
+        return 'Too early for entry'
+    if now > qr.valid_until:
+        return 'QR code has expired'
+    return None
 
 @app.route('/book', methods=['GET', 'POST'])
 def book():
@@ -101,47 +241,10 @@ def book():
         duration = (exit_time - entry_time).total_seconds() / 3600  # hours
         parking_amount = duration * PRICING[vehicle_type]
         
-        # Check pending fines
-        pending_fines = db.get_pending_fines(session['user_id'])
-        total_amount = parking_amount + pending_fines
-        
-        # Check slot availability
-        available_slots = db.check_slot_availability(vehicle_type, entry_time, exit_time)
-        
-        if available_slots <= 0:
-            return render_template('book.html', 
-                                 error='No slots available for the selected time period')
-        
-        # Find and reserve a specific parking spot
-        available_spot = db.find_available_spot(vehicle_type, entry_time, exit_time)
-        
-        if not available_spot:
-            return render_template('book.html', 
-                                 error='No specific parking spots available for the selected time period')
-        
-        spot_number, zone, floor_level = available_spot
-        
-        # Generate QR code
         booking_id = str(uuid.uuid4())[:12].upper()
-        booking_data = {
-            'booking_id': booking_id,
-            'user_id': session['user_id'],
-            'vehicle_type': vehicle_type,
-            'vehicle_number': vehicle_number,
-            'entry_time': entry_time.isoformat(),
-            'exit_time': exit_time.isoformat()
-        }
-        
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(json.dumps(booking_data))
-        qr.make(fit=True)
         
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        qr_code_data = base64.b64encode(buffer.getvalue()).decode()
-        
-        # Create booking
+        # Check availability, reserve a specific spot, record the transaction
+        # and settle pending fines in a single database transaction
         booking_info = {
             'booking_id': booking_id,
             'user_id': session['user_id'],
@@ -149,50 +252,61 @@ def book():
             'vehicle_type': vehicle_type,
             'entry_time': entry_time,
             'exit_time': exit_time,
-            'amount': parking_amount,
-            'qr_code': qr_code_data
+            'amount': parking_amount
         }
         
-        booking_id = db.create_booking(booking_info)
-        
-        # Reserve the specific parking spot
-        db.reserve_parking_spot(booking_id, spot_number, entry_time, exit_time)
+        result = write(db.book_spot, booking_info)
         
-        # Create transaction record
-        transaction_data = {
-            'user_id': session['user_id'],
-            'booking_id': booking_id,
-            'transaction_type': 'booking',
-            'parking_amount': parking_amount,
-            'fine_amount': pending_fines,
-            'total_amount': total_amount,
-            'description': f'Parking booking for {vehicle_type} {vehicle_number} - {duration:.1f} hours - Spot {spot_number}'
-        }
-        transaction_id = db.create_transaction(transaction_data)
-        
-        # Pay any pending fines
-        if pending_fines > 0:
-            db.pay_pending_fines(session['user_id'])
+        if result['spot_number'] is None:
+            if result['available_slots'] <= 0:
+                return render_template('book.html', 
+                                     error='No slots available for the selected time period')
+            return render_template('book.html', 
+                                 error='No specific parking spots available for the selected time period')
         
         return render_template('booking_success.html',
-                             booking_id=booking_id,
-                             transaction_id=transaction_id,
+                             booking_id=result['booking_id'],
+                             transaction_id=result['transaction_id'],
                              vehicle_type=vehicle_type,
                              vehicle_number=vehicle_number,
                              duration=duration,
                              parking_amount=parking_amount,
-                             pending_fines=pending_fines,
-                             total_amount=total_amount,
-                             qr_code=qr_code_data,
-                             available_slots=available_slots,
-                             spot_number=spot_number,
-                             zone=zone,
-                             floor_level=floor_level,
+                             pending_fines=result['pending_fines'],
+                             total_amount=result['total_amount'],
+                             qr_code_url=qr_image_url(booking_id, vehicle_type, vehicle_number,
+                                                      entry_time, exit_time),
+                             available_slots=result['available_slots'],
+                             spot_number=result['spot_number'],
+                             zone=result['zone'],
+                             floor_level=result['floor_level'],
                              entry_time=entry_time.strftime('%d %b %Y, %I:%M %p'),
                              exit_time=exit_time.strftime('%d %b %Y, %I:%M %p'))
     
     return render_template('book.html')
 
+@app.route('/qr/<booking_id>.png')
+def booking_qr(booking_id):
+    if 'user_id' not in session and not session.get('is_admin'):
+        abort(401)
+    
+    booking = db.get_qr_booking(booking_id)
+    if not booking or (not session.get('is_admin') and booking[1] != session['user_id']):  # user_id is at index 1
+        abort(404)
+    
+    booking_id, user_id, vehicle_type, vehicle_number, entry_time, exit_time, spot_number = booking
+    payload = qr_payload(booking_id, user_id, vehicle_type, vehicle_number, entry_time, exit_time, spot_number)
+    version = qr_version(booking_id, vehicle_type, vehicle_number, entry_time, exit_time)
+    response = app.response_class(render_qr_png(payload), mimetype='image/png')
+    response.set_etag(version)
+    response.cache_control.private = True
+    if request.args.get('v') == version:
+        # Versioned URLs never change content; an extension gets a new version
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/check_availability')
 def check_availability():
     vehicle_type = request.args.get('vehicle_type')
@@ -206,8 +320,15 @@ def check_availability():
 @app.route('/scan_entry', methods=['POST'])
 def scan_entry():
     try:
-        qr_data = json.loads(request.json['qr_data'])
-        booking_id = qr_data.get('booking_id')
+        try:
+            qr = parse_qr(QR_KEY, request.json['qr_data'])
+        except InvalidQRCode:
+            return jsonify({'success': False, 'message': 'Invalid QR code'})
+        rejection = gate_check(qr, 'entry')
+        if rejection:
+            return jsonify({'success': False, 'message': rejection})
+        
+        booking_id = qr.booking_id
         booking = db.get_booking_by_id(booking_id)
         
         if booking:
@@ -239,42 +360,24 @@ def scan_entry():
 @app.route('/scan_exit', methods=['POST'])
 def scan_exit():
     try:
-        qr_data = json.loads(request.json['qr_data'])
-        booking_id = qr_data.get('booking_id')
+        try:
+            qr = parse_qr(QR_KEY, request.json['qr_data'])
+        except InvalidQRCode:
+            return jsonify({'success': False, 'message': 'Invalid QR code'})
+        
+        booking_id = qr.booking_id
         booking = db.get_booking_by_id(booking_id)
         
         if booking:
             current_time = datetime.now()
-            # Check if user is exiting late
-            scheduled_exit = datetime.fromisoformat(booking[6])  # exit_time is at index 6
             
             # Get assigned parking spot
             spot = db.get_parking_spot_by_booking(booking_id)
             spot_number = spot[0] if spot else None
             
-            fine_amount = 0
-            if current_time > scheduled_exit:
-                # Add fine for late exit
-                fine_amount = PRICING[booking[4]] * FINE_MULTIPLIER  # vehicle_type is at index 4
-                db.add_fine(booking[2], booking[1], fine_amount, 'Late exit')  # user_id, booking_id
-                
-                # Create transaction record for fine
-                fine_transaction_data = {
-                    'user_id': booking[2],
-                    'booking_id': booking[1],
-                    'transaction_type': 'fine',
-                    'fine_amount': fine_amount,
-                    'total_amount': fine_amount,
-                    'description': f'Late exit fine for {booking[4]} {booking[3]} - exceeded time by {int((current_time - scheduled_exit).total_seconds() / 60)} minutes'
-                }
-                db.create_transaction(fine_transaction_data)
-            
-            # Update exit time
-            db.update_exit_time(booking[1], current_time)
-            
-            # Free up the parking spot
-            if spot_number:
-                db.free_parking_spot(booking_id, spot_number)
+            # Exit time and freed spot in one transaction; a late exit settles the fine
+            # the overstay job accrued
+            fine_amount = write(db.record_exit, booking_id, spot_number, current_time)
             
             response_message = f'Exit recorded successfully'
             if spot_number:
@@ -354,6 +457,10 @@ def live_slots():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
+    # Taken before reading the spots, so the stream and polls resume from no later than what is shown
+    feed_position = db.spot_feed.position()
+    spot_version = db.get_spot_version()
+
     # Get live parking status
     bike_status = db.get_live_parking_status('bike')
     car_status = db.get_live_parking_status('car')
@@ -366,25 +473,101 @@ def live_slots():
                          bike_status=bike_status,
                          car_status=car_status,
                          bike_spots=bike_spots,
-                         car_spots=car_spots)
+                         car_spots=car_spots,
+                         feed_position=feed_position,
+                         spot_version=spot_version)
 
 @app.route('/api/live_status')
 def api_live_status():
-    """API endpoint for real-time status updates"""
+    """API endpoint for real-time status updates.
+
+    Every response carries the lot's state 'version'. With ?since=<version> only
+    the spots changed after it are returned (no zone summary; clients keep their
+    own counts). Responses are tagged with the version, so a poll that finds
+    nothing new gets an empty 304.
+    """
     vehicle_type = request.args.get('type')
-    
-    if vehicle_type:
-        status = db.get_live_parking_status(vehicle_type)
-        spots = db.get_all_spots_with_status(vehicle_type)
+    since = request.args.get('since', type=int)
+
+    # Read before the spots, so they are at least this new
+    version = db.get_spot_version()
+    etag = f'{version}-{vehicle_type or "all"}-{"full" if since is None else since}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif since is not None:
+        response = jsonify({
+            'version': version,
+            'since': since,
+            'spots': db.get_spots_changed_since(since, vehicle_type) if since < version else [],
+            'timestamp': datetime.now().isoformat()
+        })
     else:
-        status = db.get_live_parking_status()
-        spots = db.get_all_spots_with_status()
-    
-    return jsonify({
-        'status': status,
-        'spots': spots,
-        'timestamp': datetime.now().isoformat()
-    })
+        if vehicle_type:
+            status = db.get_live_parking_status(vehicle_type)
+            spots = db.get_all_spots_with_status(vehicle_type)
+        else:
+            status = db.get_live_parking_status()
+            spots = db.get_all_spots_with_status()
+
+        response = jsonify({
+            'version': version,
+            'status': status,
+            'spots': spots,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    # The body also carries a timestamp, hence a weak tag
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target: request/query latency, call counts and occupancy gauges.
+
+    Readable by admin sessions, or with 'Authorization: Bearer <PARKING_METRICS_TOKEN>'.
+    """
+    if not session.get('is_admin'):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if not (METRICS_TOKEN and scheme.lower() == 'bearer'
+                and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode())):
+            abort(401)
+    return Response(registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/live_status/stream')
+def api_live_status_stream():
+    """Server-Sent Events: one 'spot' event per changed spot, from the shared change feed.
+
+    Resumes after ?since= (the position live_slots rendered) or the Last-Event-ID
+    a reconnecting browser sends. A 'resync' event means that position can no
+    longer be resumed and the client should reload /api/live_status once.
+    """
+    if 'user_id' not in session and not session.get('is_admin'):
+        abort(401)
+    if not live_streams.acquire(blocking=False):
+        return Response('Too many live streams, poll /api/live_status instead\n', status=503,
+                        headers={'Retry-After': str(LIVE_STREAM_SECONDS)})
+    position = request.headers.get('Last-Event-ID') or request.args.get('since')
+
+    def stream():
+        yield 'retry: 5000\n\n'
+        deadline = datetime.now() + timedelta(seconds=LIVE_STREAM_SECONDS)
+        try:
+            for events in db.spot_feed.listen(position, LIVE_STREAM_HEARTBEAT_SECONDS):
+                if not events:
+                    yield ': keepalive\n\n'
+                for event_id, event in events:
+                    yield f'id: {event_id}\nevent: spot\ndata: {json.dumps(event)}\n\n'
+                if datetime.now() >= deadline:
+                    break
+        except SpotFeedGap:
+            yield f'id: {db.spot_feed.position()}\nevent: resync\ndata: {{}}\n\n'
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs even if the client goes away before the stream starts
+    response.call_on_close(live_streams.release)
+    return response
 
 @app.route('/my_spot')
 def my_spot():
@@ -392,18 +575,8 @@ def my_spot():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user_id = session['user_id']
-    bookings = db.get_user_bookings(user_id)
-    
-    # Find active booking
-    active_booking = None
-    assigned_spot = None
-    
-    for booking in bookings:
-        if booking[10] == 'active':  # status is at index 10
-            active_booking = booking
-            assigned_spot = db.get_parking_spot_by_booking(booking[1])  # booking_id
-            break
+    active_booking = db.get_active_booking(session['user_id'])
+    assigned_spot = db.get_parking_spot_by_booking(active_booking.booking_id) if active_booking else None
     
     return render_template('my_spot.html',
                          active_booking=active_booking,
@@ -435,17 +608,14 @@ def transactions():
     
     user_id = session['user_id']
     transactions = db.get_user_transactions(user_id, 20)  # Get last 20 transactions
-    pending_fines = db.get_pending_fines(user_id)
-    
-    # Calculate total spent and transaction count
-    total_spent = sum(t[7] for t in transactions)  # total_amount is at index 7
-    transaction_count = len(transactions)
+    # Lifetime totals, not just those of the rows shown
+    account = db.get_user_account(user_id)
     
     return render_template('transactions.html',
                          transactions=transactions,
-                         total_spent=total_spent,
-                         transaction_count=transaction_count,
-                         pending_fines=pending_fines)
+                         total_spent=account.total_spent,
+                         transaction_count=account.transaction_count,
+                         pending_fines=account.pending_fines)
 
 @app.route('/scanner')
 def scanner():
@@ -478,22 +648,27 @@ def admin_dashboard():
     # Get recent entry/exit logs
     recent_logs = db.get_entry_exit_logs(limit=50)
     
-    # Get today's statistics
-    from datetime import datetime, timedelta
-    today = datetime.now().date()
-    
-    # Count today's entries and exits
-    entry_count = sum(1 for log in recent_logs if log['action_type'] == 'entry' and 
-                     datetime.fromisoformat(log['timestamp']).date() == today)
-    exit_count = sum(1 for log in recent_logs if log['action_type'] == 'exit' and 
-                    datetime.fromisoformat(log['timestamp']).date() == today)
+    # Today's counts come from the gate_stats_daily rollup, however busy the day
+    stats = db.get_gate_stats()
     
     return render_template('admin_dashboard.html',
                          admin_name=session['admin_name'],
                          admin_role=session['admin_role'],
                          recent_logs=recent_logs,
-                         entry_count=entry_count,
-                         exit_count=exit_count)
+                         entry_count=stats.entries,
+                         exit_count=stats.exits)
+
+@app.route('/admin/api/stats')
+def admin_api_stats():
+    """Gate scans for ?day=YYYY-MM-DD (default today): totals and per zone and admin counts"""
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+
+    try:
+        day = datetime.strptime(request.args['day'], '%Y-%m-%d').date() if request.args.get('day') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'day must be YYYY-MM-DD'}), 400
+    return jsonify({'success': True, **db.get_gate_stats(day)._asdict()})
 
 @app.route('/admin/scanner')
 def admin_scanner():
@@ -512,58 +687,42 @@ def verify_qr():
         qr_data = request.json.get('qr_data')
         action_type = request.json.get('action_type', 'entry')  # 'entry' or 'exit'
         
-        # Parse QR code data
-        import json as json_module
-        booking_data = json_module.loads(qr_data)
-        booking_id = booking_data.get('booking_id')
-        
-        if not booking_id:
+        # Parse QR code data; signed tokens are checked before touching the database
+        try:
+            qr = parse_qr(QR_KEY, qr_data)
+        except InvalidQRCode:
             return jsonify({'success': False, 'message': 'Invalid QR code format'})
-        
-        # Verify booking exists
-        booking_info = db.verify_qr_booking(booking_id)
-        if not booking_info:
-            return jsonify({'success': False, 'message': 'Invalid or expired booking'})
-        
-        # Check for duplicate entry/exit
-        if db.check_duplicate_entry_exit(booking_id, action_type):
-            return jsonify({'success': False, 'message': f'{action_type.title()} already recorded for this booking'})
-        
-        # Validate timing
-        from datetime import datetime
-        current_time = datetime.now()
-        entry_time = datetime.fromisoformat(booking_info['entry_time'])
-        exit_time = datetime.fromisoformat(booking_info['exit_time'])
-        
-        if action_type == 'entry':
-            # Allow entry 15 minutes before scheduled time
-            if current_time < entry_time - timedelta(minutes=15):
-                return jsonify({'success': False, 'message': 'Too early for entry'})
-        elif action_type == 'exit':
-            # Must have entered first
-            if not db.check_duplicate_entry_exit(booking_id, 'entry'):
-                return jsonify({'success': False, 'message': 'Must enter before exit'})
-        
-        # Record the entry/exit
-        success = db.record_entry_exit(booking_id, action_type, session['admin_id'], booking_info['spot_number'])
-        
-        if success:
-            return jsonify({
-                'success': True,
-                'message': f'{action_type.title()} verified successfully',
-                'booking_info': {
-                    'booking_id': booking_info['booking_id'],
-                    'user_name': booking_info['user_name'],
-                    'vehicle_number': booking_info['vehicle_number'],
-                    'vehicle_type': booking_info['vehicle_type'],
-                    'spot_number': booking_info['spot_number'],
-                    'zone': booking_info['zone'],
-                    'entry_time': booking_info['entry_time'],
-                    'exit_time': booking_info['exit_time']
-                }
-            })
-        else:
-            return jsonify({'success': False, 'message': 'Failed to record entry/exit'})
+        rejection = gate_check(qr, action_type)
+        if rejection:
+            return jsonify({'success': False, 'message': rejection})
+        booking_id = qr.booking_id
+        
+        # Verify, check for duplicates and timing, and record the scan in one transaction
+        now = datetime.now()
+        # A late exit reports the fine the overstay job accrued
+        event = write(db.process_gate_event, booking_id, action_type, session['admin_id'], now)
+        if not event.success:
+            return jsonify({'success': False, 'message': event.message})
+        
+        message = event.message
+        if event.fine:
+            message += f'. Late exit fine of ₹{event.fine} is pending'
+        
+        booking_info = event.booking
+        return jsonify({
+            'success': True,
+            'message': message,
+            'booking_info': {
+                'booking_id': booking_info['booking_id'],
+                'user_name': booking_info['user_name'],
+                'vehicle_number': booking_info['vehicle_number'],
+                'vehicle_type': booking_info['vehicle_type'],
+                'spot_number': booking_info['spot_number'],
+                'zone': booking_info['zone'],
+                'entry_time': booking_info['entry_time'],
+                'exit_time': booking_info['exit_time']
+            }
+        })
             
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error processing QR code: {str(e)}'})
@@ -573,14 +732,86 @@ def admin_logs():
     if not session.get('is_admin'):
         return redirect(url_for('admin_login'))
     
-    # Get all logs with pagination
-    page = request.args.get('page', 1, type=int)
-    limit = 100
-    
-    logs = db.get_entry_exit_logs(limit=limit)
+    page = db.get_log_page(keyset_cursor(request.args.get('before')), **log_filters(request.args))
     
     return render_template('admin_logs.html',
-                         logs=logs,
+                         logs=page.logs,
+                         older=cursor_param(page.before),
+                         filters=db.get_log_filters(),
+                         admin_name=session['admin_name'])
+
+@app.route('/api/admin/logs')
+def api_admin_logs():
+    """A page of /admin/logs as JSON, for infinite scroll: pass back 'before' for the next page"""
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+
+    page = db.get_log_page(keyset_cursor(request.args.get('before')), **log_filters(request.args))
+    return jsonify({'success': True, 'logs': page.logs, 'before': cursor_param(page.before)})
+
+def log_filters(args):
+    """get_log_page() filters from the log browser's query string; dates are local, 'until' inclusive"""
+    filters = {'action_type': args.get('action') or None,
+               'vehicle_type': args.get('type') or None,
+               'vehicle_number': args.get('vehicle', '').strip() or None,
+               'zone': args.get('zone') or None,
+               'verified_by': args.get('admin') or None}
+    filters.update(date_bounds(args))
+    return filters
+
+def date_bounds(args):
+    """{'since': datetime, 'until': datetime} from local ?since=/?until= dates, 'until' inclusive;
+    missing or malformed dates are left out"""
+    bounds = {}
+    for name, days in (('since', 0), ('until', 1)):
+        try:
+            bounds[name] = datetime.strptime(args.get(name, ''), '%Y-%m-%d') + timedelta(days=days)
+        except ValueError:
+            pass
+    return bounds
+
+@app.route('/admin/export/<kind>')
+def admin_export(kind):
+    """Stream transactions, bookings or gate logs as ?format=csv|ndjson, optionally ?gzip=1,
+    over ?since=/?until= local dates. Rows go out a batch at a time as they are read."""
+    if not session.get('is_admin'):
+        return redirect(url_for('admin_login'))
+    fmt = request.args.get('format', 'csv')
+    if kind not in EXPORTS or fmt not in exports.FORMATS:
+        abort(404)
+
+    bounds = date_bounds(request.args)
+    body = exports.encode(EXPORTS[kind].columns, db.export_rows(kind, **bounds), fmt)
+    filename = '-'.join([kind] + [request.args[name] for name in ('since', 'until') if name in bounds])
+    filename += f'.{fmt}'
+    mimetype = exports.FORMATS[fmt]
+    if request.args.get('gzip'):
+        body, filename, mimetype = exports.gzipped(body), filename + '.gz', 'application/gzip'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"',
+                             'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/overstays')
+def admin_overstays():
+    if not session.get('is_admin'):
+        return redirect(url_for('admin_login'))
+
+    now = datetime.now()
+    overstays = [(overstay, int((now - datetime.fromisoformat(str(overstay[5]))).total_seconds() // 60))
+                 for overstay in db.get_overstays(now)]
+    return render_template('admin_overstays.html',
+                         overstays=overstays,
+                         fine_rates=FINE_RATES,
+                         admin_name=session['admin_name'])
+
+@app.route('/admin/slow_queries')
+def admin_slow_queries():
+    if not session.get('is_admin'):
+        return redirect(url_for('admin_login'))
+
+    return render_template('admin_slow_queries.html',
+                         slow_query_log=slow_query_log,
+                         statements=slow_query_log.summary() if slow_query_log else [],
                          admin_name=session['admin_name'])
 
 @app.route('/admin/logout')
@@ -598,6 +829,5 @@ def logout():
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
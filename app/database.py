@@ -1,189 +1,1831 @@
+import json
+import logging
+import logging.handlers
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from bisect import bisect_left, bisect_right
+import uuid
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import os
 
+# Connection tuning applied to every pooled connection
+BUSY_TIMEOUT_SECONDS = 30
+PAGE_CACHE_KB = 16384        # per-connection page cache (PRAGMA cache_size is in KiB when negative)
+MMAP_SIZE_BYTES = 64 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256   # prepared statements kept per connection (sqlite3 default is 128)
+
+# Cross-process cache coherence, see ChangeLog
+CHANGE_LOG_RETENTION = 10000  # change_log entries kept; a process further behind drops its row caches
+ROW_CACHE_SIZE = 4096         # users / bookings rows kept per process
+
+
+def _add_column(table, column, definition):
+    """Migration step: ALTER TABLE ... ADD COLUMN, skipped if the column exists"""
+    def step(cursor):
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return step
+
+
+# SQL for the UTC epoch seconds of a TIMESTAMP column, by how its text reads:
+#   'local' - local wall-clock time, as the app writes it (datetime.now(), the booking form)
+#   'utc'   - UTC, as CURRENT_TIMESTAMP defaults are
+EPOCH_SQL = {
+    'local': "CAST(strftime('%s', {}, 'utc') AS INTEGER)",
+    'utc': "CAST(strftime('%s', {}) AS INTEGER)",
+}
+
+
+def _epoch_columns(table, columns):
+    """Migration steps: INTEGER columns holding the UTC epoch seconds of a table's TIMESTAMP columns.
+
+    columns maps each new column to (TIMESTAMP column, EPOCH_SQL key). They
+    are backfilled, then restamped by triggers whenever a row is inserted or
+    its TIMESTAMP columns change, so every writer in every process keeps
+    them in step.
+    """
+    def stamp(row):
+        return ', '.join(f'{column} = ' + EPOCH_SQL[zone].format(row + source)
+                         for column, (source, zone) in columns.items())
+
+    sources = ', '.join(source for source, _ in columns.values())
+    return [_add_column(table, column, 'INTEGER') for column in columns] + [
+        f'UPDATE {table} SET {stamp("")}',
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_epoch_insert AFTER INSERT ON {table}
+            BEGIN
+                UPDATE {table} SET {stamp("NEW.")} WHERE id = NEW.id;
+            END''',
+        # The epoch columns are not in the UPDATE OF list, so stamping them does not re-fire this
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_epoch_update AFTER UPDATE OF {sources} ON {table}
+            BEGIN
+                UPDATE {table} SET {stamp("NEW.")} WHERE id = NEW.id;
+            END''',
+    ]
+
+
+# Per-user pending fines, lifetime spend and transaction count, recomputed from fines and
+# transactions; user_accounts keeps the same figures up to date (migration 15)
+USER_ACCOUNTS_SQL = '''
+    SELECT user_id, ROUND(SUM(pending_fines), 2), ROUND(SUM(total_spent), 2), SUM(transaction_count)
+    FROM (SELECT user_id, amount AS pending_fines, 0 AS total_spent, 0 AS transaction_count
+          FROM fines WHERE status = 'pending'
+          UNION ALL
+          SELECT user_id, 0, total_amount, 1 FROM transactions)
+    GROUP BY user_id
+'''
+
+
+# Gate log counts per local day, zone, action and verifying admin, recomputed from entry_exit_logs;
+# gate_stats_daily keeps the same counts up to date (migration 17). Logs without a spot or admin
+# count under '' so that the key never holds a NULL (which would defeat ON CONFLICT).
+GATE_STATS_SQL = '''
+    SELECT date(eel.timestamp, 'localtime'), COALESCE(ps.zone, ''), eel.action_type,
+           COALESCE(eel.verified_by, ''), COUNT(*)
+    FROM entry_exit_logs eel
+    LEFT JOIN parking_spots ps ON ps.spot_number = eel.spot_number
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def _gate_stats_change(row, delta):
+    """Trigger body statement adding delta to the gate_stats_daily count of an entry_exit_logs row"""
+    return f'''
+                INSERT INTO gate_stats_daily (day, zone, action_type, verified_by, count)
+                VALUES (date({row}.timestamp, 'localtime'),
+                        COALESCE((SELECT zone FROM parking_spots WHERE spot_number = {row}.spot_number), ''),
+                        {row}.action_type, COALESCE({row}.verified_by, ''), {delta})
+                ON CONFLICT (day, zone, action_type, verified_by) DO UPDATE SET count = count + ({delta});'''
+
+
+def _account_change(user_id, **deltas):
+    """Trigger body statements adding SQL deltas to columns of a user's user_accounts row,
+    creating the row if need be"""
+    changes = ', '.join(f'{column} = {column} + ({delta})' if column == 'transaction_count'
+                        else f'{column} = ROUND({column} + ({delta}), 2)'
+                        for column, delta in deltas.items())
+    return f'''
+                INSERT OR IGNORE INTO user_accounts (user_id) VALUES ({user_id});
+                UPDATE user_accounts SET {changes} WHERE user_id = {user_id};'''
+
+
+RESERVED_FROM_EPOCH = EPOCH_SQL['local'].format('NEW.reserved_from')
+RESERVED_UNTIL_EPOCH = EPOCH_SQL['local'].format('NEW.reserved_until')
+
+# Schema migrations, applied in order by Database.init_database().
+# Each entry is (version, description, steps); a step is an SQL statement or a
+# callable taking a cursor. Steps must be idempotent so that a database whose
+# tables were created before versioning existed can safely replay them.
+MIGRATIONS = [
+    (1, 'Index bookings and reservations for availability and spot lookups', [
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_availability
+           ON bookings (vehicle_type, status, entry_time, exit_time)''',
+        '''CREATE INDEX IF NOT EXISTS idx_slot_reservations_window
+           ON slot_reservations (status, reserved_from, reserved_until, spot_number)''',
+        '''CREATE INDEX IF NOT EXISTS idx_slot_reservations_booking
+           ON slot_reservations (booking_id, status)''',
+        '''CREATE INDEX IF NOT EXISTS idx_parking_spots_type_status
+           ON parking_spots (slot_type, status, zone, spot_number)''',
+        '''CREATE INDEX IF NOT EXISTS idx_parking_spots_booking
+           ON parking_spots (current_booking_id)''',
+    ]),
+    (2, 'Index gate logs for duplicate entry/exit detection', [
+        '''CREATE INDEX IF NOT EXISTS idx_entry_exit_logs_booking_action
+           ON entry_exit_logs (booking_id, action_type)''',
+    ]),
+    (3, 'Index per-user history: bookings, fines and transactions', [
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_user_created
+           ON bookings (user_id, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_fines_user_status
+           ON fines (user_id, status)''',
+        '''CREATE INDEX IF NOT EXISTS idx_transactions_user_created
+           ON transactions (user_id, created_at)''',
+    ]),
+    (4, 'Track a generation counter for live bookings (availability index)', [
+        '''CREATE TABLE IF NOT EXISTS cache_generations (
+               name TEXT PRIMARY KEY,
+               generation INTEGER NOT NULL DEFAULT 0
+           )''',
+        "INSERT OR IGNORE INTO cache_generations (name) VALUES ('bookings')",
+        # Bumped by any write, from any process, that adds, removes or moves a live booking
+        '''CREATE TRIGGER IF NOT EXISTS bookings_live_insert AFTER INSERT ON bookings
+           WHEN NEW.status IN ('booked', 'active')
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'bookings';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS bookings_live_update
+           AFTER UPDATE OF status, vehicle_type, entry_time, exit_time ON bookings
+           WHEN (OLD.status IN ('booked', 'active')) != (NEW.status IN ('booked', 'active'))
+             OR (NEW.status IN ('booked', 'active')
+                 AND (OLD.vehicle_type IS NOT NEW.vehicle_type
+                      OR OLD.entry_time IS NOT NEW.entry_time
+                      OR OLD.exit_time IS NOT NEW.exit_time))
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'bookings';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS bookings_live_delete AFTER DELETE ON bookings
+           WHEN OLD.status IN ('booked', 'active')
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'bookings';
+           END''',
+    ]),
+    (5, 'Track a generation counter for spot state and active reservations (spot index)', [
+        '''CREATE INDEX IF NOT EXISTS idx_slot_reservations_spot
+           ON slot_reservations (spot_number, status)''',
+        "INSERT OR IGNORE INTO cache_generations (name) VALUES ('spots')",
+        '''CREATE TRIGGER IF NOT EXISTS slot_reservations_active_insert AFTER INSERT ON slot_reservations
+           WHEN NEW.status = 'active'
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spots';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS slot_reservations_active_update
+           AFTER UPDATE OF status, spot_number, reserved_from, reserved_until ON slot_reservations
+           WHEN (OLD.status = 'active') != (NEW.status = 'active')
+             OR (NEW.status = 'active'
+                 AND (OLD.spot_number IS NOT NEW.spot_number
+                      OR OLD.reserved_from IS NOT NEW.reserved_from
+                      OR OLD.reserved_until IS NOT NEW.reserved_until))
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spots';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS slot_reservations_active_delete AFTER DELETE ON slot_reservations
+           WHEN OLD.status = 'active'
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spots';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS parking_spots_insert AFTER INSERT ON parking_spots
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spots';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS parking_spots_availability_update
+           AFTER UPDATE OF status, slot_type, zone, floor_level ON parking_spots
+           WHEN (OLD.status = 'available') != (NEW.status = 'available')
+             OR OLD.slot_type IS NOT NEW.slot_type
+             OR OLD.zone IS NOT NEW.zone
+             OR OLD.floor_level IS NOT NEW.floor_level
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spots';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS parking_spots_delete AFTER DELETE ON parking_spots
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spots';
+           END''',
+    ]),
+    (6, 'R*Tree index over active reservation windows', [
+        # One row per active slot_reservations row (same id), in epoch seconds.
+        # R*Tree coordinates are 32-bit floats rounded outwards, so range
+        # queries return a superset that callers re-check exactly. Empty or
+        # inverted windows overlap nothing and are left out.
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS reservation_windows
+           USING rtree(id, reserved_from, reserved_until)''',
+        '''INSERT OR REPLACE INTO reservation_windows (id, reserved_from, reserved_until)
+           SELECT id, strftime('%s', reserved_from), strftime('%s', reserved_until)
+           FROM slot_reservations
+           WHERE status = 'active' AND reserved_from <= reserved_until
+        ''',
+        '''CREATE TRIGGER IF NOT EXISTS reservation_windows_insert AFTER INSERT ON slot_reservations
+           WHEN NEW.status = 'active' AND NEW.reserved_from <= NEW.reserved_until
+           BEGIN
+               INSERT OR REPLACE INTO reservation_windows (id, reserved_from, reserved_until)
+               VALUES (NEW.id, strftime('%s', NEW.reserved_from), strftime('%s', NEW.reserved_until));
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS reservation_windows_update
+           AFTER UPDATE OF status, reserved_from, reserved_until ON slot_reservations
+           BEGIN
+               DELETE FROM reservation_windows WHERE id = OLD.id;
+               INSERT INTO reservation_windows (id, reserved_from, reserved_until)
+               SELECT NEW.id, strftime('%s', NEW.reserved_from), strftime('%s', NEW.reserved_until)
+               WHERE NEW.status = 'active' AND NEW.reserved_from <= NEW.reserved_until;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS reservation_windows_delete AFTER DELETE ON slot_reservations
+           BEGIN
+               DELETE FROM reservation_windows WHERE id = OLD.id;
+           END''',
+    ]),
+    (7, 'Partial index over live bookings for availability index reloads', [
+        # Only live rows are indexed, so a reload reads the upcoming bookings
+        # instead of scanning the whole booking history
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_live
+           ON bookings (vehicle_type, entry_time, exit_time, booking_id)
+           WHERE status IN ('booked', 'active')''',
+    ]),
+    (8, 'Drop inline QR PNGs from bookings; /qr/<booking_id>.png renders them on demand', [
+        # init_database() VACUUMs afterwards to give the freed pages back
+        '''UPDATE bookings SET qr_code = NULL WHERE qr_code IS NOT NULL''',
+    ]),
+    (9, 'Version parking spot state for /api/live_status?since= deltas', [
+        # cache_generations 'spot_version' is the lot's state version; every
+        # visible change to a spot bumps it and stamps the spot with the new
+        # value, so the spots changed since version V are those with version > V
+        _add_column('parking_spots', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+        "INSERT OR IGNORE INTO cache_generations (name) VALUES ('spot_version')",
+        "UPDATE cache_generations SET generation = 1 WHERE name = 'spot_version' AND generation = 0",
+        "UPDATE parking_spots SET version = 1 WHERE version = 0",
+        '''CREATE INDEX IF NOT EXISTS idx_parking_spots_version
+           ON parking_spots (version)''',
+        '''CREATE TRIGGER IF NOT EXISTS parking_spots_version_insert AFTER INSERT ON parking_spots
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spot_version';
+               UPDATE parking_spots
+               SET version = (SELECT generation FROM cache_generations WHERE name = 'spot_version')
+               WHERE id = NEW.id;
+           END''',
+        # The version column is not in the UPDATE OF list, so stamping it does not re-fire this
+        '''CREATE TRIGGER IF NOT EXISTS parking_spots_version_update
+           AFTER UPDATE OF status, is_occupied, is_reserved, current_booking_id, occupied_from,
+                           occupied_until, slot_type, zone, floor_level ON parking_spots
+           WHEN OLD.status IS NOT NEW.status
+             OR OLD.is_occupied IS NOT NEW.is_occupied
+             OR OLD.is_reserved IS NOT NEW.is_reserved
+             OR OLD.current_booking_id IS NOT NEW.current_booking_id
+             OR OLD.occupied_from IS NOT NEW.occupied_from
+             OR OLD.occupied_until IS NOT NEW.occupied_until
+             OR OLD.slot_type IS NOT NEW.slot_type
+             OR OLD.zone IS NOT NEW.zone
+             OR OLD.floor_level IS NOT NEW.floor_level
+           BEGIN
+               UPDATE cache_generations SET generation = generation + 1 WHERE name = 'spot_version';
+               UPDATE parking_spots
+               SET version = (SELECT generation FROM cache_generations WHERE name = 'spot_version')
+               WHERE id = NEW.id;
+           END''',
+    ]),
+    (10, 'Log changed users and bookings for cross-process row caches (ChangeLog)', [
+        # Every insert, update or delete appends (topic, key); processes read
+        # the entries after the last one they saw and drop those rows from
+        # their caches. Spots are versioned instead (parking_spots.version).
+        '''CREATE TABLE IF NOT EXISTS change_log (
+               seq INTEGER PRIMARY KEY AUTOINCREMENT,
+               topic TEXT NOT NULL,
+               key TEXT NOT NULL
+           )''',
+        '''CREATE TRIGGER IF NOT EXISTS users_change_insert AFTER INSERT ON users
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('users', NEW.user_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_change_update AFTER UPDATE ON users
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('users', NEW.user_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_change_delete AFTER DELETE ON users
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('users', OLD.user_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS bookings_change_insert AFTER INSERT ON bookings
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('bookings', NEW.booking_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS bookings_change_update AFTER UPDATE ON bookings
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('bookings', NEW.booking_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS bookings_change_delete AFTER DELETE ON bookings
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('bookings', OLD.booking_id);
+           END''',
+        # Keep the log bounded; a reader that falls further behind drops its caches wholesale
+        f'''CREATE TRIGGER IF NOT EXISTS change_log_prune AFTER INSERT ON change_log
+            BEGIN
+                DELETE FROM change_log WHERE seq <= NEW.seq - {CHANGE_LOG_RETENTION};
+            END''',
+    ]),
+    (11, 'Reservation sweeper: outcome log and indexes for its scans', [
+        '''CREATE TABLE IF NOT EXISTS reservation_sweeps (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               booking_id TEXT NOT NULL,
+               spot_number TEXT,
+               outcome TEXT NOT NULL,
+               swept_at TIMESTAMP NOT NULL
+           )''',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_status_entry
+           ON bookings (status, entry_time)''',
+        '''CREATE INDEX IF NOT EXISTS idx_slot_reservations_expiry
+           ON slot_reservations (status, reserved_until)''',
+    ]),
+    (12, 'Index overstaying bookings and their late-exit fines', [
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_status_exit
+           ON bookings (status, exit_time)''',
+        '''CREATE INDEX IF NOT EXISTS idx_fines_booking
+           ON fines (booking_id, reason)''',
+    ]),
+    (13, 'UTC epoch-second columns for booking, reservation, gate log and transaction times', [
+        # Range queries compare these instead of TIMESTAMP text, which mixes
+        # 'T' and ' ' separators and local and UTC times. The text columns
+        # stay for display.
+        *_epoch_columns('bookings', {'entry_epoch': ('entry_time', 'local'),
+                                     'exit_epoch': ('exit_time', 'local'),
+                                     'created_epoch': ('created_at', 'utc')}),
+        *_epoch_columns('slot_reservations', {'reserved_from_epoch': ('reserved_from', 'local'),
+                                              'reserved_until_epoch': ('reserved_until', 'local')}),
+        *_epoch_columns('entry_exit_logs', {'timestamp_epoch': ('timestamp', 'utc')}),
+        *_epoch_columns('transactions', {'created_epoch': ('created_at', 'utc')}),
+        # Stamping the epoch columns is not a change worth dropping cached rows for
+        'DROP TRIGGER IF EXISTS bookings_change_update',
+        '''CREATE TRIGGER bookings_change_update
+           AFTER UPDATE OF booking_id, user_id, vehicle_number, vehicle_type, entry_time, exit_time,
+                           actual_entry_time, actual_exit_time, amount, status, qr_code, created_at ON bookings
+           BEGIN
+               INSERT INTO change_log (topic, key) VALUES ('bookings', NEW.booking_id);
+           END''',
+        # The R*Tree held strftime('%s') of the local times read as UTC; rebuild it in UTC
+        'DROP TRIGGER IF EXISTS reservation_windows_insert',
+        'DROP TRIGGER IF EXISTS reservation_windows_update',
+        'DELETE FROM reservation_windows',
+        '''INSERT INTO reservation_windows (id, reserved_from, reserved_until)
+           SELECT id, reserved_from_epoch, reserved_until_epoch FROM slot_reservations
+           WHERE status = 'active' AND reserved_from_epoch <= reserved_until_epoch''',
+        f'''CREATE TRIGGER reservation_windows_insert AFTER INSERT ON slot_reservations
+            WHEN NEW.status = 'active' AND {RESERVED_FROM_EPOCH} <= {RESERVED_UNTIL_EPOCH}
+            BEGIN
+                INSERT OR REPLACE INTO reservation_windows (id, reserved_from, reserved_until)
+                VALUES (NEW.id, {RESERVED_FROM_EPOCH}, {RESERVED_UNTIL_EPOCH});
+            END''',
+        f'''CREATE TRIGGER reservation_windows_update
+            AFTER UPDATE OF status, reserved_from, reserved_until ON slot_reservations
+            BEGIN
+                DELETE FROM reservation_windows WHERE id = OLD.id;
+                INSERT INTO reservation_windows (id, reserved_from, reserved_until)
+                SELECT NEW.id, {RESERVED_FROM_EPOCH}, {RESERVED_UNTIL_EPOCH}
+                WHERE NEW.status = 'active' AND {RESERVED_FROM_EPOCH} <= {RESERVED_UNTIL_EPOCH};
+            END''',
+        # Move the time indexes over to the epoch columns
+        'DROP INDEX IF EXISTS idx_bookings_availability',
+        'DROP INDEX IF EXISTS idx_bookings_live',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_live
+           ON bookings (vehicle_type, entry_epoch, exit_epoch, booking_id)
+           WHERE status IN ('booked', 'active')''',
+        'DROP INDEX IF EXISTS idx_bookings_status_entry',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_status_entry
+           ON bookings (status, entry_epoch)''',
+        'DROP INDEX IF EXISTS idx_bookings_status_exit',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_status_exit
+           ON bookings (status, exit_epoch)''',
+        'DROP INDEX IF EXISTS idx_bookings_user_created',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_user_created
+           ON bookings (user_id, created_epoch)''',
+        'DROP INDEX IF EXISTS idx_slot_reservations_window',
+        '''CREATE INDEX IF NOT EXISTS idx_slot_reservations_window
+           ON slot_reservations (status, reserved_from_epoch, reserved_until_epoch, spot_number)''',
+        'DROP INDEX IF EXISTS idx_slot_reservations_expiry',
+        '''CREATE INDEX IF NOT EXISTS idx_slot_reservations_expiry
+           ON slot_reservations (status, reserved_until_epoch)''',
+        'DROP INDEX IF EXISTS idx_transactions_user_created',
+        '''CREATE INDEX IF NOT EXISTS idx_transactions_user_created
+           ON transactions (user_id, created_epoch)''',
+        '''CREATE INDEX IF NOT EXISTS idx_entry_exit_logs_time
+           ON entry_exit_logs (timestamp_epoch)''',
+    ]),
+    (14, 'Partial index over active bookings for the per-user active booking lookup', [
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_user_active
+           ON bookings (user_id, created_epoch)
+           WHERE status = 'active'
+        ''',
+    ]),
+    (15, 'Per-user account summary: pending fines, lifetime spend and transaction count', [
+        # Kept in step by triggers, in the same transaction as every write to
+        # fines and transactions; Database.verify_user_accounts() and
+        # rebuild_user_accounts() (user_accounts.py) check and repair it.
+        # ROUND keeps float amounts from drifting; NUMERIC affinity stores whole results as integers.
+        '''CREATE TABLE IF NOT EXISTS user_accounts (
+               user_id TEXT PRIMARY KEY,
+               pending_fines DECIMAL(10,2) NOT NULL DEFAULT 0,
+               total_spent DECIMAL(10,2) NOT NULL DEFAULT 0,
+               transaction_count INTEGER NOT NULL DEFAULT 0
+           )''',
+        'DELETE FROM user_accounts',
+        f'''INSERT INTO user_accounts (user_id, pending_fines, total_spent, transaction_count)
+            {USER_ACCOUNTS_SQL}''',
+        f'''CREATE TRIGGER IF NOT EXISTS fines_account_insert AFTER INSERT ON fines
+            WHEN NEW.status = 'pending'
+            BEGIN{_account_change('NEW.user_id', pending_fines='NEW.amount')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS fines_account_update AFTER UPDATE OF user_id, amount, status ON fines
+            WHEN OLD.status = 'pending' OR NEW.status = 'pending'
+            BEGIN{_account_change('OLD.user_id', pending_fines="-(OLD.status = 'pending') * OLD.amount")}{
+                  _account_change('NEW.user_id', pending_fines="(NEW.status = 'pending') * NEW.amount")}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS fines_account_delete AFTER DELETE ON fines
+            WHEN OLD.status = 'pending'
+            BEGIN{_account_change('OLD.user_id', pending_fines='-OLD.amount')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS transactions_account_insert AFTER INSERT ON transactions
+            BEGIN{_account_change('NEW.user_id', total_spent='NEW.total_amount', transaction_count='1')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS transactions_account_update
+            AFTER UPDATE OF user_id, total_amount ON transactions
+            BEGIN{_account_change('OLD.user_id', total_spent='-OLD.total_amount', transaction_count='-1')}{
+                  _account_change('NEW.user_id', total_spent='NEW.total_amount', transaction_count='1')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS transactions_account_delete AFTER DELETE ON transactions
+            BEGIN{_account_change('OLD.user_id', total_spent='-OLD.total_amount', transaction_count='-1')}
+            END''',
+    ]),
+    (16, 'Index gate logs for the admin log browser: by action, admin and vehicle number', [
+        # The log indexes pair a filter column with timestamp_epoch (and the
+        # implicit id), so a filtered page is a seek that reads rows already in
+        # keyset order. Zone and vehicle type filters walk idx_entry_exit_logs_time.
+        '''CREATE INDEX IF NOT EXISTS idx_entry_exit_logs_action_time
+           ON entry_exit_logs (action_type, timestamp_epoch)''',
+        '''CREATE INDEX IF NOT EXISTS idx_entry_exit_logs_admin_time
+           ON entry_exit_logs (verified_by, timestamp_epoch)''',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_vehicle_number
+           ON bookings (vehicle_number COLLATE NOCASE)''',
+    ]),
+    (17, 'Daily gate statistics rollup: scans per local day, zone, action and admin', [
+        # Kept in step by triggers as logs are written; get_gate_stats() reads
+        # one day's rows by primary key. rebuild_gate_stats() (gate_stats.py)
+        # recomputes it from the logs.
+        '''CREATE TABLE IF NOT EXISTS gate_stats_daily (
+               day TEXT NOT NULL,
+               zone TEXT NOT NULL,
+               action_type TEXT NOT NULL,
+               verified_by TEXT NOT NULL,
+               count INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (day, zone, action_type, verified_by)
+           )''',
+        'DELETE FROM gate_stats_daily',
+        f'''INSERT INTO gate_stats_daily (day, zone, action_type, verified_by, count)
+            {GATE_STATS_SQL}''',
+        f'''CREATE TRIGGER IF NOT EXISTS entry_exit_logs_stats_insert AFTER INSERT ON entry_exit_logs
+            BEGIN{_gate_stats_change('NEW', 1)}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS entry_exit_logs_stats_update
+            AFTER UPDATE OF timestamp, spot_number, action_type, verified_by ON entry_exit_logs
+            BEGIN{_gate_stats_change('OLD', -1)}{_gate_stats_change('NEW', 1)}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS entry_exit_logs_stats_delete AFTER DELETE ON entry_exit_logs
+            BEGIN{_gate_stats_change('OLD', -1)}
+            END''',
+    ]),
+    (18, 'Index transactions and bookings by creation time for date-range exports', [
+        '''CREATE INDEX IF NOT EXISTS idx_transactions_created
+           ON transactions (created_epoch)''',
+        '''CREATE INDEX IF NOT EXISTS idx_bookings_created
+           ON bookings (created_epoch)''',
+    ]),
+]
+
+# Where find_available_spot() and check_slot_availability() get reservation windows from:
+#   'memory' - per-process AvailabilityIndex/SpotIndex, reloaded when another process writes
+#   'rtree'  - range queries on the reservation_windows R*Tree for spots, and on idx_bookings_live
+#              for availability; no per-process state to rebuild, which suits several gunicorn
+#              workers writing at once
+INTERVAL_BACKENDS = ('memory', 'rtree')
+
+# How far either side of a booking the 'rtree' backend looks for neighbouring reservations
+BEST_FIT_HORIZON_SECONDS = 24 * 3600
+
+# After a migration, VACUUM when at least this share of the file is free pages
+VACUUM_FREE_FRACTION = 0.25
+
+# Gate scans: how early a booking may enter, and the outcome of Database.process_gate_event()
+GATE_ENTRY_GRACE = timedelta(minutes=15)
+GATE_ACTIONS = ('entry', 'exit')
+# fine is the late-exit fine the overstay job accrued on the booking, reported when an exit is recorded
+GateEvent = namedtuple('GateEvent', 'success message booking fine', defaults=(0,))
+
+# A user's booking history, newest first: get_user_bookings_page() returns BookingPage(bookings, before)
+# with BookingRow bookings and the (created_epoch, id) keyset cursor of the next page, None on the last
+BOOKING_PAGE_SIZE = 5
+BookingRow = namedtuple('BookingRow', 'id booking_id user_id vehicle_number vehicle_type entry_time exit_time '
+                                      'amount status created_epoch')
+BookingPage = namedtuple('BookingPage', 'bookings before')
+BOOKING_ROW_COLUMNS = ', '.join(BookingRow._fields)
+
+# get_user_account(): a user_accounts row, zeros for a user with no fines or transactions yet
+UserAccount = namedtuple('UserAccount', 'pending_fines total_spent transaction_count')
+
+# Admin log browser: get_log_page() returns LogPage(logs, before) with LOG_FIELDS dicts, newest
+# first, and the (timestamp_epoch, id) keyset cursor of the next page, None on the last
+LOG_PAGE_SIZE = 50
+LOG_FIELDS = ('id', 'booking_id', 'action_type', 'timestamp', 'verified_by', 'spot_number', 'status',
+              'vehicle_number', 'vehicle_type', 'user_name', 'admin_name', 'timestamp_epoch', 'zone')
+LogPage = namedtuple('LogPage', 'logs before')
+
+# get_gate_stats(): one day's gate scans, in total and broken down
+GateStats = namedtuple('GateStats', 'day entries exits by_zone by_admin')
+
+# Bulk exports: export_rows() streams one of EXPORTS, oldest first, fetchmany() EXPORT_BATCH_SIZE
+# rows at a time, optionally bounded to [since, until) on the epoch column. Times are exported as
+# stored (created_at and log timestamps are UTC, booking times local).
+EXPORT_BATCH_SIZE = 500
+Export = namedtuple('Export', 'columns sql epoch id')
+EXPORTS = {
+    'transactions': Export(
+        ('transaction_id', 'user_id', 'booking_id', 'transaction_type', 'parking_amount', 'fine_amount',
+         'extension_amount', 'total_amount', 'payment_method', 'transaction_status', 'description',
+         'created_at'),
+        '''SELECT transaction_id, user_id, booking_id, transaction_type, parking_amount, fine_amount,
+                  extension_amount, total_amount, payment_method, transaction_status, description,
+                  created_at
+           FROM transactions t''',
+        't.created_epoch', 't.id'),
+    'bookings': Export(
+        ('booking_id', 'user_id', 'vehicle_number', 'vehicle_type', 'entry_time', 'exit_time',
+         'actual_entry_time', 'actual_exit_time', 'amount', 'status', 'created_at'),
+        '''SELECT booking_id, user_id, vehicle_number, vehicle_type, entry_time, exit_time,
+                  actual_entry_time, actual_exit_time, amount, status, created_at
+           FROM bookings b''',
+        'b.created_epoch', 'b.id'),
+    'logs': Export(
+        ('id', 'booking_id', 'action_type', 'timestamp', 'verified_by', 'spot_number', 'status',
+         'vehicle_number', 'vehicle_type'),
+        '''SELECT eel.id, eel.booking_id, eel.action_type, eel.timestamp, eel.verified_by,
+                  eel.spot_number, eel.status, b.vehicle_number, b.vehicle_type
+           FROM entry_exit_logs eel
+           LEFT JOIN bookings b ON b.booking_id = eel.booking_id''',
+        'eel.timestamp_epoch', 'eel.id'),
+}
+
+# Keys of the verify_qr_booking() dict, in _gate_booking() column order
+GATE_BOOKING_FIELDS = ('booking_id', 'user_id', 'vehicle_number', 'vehicle_type', 'entry_time', 'exit_time',
+                       'amount', 'status', 'user_name', 'user_mobile', 'spot_number', 'zone', 'floor_level')
+
+
+def _to_datetime(value):
+    """Accept a datetime or any of the timestamp text formats stored in the database"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def to_epoch(value):
+    """UTC epoch seconds of a datetime or stored timestamp text.
+
+    Naive times are local wall-clock time, which is what the app writes
+    (datetime.now(), the booking form); this is the value the *_epoch
+    columns hold for them, see EPOCH_SQL.
+    """
+    return int(_to_datetime(value).timestamp())
+
+
+def from_epoch(seconds):
+    """Local naive datetime of UTC epoch seconds; the inverse of to_epoch()"""
+    return datetime.fromtimestamp(seconds)
+
+
+def _peak_concurrency(windows, start, end):
+    """Most (window_start, window_end, ...) windows open at once inside [start, end).
+
+    Sweeps the window boundaries clipped to [start, end); windows that do not
+    overlap the range are ignored.
+    """
+    events = []
+    for window in windows:
+        window_start, window_end = window[0], window[1]
+        if window_start < end and window_end > start:
+            events.append((max(window_start, start), 1))
+            events.append((min(window_end, end), -1))
+    # At equal times -1 sorts first: a slot freed at t can be taken at t
+    events.sort()
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        if current > peak:
+            peak = current
+    return peak
+
+
+class AvailabilityIndex:
+    """Live bookings of one vehicle type, in epoch seconds, kept sorted by start time.
+
+    peak() answers "how many of these bookings are parked at the same time,
+    at most, during [start, end)" with a sweep over the start/end boundaries
+    of the bookings overlapping the window. A booking overlapping the window
+    starts before `end` and no earlier than `start - longest booking`, so the
+    candidates are one bisected slice: O(log n + k).
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._bookings = []  # (start, end, booking_id), parallel to _starts
+        self._longest = 0
+
+    def __len__(self):
+        return len(self._bookings)
+
+    def add(self, booking_id, start, end):
+        i = bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._bookings.insert(i, (start, end, booking_id))
+        # Never shrinks on remove(); a stale upper bound only widens the slice
+        self._longest = max(self._longest, end - start)
+
+    def remove(self, booking_id, start):
+        i = bisect_left(self._starts, start)
+        while i < len(self._starts) and self._starts[i] == start:
+            if self._bookings[i][2] == booking_id:
+                del self._starts[i]
+                del self._bookings[i]
+                return True
+            i += 1
+        return False
+
+    def peak(self, start, end):
+        lo = bisect_left(self._starts, start - self._longest)
+        hi = bisect_left(self._starts, end)
+        return _peak_concurrency(self._bookings[lo:hi], start, end)
+
+
+class SpotIndex:
+    """Active reservations of every parking spot, as epoch-second interval lists sorted by start.
+
+    A spot is free for [start, end) when no reservation starting before `end`
+    runs past `start`. Keeping a running maximum of end times per spot makes
+    that one bisect, O(log n) per spot, even if an extension has made two
+    reservations of the same spot overlap.
+    """
+
+    def __init__(self):
+        self._spots = {}      # vehicle_type -> [(spot_number, zone, floor_level)] in zone/spot order
+        self._available = {}  # spot_number -> parking_spots.status == 'available'
+        self._starts = {}     # spot_number -> sorted reservation starts
+        self._max_ends = {}   # spot_number -> running max of reservation ends, parallel to _starts
+
+    def add_spot(self, spot_number, vehicle_type, zone, floor_level):
+        """Register a spot; spots must be added in zone/spot_number order"""
+        self._spots.setdefault(vehicle_type, []).append((spot_number, zone, floor_level))
+        self.set_spot(spot_number, True, ())
+
+    def set_spot(self, spot_number, available, reservations):
+        """Replace a spot's state with its current (start, end, booking_id) reservations"""
+        reservations = sorted(reservations)
+        max_ends = []
+        for _, end, _ in reservations:
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+        self._available[spot_number] = available
+        self._starts[spot_number] = [start for start, _, _ in reservations]
+        self._max_ends[spot_number] = max_ends
+
+    def gaps(self, spot_number, start, end):
+        """(seconds free before, seconds free after) around [start, end), or None if it clashes"""
+        starts = self._starts[spot_number]
+        max_ends = self._max_ends[spot_number]
+        i = bisect_left(starts, end)
+        if i and max_ends[i - 1] > start:
+            return None
+        gap_before = start - max_ends[i - 1] if i else float('inf')
+        gap_after = starts[i] - end if i < len(starts) else float('inf')
+        return gap_before, gap_after
+
+    def candidates(self, vehicle_type, start, end):
+        """Yield (spot, gap_before, gap_after) for every spot free for [start, end), in zone order"""
+        for spot in self._spots.get(vehicle_type, ()):
+            if not self._available[spot[0]]:
+                continue
+            gaps = self.gaps(spot[0], start, end)
+            if gaps is not None:
+                yield spot, gaps[0], gaps[1]
+
+
+class OccupancySnapshot:
+    """Live occupancy per slot type and zone: what get_live_parking_status() returns.
+
+    Each zone keeps a bytearray of its spots' states (AVAILABLE / OCCUPIED /
+    RESERVED bits) and the matching counts, so a spot change adjusts a few
+    counters instead of regrouping the table. Result rows are rebuilt only
+    after a count changes; reads hand out the same lists, which callers must
+    not modify.
+    """
+
+    AVAILABLE = 1
+    OCCUPIED = 2
+    RESERVED = 4  # reserved and not yet occupied
+
+    def __init__(self):
+        self._spots = {}    # spot_number -> ((slot_type, zone), position in the zone's states)
+        self._states = {}   # (slot_type, zone) -> bytearray of spot states
+        self._counts = {}   # (slot_type, zone) -> [total, available, occupied, reserved]
+        self._rows = None   # None -> [(slot_type, zone, total, available, occupied, reserved)]
+        self._rows_by_type = {}
+
+    @classmethod
+    def state(cls, status, is_occupied, is_reserved):
+        return ((cls.AVAILABLE if status == 'available' else 0)
+                | (cls.OCCUPIED if status == 'occupied' else 0)
+                | (cls.RESERVED if is_reserved and not is_occupied else 0))
+
+    def add_spot(self, spot_number, slot_type, zone, status, is_occupied, is_reserved):
+        key = (slot_type, zone)
+        states = self._states.setdefault(key, bytearray())
+        self._spots[spot_number] = (key, len(states))
+        states.append(0)
+        self._counts.setdefault(key, [0, 0, 0, 0])[0] += 1
+        self.set_spot(spot_number, status, is_occupied, is_reserved)
+
+    def set_spot(self, spot_number, status, is_occupied, is_reserved):
+        key, position = self._spots[spot_number]
+        states = self._states[key]
+        old, new = states[position], self.state(status, is_occupied, is_reserved)
+        if old == new:
+            return
+        states[position] = new
+        counts = self._counts[key]
+        for i, bit in enumerate((self.AVAILABLE, self.OCCUPIED, self.RESERVED), 1):
+            counts[i] += bool(new & bit) - bool(old & bit)
+        self._rows = None
+
+    def zone_of(self, spot_number):
+        """(slot_type, zone) the spot is counted under, or None for an unknown spot"""
+        spot = self._spots.get(spot_number)
+        return spot[0] if spot else None
+
+    def rows(self, vehicle_type=None):
+        if self._rows is None:
+            self._rows = [key + tuple(self._counts[key]) for key in sorted(self._counts)]
+            self._rows_by_type = {}
+            for row in self._rows:
+                self._rows_by_type.setdefault(row[0], []).append(row[1:])
+        if vehicle_type:
+            return self._rows_by_type.get(vehicle_type, [])
+        return self._rows
+
+
+def first_fit(candidates):
+    """Spot assignment strategy: the first free spot in zone/spot order"""
+    for spot, _, _ in candidates:
+        return spot
+    return None
+
+
+def best_fit(candidates):
+    """Spot assignment strategy: the free spot whose neighbouring reservations fit tightest.
+
+    Filling the smallest gaps first keeps long free stretches intact, so the
+    lot fragments less as it fills. A spot bounded on both sides beats one
+    bounded on one side, which beats an empty spot; ties go to zone order.
+    """
+    best, best_slack = None, None
+    for spot, gap_before, gap_after in candidates:
+        gaps = (gap_before, gap_after)
+        open_sides = gaps.count(float('inf'))
+        slack = (open_sides, sum(gap for gap in gaps if gap != float('inf')))
+        if best is None or slack < best_slack:
+            best, best_slack = spot, slack
+    return best
+
+
+# Strategies accepted by Database(spot_strategy=...); any callable with the same signature works too
+SPOT_STRATEGIES = {
+    'first_fit': first_fit,
+    'best_fit': best_fit,
+}
+
+
+# Live spot change feed, see SpotFeed
+SPOT_FEED_BACKLOG = 1024       # recent events kept for listeners that fall behind or reconnect
+SPOT_FEED_POLL_SECONDS = 1.0   # how often writes by other processes are looked for while anyone listens
+SPOT_EVENT_FIELDS = ('spot_number', 'slot_type', 'zone', 'status', 'is_occupied', 'is_reserved',
+                     'current_booking_id', 'occupied_from', 'occupied_until', 'last_updated', 'version')
+
+
+class SpotFeedGap(Exception):
+    """A listener asked to resume from a position the feed no longer has events for"""
+
+
+class SpotFeed:
+    """In-process feed of parking spot changes, shared by every listener.
+
+    Spot-changing Database methods publish the rows they touched once their
+    transaction commits. Writes by other processes (gunicorn workers) are
+    found by a watcher thread that polls the 'spot_version' counter while
+    anyone is listening, and diffs the spots against the feed's copy.
+
+    Events are numbered within this feed; a position is '<feed id>-<number>'.
+    Listeners wait on one condition variable and read the shared backlog,
+    so a change costs one wake-up per listener rather than a query each.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._id = uuid.uuid4().hex[:8]
+        self._changed = threading.Condition()
+        self._spots = None            # spot_number -> last published event; None until first used
+        self._version = None          # 'spot_version' the copy is known to be current with
+        self._checked_version = None
+        self._sequence = 0
+        self._floor = 0               # events after this sequence are all still in the backlog
+        self._backlog = deque()
+        self._listeners = 0
+        self._watcher_pid = None
+
+    @property
+    def active(self):
+        return self._spots is not None
+
+    def read_spots(self, cursor, spot_numbers=None):
+        columns = ', '.join(SPOT_EVENT_FIELDS)
+        if spot_numbers is None:
+            cursor.execute(f'SELECT {columns} FROM parking_spots')
+        else:
+            spot_numbers = list(spot_numbers)
+            cursor.execute(f'SELECT {columns} FROM parking_spots WHERE spot_number IN '
+                           f'({", ".join("?" * len(spot_numbers))})', spot_numbers)
+        return cursor.fetchall()
+
+    def _snapshot(self):
+        """(version, every spot); the version is read first, so the rows are at least that new"""
+        with self._db.connection() as conn:
+            cursor = conn.cursor()
+            version = self._db._generation(cursor, 'spot_version')
+            return version, self.read_spots(cursor)
+
+    def position(self):
+        """Current position, for a page to resume the stream from what it rendered"""
+        with self._changed:
+            if self._spots is None:
+                version, rows = self._snapshot()
+                self._spots = {row[0]: dict(zip(SPOT_EVENT_FIELDS, row)) for row in rows}
+                self._version = self._checked_version = version
+            return f'{self._id}-{self._sequence}'
+
+    def publish(self, version, rows):
+        """Record spot rows read at version; older than the feed's copy means already covered"""
+        with self._changed:
+            if self._spots is None or version < self._version:
+                return
+            self._version = version
+            changed = False
+            for row in rows:
+                event = dict(zip(SPOT_EVENT_FIELDS, row))
+                if self._spots.get(event['spot_number']) == event:
+                    continue
+                self._spots[event['spot_number']] = event
+                self._sequence += 1
+                self._backlog.append((self._sequence, event))
+                changed = True
+            while len(self._backlog) > SPOT_FEED_BACKLOG:
+                self._floor = self._backlog.popleft()[0]
+            if changed:
+                self._changed.notify_all()
+
+    def _after(self, sequence):
+        events = []
+        for entry in reversed(self._backlog):
+            if entry[0] <= sequence:
+                break
+            events.append(entry)
+        events.reverse()
+        return events
+
+    def listen(self, position, heartbeat):
+        """Yield lists of (position, event) newer than position as they are published.
+
+        Yields an empty list after heartbeat seconds without changes. Raises
+        SpotFeedGap if position is from another feed (e.g. another worker or
+        before a restart) or older than the backlog.
+        """
+        current = self.position()
+        feed_id, _, sequence = (position or current).partition('-')
+        sequence = int(sequence) if sequence.isdigit() else -1
+        if feed_id != self._id or not self._floor <= sequence <= self._sequence:
+            raise SpotFeedGap(position)
+
+        with self._changed:
+            self._listeners += 1
+            self._start_watcher()
+            self._changed.notify_all()
+        try:
+            while True:
+                with self._changed:
+                    if sequence < self._floor:
+                        raise SpotFeedGap(position)
+                    events = self._after(sequence)
+                    if not events:
+                        self._changed.wait(heartbeat)
+                        if sequence < self._floor:
+                            raise SpotFeedGap(position)
+                        events = self._after(sequence)
+                if events:
+                    sequence = events[-1][0]
+                yield [(f'{self._id}-{n}', event) for n, event in events]
+        finally:
+            with self._changed:
+                self._listeners -= 1
+
+    def _start_watcher(self):
+        # Caller holds self._changed. One watcher per process, kept for the process's lifetime.
+        if self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name='spot-feed-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            with self._changed:
+                while not self._listeners:
+                    self._changed.wait()
+            time.sleep(SPOT_FEED_POLL_SECONDS)
+            with self._db.connection() as conn:
+                version = self._db._generation(conn.cursor(), 'spot_version')
+            if version != self._checked_version:
+                version, rows = self._snapshot()
+                self._checked_version = version
+                self.publish(version, rows)
+
+
+class ChangeLog:
+    """Keeps this process's row caches coherent with writes made by any process.
+
+    Triggers append (topic, key) to change_log whenever a users or bookings
+    row is written. poll() costs one PRAGMA data_version on a connection of
+    its own while nothing has been committed: that value changes only once
+    another connection (of this process or any other) commits. Otherwise it
+    reads the entries after the last one seen and passes each topic's keys
+    to its subscribers, or None if entries were pruned before this process
+    read them, in which case subscribers drop everything.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._lock = threading.Lock()
+        self._conn = None           # (connection, pid)
+        self._data_version = None
+        self._seq = None            # last entry passed on; None until the first poll
+        self._subscribers = {}      # topic -> [callback(keys or None)]
+
+    @property
+    def seq(self):
+        """Last change_log entry passed to the subscribers"""
+        return self._seq
+
+    def subscribe(self, topic, callback):
+        self._subscribers.setdefault(topic, []).append(callback)
+
+    def poll(self):
+        """Pass entries committed since the last poll to the subscribers; returns how many"""
+        with self._lock:
+            if self._conn is None or self._conn[1] != os.getpid():
+                self._conn = (sqlite3.connect(self._db.db_path, timeout=BUSY_TIMEOUT_SECONDS,
+                                              check_same_thread=False), os.getpid())
+                self._data_version = None
+            conn = self._conn[0]
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
+            if self._seq is None:
+                # Nothing can be cached yet, so there is nothing to invalidate
+                self._seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+                return 0
+            rows = conn.execute('SELECT seq, topic, key FROM change_log WHERE seq > ? ORDER BY seq',
+                                (self._seq,)).fetchall()
+            if not rows:
+                return 0
+            # Entries are numbered under the write lock, so they commit in seq order. A rolled-back
+            # transaction or savepoint also rolls back its sqlite_sequence update, so its numbers are
+            # reused by the next commit, not skipped. AUTOINCREMENT never reuses pruned numbers, so
+            # a gap can only mean entries pruned before this process read them
+            lost = rows[0][0] != self._seq + 1
+            changed = {}
+            for _, topic, key in rows:
+                changed.setdefault(topic, set()).add(key)
+            # seq moves before subscribers hear of the change, so that a row loaded
+            # before it is either dropped by them or not kept (see RowCache.get)
+            self._seq = rows[-1][0]
+            for topic, callbacks in self._subscribers.items():
+                if lost or topic in changed:
+                    for callback in callbacks:
+                        callback(None if lost else changed[topic])
+            return len(rows)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn[0].close()
+            self._conn = None
+            self._data_version = None
+
+
+class RowCache:
+    """Rows of one change_log topic by key, least recently used first out.
+
+    get() polls the change log before looking, so a hit is as fresh as a
+    read would be at that moment. A row loaded while change_log entries
+    were being passed on is returned but not kept.
+    """
+
+    def __init__(self, changes, topic, maxsize=ROW_CACHE_SIZE):
+        self._changes = changes
+        self._maxsize = maxsize
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        changes.subscribe(topic, self.invalidate)
+
+    def get(self, key, load):
+        self._changes.poll()
+        with self._lock:
+            if key in self._rows:
+                self._rows.move_to_end(key)
+                self.hits += 1
+                return self._rows[key]
+            self.misses += 1
+        seq = self._changes.seq
+        row = load(key)
+        with self._lock:
+            if seq is not None and self._changes.seq == seq:
+                self._rows[key] = row
+                if len(self._rows) > self._maxsize:
+                    self._rows.popitem(last=False)
+        return row
+
+    def invalidate(self, keys):
+        with self._lock:
+            if keys is None:
+                self._rows.clear()
+            else:
+                for key in keys:
+                    self._rows.pop(key, None)
+
+
+# Group commit, see GroupCommitWriter
+GROUP_COMMIT_MAX_BATCH = 64
+GROUP_COMMIT_MAX_DELAY_SECONDS = 0.002
+
+
+class GroupCommitWriter:
+    """Runs queued Database writes on one thread, many to a transaction.
+
+    submit(db.process_gate_event, ...) queues the call and returns a
+    concurrent.futures.Future. The writer thread opens a transaction for
+    the first call waiting and runs each call in a SAVEPOINT of its own,
+    taking more until max_batch calls have run or max_delay seconds have
+    passed; then it commits once and resolves the futures. A call that
+    raises is rolled back to its savepoint and its future gets the
+    exception, while the rest of the batch commits. Futures resolve only
+    after the commit, so a caller sees a durable write, as with a direct call.
+    """
+
+    def __init__(self, db, max_batch=GROUP_COMMIT_MAX_BATCH, max_delay=GROUP_COMMIT_MAX_DELAY_SECONDS):
+        self._db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.calls = 0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._pid = None              # process the writer thread runs in
+
+    def submit(self, method, *args, **kwargs):
+        """Queue method(*args, **kwargs); returns a Future for its result"""
+        if self._pid != os.getpid():
+            with self._lock:
+                # One writer thread per process; a forked worker starts its own
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name='group-commit-writer', daemon=True).start()
+                    self._pid = os.getpid()
+        future = Future()
+        self._queue.put((future, method, args, kwargs))
+        return future
+
+    def close(self):
+        """Finish the calls queued so far and stop the writer thread"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            stopped = Future()
+            self._queue.put((stopped, None, (), {}))
+            stopped.result()
+            self._pid = None
+
+    def _run(self):
+        while True:
+            call = self._queue.get()
+            if call[1] is None:
+                call[0].set_result(None)
+                return
+            self._run_batch(call)
+
+    def _run_batch(self, first):
+        taken = [first]
+        results = []
+        try:
+            with self._db.transaction() as conn:
+                deadline = time.monotonic() + self.max_delay
+                while True:
+                    future, method, args, kwargs = taken[-1]
+                    if future.set_running_or_notify_cancel():
+                        results.append((future,) + self._call(conn, method, args, kwargs))
+                    if len(taken) >= self.max_batch:
+                        break
+                    try:
+                        call = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if call[1] is None:
+                        # close(): commit this batch first
+                        self._queue.put(call)
+                        break
+                    taken.append(call)
+        except Exception as exc:
+            # BEGIN or COMMIT failed: nothing in the batch was written
+            for future, _, _, _ in taken:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            self.batches += 1
+            self.calls += len(taken)
+        for future, succeeded, value in results:
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _call(self, conn, method, args, kwargs):
+        """(True, result) or (False, exception) of one call, run in a savepoint"""
+        local = self._db._local
+        commit_hooks = len(local.commit_hooks)
+        conn.execute('SAVEPOINT group_commit_call')
+        try:
+            result = method(*args, **kwargs)
+        except Exception as exc:
+            conn.execute('ROLLBACK TO group_commit_call')
+            conn.execute('RELEASE group_commit_call')
+            # Forget what the call meant to publish or apply in memory
+            del local.commit_hooks[commit_hooks:]
+            return False, exc
+        conn.execute('RELEASE group_commit_call')
+        return True, result
+
+
+# Reservation sweeper, see Database.sweep_reservations
+NO_SHOW_WINDOW = timedelta(minutes=60)      # a booking not entered this long after its entry time is a no-show
+RESERVATION_GRACE = timedelta(minutes=15)   # an unused reservation is released this long after it ends
+SWEEP_BATCH_SIZE = 200                      # bookings and reservations per sweep transaction
+SWEEP_INTERVAL_SECONDS = 60
+
+# Overstay fines, see Database.accrue_overstay_fines
+LATE_EXIT_REASON = 'Late exit'
+OVERSTAY_INTERVAL_SECONDS = 60
+
+
+class PeriodicJob:
+    """Calls job() every interval seconds on a daemon thread; an interval of 0 turns it off.
+
+    start() is cheap to call repeatedly (e.g. before every request): it
+    starts the thread once per process, so forked workers get their own.
+    """
+
+    def __init__(self, name, interval, job):
+        self.name = name
+        self.interval = interval
+        self.job = job
+        self.last_result = None
+        self._pid = None
+        self._stop = None             # Event ending the running thread
+
+    def start(self):
+        if self.interval <= 0 or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), name=self.name, daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        self._pid = None
+
+    def _run(self, stop):
+        while not stop.wait(self.interval):
+            try:
+                self.last_result = self.job()
+            except Exception:
+                logging.getLogger(__name__).exception('%s failed', self.name)
+
+
+# Opt-in slow-query log, see SlowQueryLog
+SLOW_QUERY_MS = 50
+SLOW_QUERY_LOG_BYTES = 5 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+
+
+def _param_shape(parameters):
+    """Types of bound parameters, without their values"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+class SlowQueryLog:
+    """Statements slower than threshold_ms, appended to a rotating JSONL file.
+
+    A statement's time runs from execute() to the end of its fetch. Each
+    line records the SQL, its parameter types, the time and rows fetched,
+    the caller (whatever source() returns, e.g. the current route) and the
+    EXPLAIN QUERY PLAN output. Pass it to Database(slow_query_log=...).
+    A threshold of 0 logs every statement.
+    """
+
+    def __init__(self, path, threshold_ms=SLOW_QUERY_MS, source=None,
+                 max_bytes=SLOW_QUERY_LOG_BYTES, backups=SLOW_QUERY_LOG_BACKUPS):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.source = source
+        self.backups = backups
+        self._handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                             delay=True)
+
+    def record(self, conn, sql, parameters, ms, rows):
+        try:
+            # The base class method, so that EXPLAIN is not traced itself
+            plan = [row[3] for row in sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters)]
+        except sqlite3.Error:
+            plan = None
+        entry = {
+            'at': datetime.now().isoformat(timespec='milliseconds'),
+            'ms': round(ms, 3),
+            'sql': ' '.join(sql.split()),
+            'params': _param_shape(parameters),
+            'rows': rows,
+            'source': self.source() if self.source else None,
+            'plan': plan,
+        }
+        self._handler.handle(logging.makeLogRecord({'msg': json.dumps(entry)}))
+
+    def summary(self):
+        """Logged statements (rotated files included), largest total time first"""
+        statements = {}
+        paths = [f'{self.path}.{n}' for n in range(self.backups, 0, -1)] + [self.path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    stats = statements.get(entry['sql'])
+                    if stats is None:
+                        stats = statements[entry['sql']] = {
+                            'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sources': set()
+                        }
+                    stats['count'] += 1
+                    stats['total_ms'] += entry['ms']
+                    stats['max_ms'] = max(stats['max_ms'], entry['ms'])
+                    if entry['source']:
+                        stats['sources'].add(entry['source'])
+                    # The latest occurrence wins
+                    stats.update(params=entry['params'], plan=entry['plan'], rows=entry['rows'], last_at=entry['at'])
+
+        for stats in statements.values():
+            stats['mean_ms'] = stats['total_ms'] / stats['count']
+            stats['sources'] = sorted(stats['sources'])
+        return sorted(statements.values(), key=lambda stats: stats['total_ms'], reverse=True)
+
+    def close(self):
+        self._handler.close()
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Times each statement through its fetch and reports slow ones to the connection's SlowQueryLog"""
+
+    _pending = None  # [sql, parameters, seconds, rows] of a statement whose rows are still to be fetched
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        return self._timed(super().executemany, sql, seq_of_parameters,
+                           seq_of_parameters[0] if seq_of_parameters else ())
+
+    def _timed(self, run, sql, parameters, sample):
+        self._finish()
+        started = time.perf_counter()
+        run(sql, parameters)
+        self._pending = [sql, sample, time.perf_counter() - started, 0]
+        if self.description is None:  # nothing to fetch
+            self._finish()
+        return self
+
+    def fetchone(self):
+        return self._fetched(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetched(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetched(super().fetchall)
+
+    def _fetched(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending:
+            self._pending[2] += time.perf_counter() - started
+            self._pending[3] += len(result) if isinstance(result, list) else int(result is not None)
+            self._finish()
+        return result
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # e.g. conn.execute('PRAGMA ...') whose result is never fetched
+        try:
+            self._finish()
+        except sqlite3.Error:
+            pass
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            sql, parameters, seconds, rows = pending
+            log = self.connection.slow_query_log
+            if seconds * 1000 >= log.threshold_ms:
+                log.record(self.connection, sql, parameters, seconds * 1000, rows)
+
+
+class TracingConnection(sqlite3.Connection):
+    """Connection whose statements all run on TracingCursors"""
+
+    slow_query_log = None
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute() would bypass TracingCursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ThreadConnection:
+    """A thread's pooled connection, held in the Database's threading.local.
+
+    When the thread ends its locals are released and the connection is
+    closed and dropped from the pool, so a server that starts a thread per
+    request (the threaded Werkzeug server behind python app.py) does not
+    accumulate connections and file descriptors.
+    """
+
+    def __init__(self, conn, pool, pool_lock):
+        self.conn = conn
+        self.pid = os.getpid()
+        self._pool = pool
+        self._pool_lock = pool_lock
+
+    def __del__(self):
+        with self._pool_lock:
+            if self.conn not in self._pool:  # already closed by Database.close()
+                return
+            self._pool.discard(self.conn)
+        # Leave a connection inherited across fork() to the process that opened it
+        if self.pid == os.getpid():
+            self.conn.close()
+
+
 class Database:
-    def __init__(self, db_path='parking.db'):
+    def __init__(self, db_path='parking.db', pooled=True, spot_strategy='first_fit', interval_backend='memory',
+                 slow_query_log=None):
+        if interval_backend not in INTERVAL_BACKENDS:
+            raise ValueError(f'Unknown interval backend: {interval_backend}')
+        if isinstance(spot_strategy, str) and spot_strategy not in SPOT_STRATEGIES:
+            raise ValueError(f'Unknown spot strategy: {spot_strategy}')
         self.db_path = db_path
+        self.pooled = pooled
+        self.slow_query_log = slow_query_log
+        self.interval_backend = interval_backend
+        self.connections_opened = 0
+        self.commits = 0
+        self._local = threading.local()
+        # Open pooled connections; each belongs to one live thread (see ThreadConnection)
+        self._pool = set()
+        # Reentrant: a ThreadConnection may be collected while this thread holds it
+        self._pool_lock = threading.RLock()
+        # Held by this process's outermost transaction() from BEGIN IMMEDIATE to commit
+        self._write_lock = threading.Lock()
+        # In-memory availability index: vehicle_type -> AvailabilityIndex, loaded on first use
+        # and reloaded whenever cache_generations shows a write it has not seen
+        self._availability = None
+        self._availability_generation = None
+        self._availability_lock = threading.RLock()
+        # In-memory spot index (SpotIndex), kept current the same way via the 'spots' generation
+        self._spot_index = None
+        self._spot_index_generation = None
+        self._spot_index_lock = threading.RLock()
+        self.spot_strategy = SPOT_STRATEGIES.get(spot_strategy, spot_strategy)
+        # Live spot changes for /api/live_status/stream, published after commit by _spot_changes()
+        self.spot_feed = SpotFeed(self)
+        # Occupancy per slot type and zone (OccupancySnapshot), updated after commit by
+        # _spot_changes() and caught up with other processes' writes by _refresh_occupancy()
+        self._occupancy = None
+        self._occupancy_version = None
+        self._occupancy_conn = None
+        self._occupancy_data_version = None
+        self._occupancy_lock = threading.Lock()
+        # Users and bookings by ID, kept coherent across processes through change_log
+        self.changes = ChangeLog(self)
+        self._users = RowCache(self.changes, 'users')
+        self._bookings = RowCache(self.changes, 'bookings')
         self.init_database()
-    
+
     def get_connection(self):
-        return sqlite3.connect(self.db_path)
-    
+        """Open a new, unpooled connection. The caller is responsible for closing it."""
+        with self._pool_lock:
+            self.connections_opened += 1
+        return self._connect()
+
+    def _connect(self, **kwargs):
+        if self.slow_query_log is None:
+            return sqlite3.connect(self.db_path, **kwargs)
+        conn = sqlite3.connect(self.db_path, factory=TracingConnection, **kwargs)
+        conn.slow_query_log = self.slow_query_log
+        return conn
+
+    def _open_pooled_connection(self):
+        conn = self._connect(timeout=BUSY_TIMEOUT_SECONDS,
+                             cached_statements=STATEMENT_CACHE_SIZE,
+                             check_same_thread=False)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{PAGE_CACHE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE_BYTES}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        with self._pool_lock:
+            self.connections_opened += 1
+            self._pool.add(conn)
+        return conn
+
+    def _thread_connection(self):
+        """Return the long-lived connection owned by the current thread/worker"""
+        owned = getattr(self._local, 'conn', None)
+        # A forked worker (gunicorn) must not reuse a connection inherited from its parent
+        if owned is None or owned.pid != os.getpid():
+            owned = ThreadConnection(self._open_pooled_connection(), self._pool, self._pool_lock)
+            self._local.conn = owned
+        return owned.conn
+
+    @contextmanager
+    def connection(self):
+        """Hand out a connection for a unit of work.
+
+        Pooled connections stay open for the lifetime of the thread. Nested
+        blocks share the same connection and only the outermost block commits
+        (or rolls back on error).
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            conn = self._local.active
+        elif self.pooled:
+            conn = self._thread_connection()
+        else:
+            conn = self.get_connection()
+
+        if depth == 0:
+            self._local.active = conn
+            self._local.commit_hooks = []
+        self._local.depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            if depth == 0 and conn.in_transaction:
+                conn.rollback()
+            raise
+        else:
+            if depth == 0 and conn.in_transaction:
+                conn.commit()
+                self.commits += 1
+                self._local.commits = getattr(self._local, 'commits', 0) + 1
+            if depth == 0:
+                for hook in self._local.commit_hooks:
+                    hook()
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                self._local.active = None
+                self._local.commit_hooks = []
+                if not self.pooled:
+                    conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Like connection(), but takes the database write lock up front (BEGIN IMMEDIATE).
+
+        Use this for read-then-write units of work so that no other writer can
+        change what was read before the commit.
+
+        Threads of this process queue for the write lock on a mutex first. On
+        its own, SQLite's busy handler makes waiters sleep and poll in steps of
+        up to 100 ms, and that polling dominates tail latency under load.
+        """
+        if getattr(self._local, 'depth', 0):
+            with self.connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute('BEGIN IMMEDIATE')
+                yield conn
+            return
+
+        with self._write_lock, self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+
+    @property
+    def thread_commits(self):
+        """Commits made so far by the calling thread (self.commits counts every thread)"""
+        return getattr(self._local, 'commits', 0)
+
+    def _cached(self, cache, key, load):
+        # Inside a unit of work the thread may have written the row without committing yet
+        if getattr(self._local, 'depth', 0):
+            return load(key)
+        return cache.get(key, load)
+
+    def _on_commit(self, hook):
+        """Register a callable to run once the current unit of work has committed (it must not raise)"""
+        self._local.commit_hooks.append(hook)
+
+    def close(self):
+        """Close every pooled connection (e.g. on worker shutdown)"""
+        with self._occupancy_lock:
+            if self._occupancy_conn is not None:
+                self._occupancy_conn[0].close()
+            self._occupancy = self._occupancy_conn = None
+        self.changes.close()
+        with self._pool_lock:
+            pool = list(self._pool)
+            self._pool.clear()
+        for conn in pool:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
+
     def init_database(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                mobile TEXT NOT NULL,
-                address TEXT NOT NULL,
-                department TEXT NOT NULL,
-                university_id TEXT NOT NULL,
-                email TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Vehicles table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vehicles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                vehicle_number TEXT NOT NULL,
-                vehicle_type TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Bookings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bookings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                booking_id TEXT UNIQUE NOT NULL,
-                user_id TEXT NOT NULL,
-                vehicle_number TEXT NOT NULL,
-                vehicle_type TEXT NOT NULL,
-                entry_time TIMESTAMP NOT NULL,
-                exit_time TIMESTAMP NOT NULL,
-                actual_entry_time TIMESTAMP,
-                actual_exit_time TIMESTAMP,
-                amount DECIMAL(10,2) NOT NULL,
-                status TEXT DEFAULT 'booked',
-                qr_code TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Fines table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fines (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                booking_id TEXT NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                reason TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                FOREIGN KEY (booking_id) REFERENCES bookings (booking_id)
-            )
-        ''')
-        
-        # Admins table for security personnel
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS admins (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                admin_id TEXT UNIQUE NOT NULL,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                name TEXT NOT NULL,
-                role TEXT DEFAULT 'security',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Entry/Exit logs table for tracking vehicle movements
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS entry_exit_logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                booking_id TEXT NOT NULL,
-                action_type TEXT NOT NULL,  -- 'entry' or 'exit'
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                verified_by TEXT,  -- admin who verified
-                spot_number TEXT,
-                status TEXT DEFAULT 'verified',
-                FOREIGN KEY (booking_id) REFERENCES bookings (booking_id),
-                FOREIGN KEY (verified_by) REFERENCES admins (admin_id)
-            )
-        ''')
-        
-        # Parking slots table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parking_slots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                slot_type TEXT NOT NULL,
-                total_slots INTEGER NOT NULL,
-                occupied_slots INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Individual parking spots table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parking_spots (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                spot_number TEXT UNIQUE NOT NULL,
-                slot_type TEXT NOT NULL,
-                zone TEXT NOT NULL,
-                floor_level INTEGER DEFAULT 1,
-                is_occupied BOOLEAN DEFAULT 0,
-                is_reserved BOOLEAN DEFAULT 0,
-                current_booking_id TEXT,
-                occupied_from TIMESTAMP,
-                occupied_until TIMESTAMP,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'available',
-                FOREIGN KEY (current_booking_id) REFERENCES bookings (booking_id)
-            )
-        ''')
-        
-        # Slot reservations table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS slot_reservations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                booking_id TEXT NOT NULL,
-                spot_number TEXT NOT NULL,
-                reserved_from TIMESTAMP NOT NULL,
-                reserved_until TIMESTAMP NOT NULL,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (booking_id) REFERENCES bookings (booking_id),
-                FOREIGN KEY (spot_number) REFERENCES parking_spots (spot_number)
-            )
-        ''')
-        
-        # Transactions table
+        # BEGIN IMMEDIATE so that workers starting together migrate one at a time
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT UNIQUE NOT NULL,
+                    name TEXT NOT NULL,
+                    mobile TEXT NOT NULL,
+                    address TEXT NOT NULL,
+                    department TEXT NOT NULL,
+                    university_id TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Vehicles table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS vehicles (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    vehicle_number TEXT NOT NULL,
+                    vehicle_type TEXT NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            
+            # Bookings table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS bookings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    booking_id TEXT UNIQUE NOT NULL,
+                    user_id TEXT NOT NULL,
+                    vehicle_number TEXT NOT NULL,
+                    vehicle_type TEXT NOT NULL,
+                    entry_time TIMESTAMP NOT NULL,
+                    exit_time TIMESTAMP NOT NULL,
+                    actual_entry_time TIMESTAMP,
+                    actual_exit_time TIMESTAMP,
+                    amount DECIMAL(10,2) NOT NULL,
+                    status TEXT DEFAULT 'booked',
+                    qr_code TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+            
+            # Fines table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fines (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    booking_id TEXT NOT NULL,
+                    amount DECIMAL(10,2) NOT NULL,
+                    reason TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id),
+                    FOREIGN KEY (booking_id) REFERENCES bookings (booking_id)
+                )
+            ''')
+            
+            # Admins table for security personnel
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS admins (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    admin_id TEXT UNIQUE NOT NULL,
+                    username TEXT UNIQUE NOT NULL,
+                    password TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    role TEXT DEFAULT 'security',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Entry/Exit logs table for tracking vehicle movements
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS entry_exit_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    booking_id TEXT NOT NULL,
+                    action_type TEXT NOT NULL,  -- 'entry' or 'exit'
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    verified_by TEXT,  -- admin who verified
+                    spot_number TEXT,
+                    status TEXT DEFAULT 'verified',
+                    FOREIGN KEY (booking_id) REFERENCES bookings (booking_id),
+                    FOREIGN KEY (verified_by) REFERENCES admins (admin_id)
+                )
+            ''')
+            
+            # Parking slots table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS parking_slots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    slot_type TEXT NOT NULL,
+                    total_slots INTEGER NOT NULL,
+                    occupied_slots INTEGER DEFAULT 0
+                )
+            ''')
+            
+            # Individual parking spots table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS parking_spots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    spot_number TEXT UNIQUE NOT NULL,
+                    slot_type TEXT NOT NULL,
+                    zone TEXT NOT NULL,
+                    floor_level INTEGER DEFAULT 1,
+                    is_occupied BOOLEAN DEFAULT 0,
+                    is_reserved BOOLEAN DEFAULT 0,
+                    current_booking_id TEXT,
+                    occupied_from TIMESTAMP,
+                    occupied_until TIMESTAMP,
+                    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    status TEXT DEFAULT 'available',
+                    FOREIGN KEY (current_booking_id) REFERENCES bookings (booking_id)
+                )
+            ''')
+            
+            # Slot reservations table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS slot_reservations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    booking_id TEXT NOT NULL,
+                    spot_number TEXT NOT NULL,
+                    reserved_from TIMESTAMP NOT NULL,
+                    reserved_until TIMESTAMP NOT NULL,
+                    status TEXT DEFAULT 'active',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (booking_id) REFERENCES bookings (booking_id),
+                    FOREIGN KEY (spot_number) REFERENCES parking_spots (spot_number)
+                )
+            ''')
+            
+            # Transactions table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS transactions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    transaction_id TEXT UNIQUE NOT NULL,
+                    user_id TEXT NOT NULL,
+                    booking_id TEXT,
+                    transaction_type TEXT NOT NULL,
+                    parking_amount DECIMAL(10,2) DEFAULT 0,
+                    fine_amount DECIMAL(10,2) DEFAULT 0,
+                    extension_amount DECIMAL(10,2) DEFAULT 0,
+                    total_amount DECIMAL(10,2) NOT NULL,
+                    payment_method TEXT DEFAULT 'cash',
+                    transaction_status TEXT DEFAULT 'completed',
+                    description TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id),
+                    FOREIGN KEY (booking_id) REFERENCES bookings (booking_id)
+                )
+            ''')
+            
+            # Initialize parking slots if empty
+            cursor.execute('SELECT COUNT(*) FROM parking_slots')
+            if cursor.fetchone()[0] == 0:
+                cursor.execute('INSERT INTO parking_slots (slot_type, total_slots) VALUES (?, ?)', ('bike', 20))
+                cursor.execute('INSERT INTO parking_slots (slot_type, total_slots) VALUES (?, ?)', ('car', 20))
+            
+            # Initialize individual parking spots if empty
+            cursor.execute('SELECT COUNT(*) FROM parking_spots')
+            if cursor.fetchone()[0] == 0:
+                self._initialize_parking_spots(cursor)
+            
+            # Initialize default admin (independent of parking slots)
+            self._initialize_default_admin(cursor)
+            
+            # Bring the schema up to date
+            applied = self._apply_migrations(cursor)
+
+        if applied:
+            self._reclaim_free_pages()
+    
+    def _apply_migrations(self, cursor):
+        """Apply every migration newer than the recorded schema version, in order;
+        returns the versions applied"""
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transaction_id TEXT UNIQUE NOT NULL,
-                user_id TEXT NOT NULL,
-                booking_id TEXT,
-                transaction_type TEXT NOT NULL,
-                parking_amount DECIMAL(10,2) DEFAULT 0,
-                fine_amount DECIMAL(10,2) DEFAULT 0,
-                extension_amount DECIMAL(10,2) DEFAULT 0,
-                total_amount DECIMAL(10,2) NOT NULL,
-                payment_method TEXT DEFAULT 'cash',
-                transaction_status TEXT DEFAULT 'completed',
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                FOREIGN KEY (booking_id) REFERENCES bookings (booking_id)
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
-        # Initialize parking slots if empty
-        cursor.execute('SELECT COUNT(*) FROM parking_slots')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('INSERT INTO parking_slots (slot_type, total_slots) VALUES (?, ?)', ('bike', 20))
-            cursor.execute('INSERT INTO parking_slots (slot_type, total_slots) VALUES (?, ?)', ('car', 20))
-        
-        # Initialize individual parking spots if empty
-        cursor.execute('SELECT COUNT(*) FROM parking_spots')
-        if cursor.fetchone()[0] == 0:
-            self._initialize_parking_spots(cursor)
-        
-        # Initialize default admin (independent of parking slots)
-        self._initialize_default_admin(cursor)
-        
-        conn.commit()
-        conn.close()
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        current_version = cursor.fetchone()[0]
+        
+        applied = []
+        for version, description, steps in MIGRATIONS:
+            if version <= current_version:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                           (version, description))
+            applied.append(version)
+        return applied
+
+    def _reclaim_free_pages(self):
+        """VACUUM if migrations left a large share of the file as free pages"""
+        with self.connection() as conn:
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if page_count and free_pages >= page_count * VACUUM_FREE_FRACTION:
+                # VACUUM cannot run inside a transaction
+                conn.execute('VACUUM')
+                # In WAL mode the file only shrinks once the rewritten pages are checkpointed
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    
+    def get_schema_version(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+            return cursor.fetchone()[0]
     
     def _initialize_parking_spots(self, cursor):
         # Initialize bike spots (20 total - 2 zones with 10 spots each)
@@ -226,571 +1868,1310 @@ class Database:
             ''', (security_id, 'security', 'security123', 'Security Personnel', 'security'))
     
     def create_user(self, user_data):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Generate unique user ID
-        import uuid
-        user_id = str(uuid.uuid4())[:8].upper()
-        
-        cursor.execute('''
-            INSERT INTO users (user_id, name, mobile, address, department, university_id, email)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, user_data['name'], user_data['mobile'], user_data['address'],
-              user_data['department'], user_data['university_id'], user_data['email']))
-        
-        conn.commit()
-        conn.close()
-        return user_id
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Generate unique user ID
+            import uuid
+            user_id = str(uuid.uuid4())[:8].upper()
+            
+            cursor.execute('''
+                INSERT INTO users (user_id, name, mobile, address, department, university_id, email)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, user_data['name'], user_data['mobile'], user_data['address'],
+                  user_data['department'], user_data['university_id'], user_data['email']))
+            
+            return user_id
     
     def get_user_by_id(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        return user
+        return self._cached(self._users, user_id, self._load_user)
+
+    def _load_user(self, user_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            user = cursor.fetchone()
+            return user
     
     def check_slot_availability(self, vehicle_type, entry_time, exit_time):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Get total slots for vehicle type
-        cursor.execute('SELECT total_slots FROM parking_slots WHERE slot_type = ?', (vehicle_type,))
-        total_slots = cursor.fetchone()[0]
-        
-        # Check overlapping bookings
+        """Slots free for the whole of [entry_time, exit_time).
+
+        Bookings that never overlap each other share a slot, so this is the
+        total minus the peak number of bookings parked at once in the window.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # Get total slots for vehicle type
+            cursor.execute('SELECT total_slots FROM parking_slots WHERE slot_type = ?', (vehicle_type,))
+            total_slots = cursor.fetchone()[0]
+
+            # Peak concurrent bookings inside the window
+            start, end = to_epoch(entry_time), to_epoch(exit_time)
+            occupied = None
+            if self.interval_backend == 'memory':
+                with self._availability_lock:
+                    if self._refresh_availability(cursor):
+                        index = self._availability.get(vehicle_type)
+                        occupied = index.peak(start, end) if index else 0
+            if occupied is None:
+                # Live bookings, the rows the memory backend's AvailabilityIndex holds, so both
+                # backends agree even while a cancelled booking's reservation awaits the sweeper
+                cursor.execute('''
+                    SELECT entry_epoch, exit_epoch FROM bookings
+                    WHERE vehicle_type = ? AND status IN ('booked', 'active')
+                      AND entry_epoch < ? AND exit_epoch > ?
+                ''', (vehicle_type, end, start))
+                occupied = _peak_concurrency(cursor.fetchall(), start, end)
+
+            available = total_slots - occupied
+
+            return available
+
+    def _generation(self, cursor, name):
+        """Current value of a trigger-maintained cache_generations counter"""
+        cursor.execute('SELECT generation FROM cache_generations WHERE name = ?', (name,))
+        return cursor.fetchone()[0]
+
+    def _refresh_availability(self, cursor):
+        """(Re)load the availability index if any process has written live bookings since it was built.
+
+        Returns False if the index is stale and cursor is inside a transaction:
+        that transaction's own writes must not reach the shared index before
+        they commit, so the caller reads the table instead.
+        """
+        generation = self._generation(cursor, 'bookings')
+        if self._availability is not None and generation == self._availability_generation:
+            return True
+        if cursor.connection.in_transaction:
+            return False
+
+        while True:
+            cursor.execute('''
+                SELECT booking_id, vehicle_type, entry_epoch, exit_epoch FROM bookings
+                WHERE status IN ('booked', 'active')
+            ''')
+            rows = cursor.fetchall()
+            # Outside a transaction each SELECT sees its own snapshot; retry until stable
+            loaded_generation = self._generation(cursor, 'bookings')
+            if loaded_generation == generation:
+                break
+            generation = loaded_generation
+
+        availability = {}
+        for booking_id, vehicle_type, entry_epoch, exit_epoch in rows:
+            availability.setdefault(vehicle_type, AvailabilityIndex()).add(booking_id, entry_epoch, exit_epoch)
+        self._availability = availability
+        self._availability_generation = generation
+        return True
+
+    def _invalidate_availability(self):
+        with self._availability_lock:
+            self._availability = None
+
+    def _live_window(self, cursor, booking_id):
+        """(vehicle_type, entry_epoch, exit_epoch) of a booking that holds a slot, else None"""
         cursor.execute('''
-            SELECT COUNT(*) FROM bookings 
-            WHERE vehicle_type = ? AND status IN ('booked', 'active')
-            AND ((entry_time <= ? AND exit_time > ?) OR 
-                 (entry_time < ? AND exit_time >= ?) OR
-                 (entry_time >= ? AND exit_time <= ?))
-        ''', (vehicle_type, entry_time, entry_time, exit_time, exit_time, entry_time, exit_time))
-        
-        occupied = cursor.fetchone()[0]
-        available = total_slots - occupied
-        
-        conn.close()
-        return available
-    
+            SELECT vehicle_type, entry_epoch, exit_epoch FROM bookings
+            WHERE booking_id = ? AND status IN ('booked', 'active')
+        ''', (booking_id,))
+        return cursor.fetchone()
+
+    def _track_booking(self, cursor, booking_id, old, new):
+        """Mirror a write to a booking into the availability index once it commits.
+
+        old/new are the booking's _live_window() before and after the write.
+        When they differ, the bookings_live_* triggers have bumped the
+        generation exactly once for this write, so the change applies to an
+        index built at the generation before it. An index at any other
+        generation is left for _refresh_availability() to reload.
+        """
+        if old == new or self._availability is None:
+            return
+        generation = self._generation(cursor, 'bookings')
+        self._on_commit(lambda: self._booking_committed(booking_id, old, new, generation))
+
+    def _booking_committed(self, booking_id, old, new, generation):
+        """After a booking write commits: move it in the availability index"""
+        with self._availability_lock:
+            if self._availability is None or self._availability_generation != generation - 1:
+                return
+            if old:
+                self._availability[old[0]].remove(booking_id, old[1])
+            if new:
+                self._availability.setdefault(new[0], AvailabilityIndex()).add(booking_id, new[1], new[2])
+            self._availability_generation = generation
+
     def create_booking(self, booking_data):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO bookings (booking_id, user_id, vehicle_number, vehicle_type, 
-                                entry_time, exit_time, amount, qr_code)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (booking_data['booking_id'], booking_data['user_id'], booking_data['vehicle_number'],
-              booking_data['vehicle_type'], booking_data['entry_time'],
-              booking_data['exit_time'], booking_data['amount'], booking_data['qr_code']))
-        
-        conn.commit()
-        conn.close()
-        return booking_data['booking_id']
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                INSERT INTO bookings (booking_id, user_id, vehicle_number, vehicle_type,
+                                    entry_time, exit_time, amount, qr_code)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (booking_data['booking_id'], booking_data['user_id'], booking_data['vehicle_number'],
+                  booking_data['vehicle_type'], booking_data['entry_time'],
+                  booking_data['exit_time'], booking_data['amount'], booking_data.get('qr_code')))
+
+            booking_id = booking_data['booking_id']
+            self._track_booking(cursor, booking_id, None, self._live_window(cursor, booking_id))
+
+            return booking_id
     
     def get_booking_by_id(self, booking_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM bookings WHERE booking_id = ?', (booking_id,))
-        booking = cursor.fetchone()
-        conn.close()
-        return booking
+        return self._cached(self._bookings, booking_id, self._load_booking)
+
+    def _load_booking(self, booking_id):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM bookings WHERE booking_id = ?', (booking_id,))
+            booking = cursor.fetchone()
+            return booking
     
+    def get_qr_booking(self, booking_id):
+        """(booking_id, user_id, vehicle_type, vehicle_number, entry_time, exit_time, spot_number)
+        for a booking's QR code; spot_number is that of its latest reservation"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT b.booking_id, b.user_id, b.vehicle_type, b.vehicle_number, b.entry_time, b.exit_time,
+                       (SELECT sr.spot_number FROM slot_reservations sr
+                        WHERE sr.booking_id = b.booking_id ORDER BY sr.id DESC LIMIT 1)
+                FROM bookings b WHERE b.booking_id = ?
+            ''', (booking_id,))
+            return cursor.fetchone()
+
     def get_user_bookings(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM bookings WHERE user_id = ? 
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        bookings = cursor.fetchall()
-        conn.close()
-        return bookings
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM bookings WHERE user_id = ? 
+                ORDER BY created_epoch DESC
+            ''', (user_id,))
+            bookings = cursor.fetchall()
+            return bookings
     
+    def get_active_booking(self, user_id):
+        """A user's active booking (the car is parked) as a BookingRow, else None"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {BOOKING_ROW_COLUMNS} FROM bookings
+                WHERE user_id = ? AND status = 'active'
+                ORDER BY created_epoch DESC LIMIT 1
+            ''', (user_id,))
+            row = cursor.fetchone()
+            return BookingRow._make(row) if row else None
+
+    def get_user_bookings_page(self, user_id, before=None, limit=BOOKING_PAGE_SIZE):
+        """One page of a user's bookings, newest first, as a BookingPage.
+
+        before is the (created_epoch, id) cursor of a previous page; each page
+        is a seek on idx_bookings_user_created, however long the history.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            if before:
+                cursor.execute(f'''
+                    SELECT {BOOKING_ROW_COLUMNS} FROM bookings
+                    WHERE user_id = ? AND (created_epoch, id) < (?, ?)
+                    ORDER BY created_epoch DESC, id DESC LIMIT ?
+                ''', (user_id, before[0], before[1], limit + 1))
+            else:
+                cursor.execute(f'''
+                    SELECT {BOOKING_ROW_COLUMNS} FROM bookings
+                    WHERE user_id = ?
+                    ORDER BY created_epoch DESC, id DESC LIMIT ?
+                ''', (user_id, limit + 1))
+            bookings = [BookingRow._make(row) for row in cursor.fetchall()]
+            if len(bookings) <= limit:
+                return BookingPage(bookings, None)
+            last = bookings[limit - 1]
+            return BookingPage(bookings[:limit], (last.created_epoch, last.id))
+
     def get_pending_fines(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT SUM(amount) FROM fines 
-            WHERE user_id = ? AND status = 'pending'
-        ''', (user_id,))
-        result = cursor.fetchone()[0]
-        conn.close()
-        return result if result else 0
+        return self.get_user_account(user_id).pending_fines
+
+    def get_user_account(self, user_id):
+        """A user's pending fines, lifetime spend and transaction count (UserAccount), from user_accounts"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT pending_fines, total_spent, transaction_count FROM user_accounts WHERE user_id = ?
+            ''', (user_id,))
+            row = cursor.fetchone()
+            return UserAccount._make(row) if row else UserAccount(0, 0, 0)
+
+    def verify_user_accounts(self):
+        """user_accounts rows that disagree with fines and transactions:
+        [(user_id, stored UserAccount, recomputed UserAccount)]"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(USER_ACCOUNTS_SQL)
+            actual = {user_id: UserAccount(*totals) for user_id, *totals in cursor.fetchall()}
+            cursor.execute('SELECT user_id, pending_fines, total_spent, transaction_count FROM user_accounts')
+            stored = {user_id: UserAccount(*totals) for user_id, *totals in cursor.fetchall()}
+        zero = UserAccount(0, 0, 0)
+        return [(user_id, stored.get(user_id, zero), actual.get(user_id, zero))
+                for user_id in sorted(actual.keys() | stored.keys())
+                if stored.get(user_id, zero) != actual.get(user_id, zero)]
+
+    def rebuild_user_accounts(self):
+        """Recompute user_accounts from fines and transactions; returns the number of accounts"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM user_accounts')
+            cursor.execute(f'''
+                INSERT INTO user_accounts (user_id, pending_fines, total_spent, transaction_count)
+                {USER_ACCOUNTS_SQL}
+            ''')
+            return cursor.rowcount
     
     def add_fine(self, user_id, booking_id, amount, reason):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO fines (user_id, booking_id, amount, reason)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, booking_id, amount, reason))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO fines (user_id, booking_id, amount, reason)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, booking_id, amount, reason))
     
+    def accrue_overstay_fines(self, fine_rates, now=None):
+        """Fine bookings whose car is still parked past its exit time.
+
+        fine_rates maps vehicle type to the fine amount. Every active booking
+        past its exit time that has no late-exit fine yet is found in one
+        indexed query; the fines and their 'fine' transactions are written
+        with executemany in one transaction. Each booking is fined once.
+        The exit paths only report what this has accrued. Returns
+        {booking_id: fine} for the fines added.
+        """
+        now = to_epoch(now or datetime.now())
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT booking_id, user_id, vehicle_type, vehicle_number, exit_epoch FROM bookings
+                WHERE status = 'active' AND exit_epoch < ?
+                  AND NOT EXISTS (SELECT 1 FROM fines f WHERE f.booking_id = bookings.booking_id
+                                  AND f.reason = ?)
+            ''', (now, LATE_EXIT_REASON))
+            overstays = cursor.fetchall()
+            if not overstays:
+                return {}
+
+            cursor.executemany('''
+                INSERT INTO fines (user_id, booking_id, amount, reason)
+                VALUES (?, ?, ?, ?)
+            ''', [(user_id, booking, fine_rates[vehicle_type], LATE_EXIT_REASON)
+                  for booking, user_id, vehicle_type, _, _ in overstays])
+            cursor.executemany('''
+                INSERT INTO transactions (transaction_id, user_id, booking_id, transaction_type,
+                                        fine_amount, total_amount, description)
+                VALUES (?, ?, ?, 'fine', ?, ?, ?)
+            ''', [(str(uuid.uuid4())[:16].upper(), user_id, booking, fine_rates[vehicle_type],
+                   fine_rates[vehicle_type],
+                   f'Late exit fine for {vehicle_type} {vehicle_number} - exceeded time by '
+                   f'{(now - exit_epoch) // 60} minutes')
+                  for booking, user_id, vehicle_type, vehicle_number, exit_epoch in overstays])
+            return {booking: fine_rates[vehicle_type] for booking, _, vehicle_type, _, _ in overstays}
+
+    def get_late_exit_fine(self, booking_id):
+        """Late-exit fine accrued on a booking, 0 if none"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT SUM(amount) FROM fines WHERE booking_id = ? AND reason = ?
+            ''', (booking_id, LATE_EXIT_REASON))
+            result = cursor.fetchone()[0]
+            return result if result else 0
+
+    def get_overstays(self, now=None):
+        """Cars parked past their exit time, longest overstay first: (booking_id, user_name,
+        vehicle_number, vehicle_type, spot_number, exit_time, fine accrued or None)"""
+        now = to_epoch(now or datetime.now())
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT b.booking_id, u.name, b.vehicle_number, b.vehicle_type,
+                       (SELECT sr.spot_number FROM slot_reservations sr
+                        WHERE sr.booking_id = b.booking_id ORDER BY sr.id DESC LIMIT 1),
+                       b.exit_time,
+                       (SELECT SUM(f.amount) FROM fines f WHERE f.booking_id = b.booking_id AND f.reason = ?)
+                FROM bookings b
+                JOIN users u ON u.user_id = b.user_id
+                WHERE b.status = 'active' AND b.exit_epoch < ?
+                ORDER BY b.exit_epoch
+            ''', (LATE_EXIT_REASON, now))
+            return cursor.fetchall()
+
     def update_booking_status(self, booking_id, status):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE bookings SET status = ? WHERE booking_id = ?
-        ''', (status, booking_id))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            old_window = self._live_window(cursor, booking_id)
+            cursor.execute('''
+                UPDATE bookings SET status = ? WHERE booking_id = ?
+            ''', (status, booking_id))
+            self._track_booking(cursor, booking_id, old_window, self._live_window(cursor, booking_id))
     
     def update_entry_time(self, booking_id, entry_time):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE bookings SET actual_entry_time = ?, status = 'active' 
-            WHERE booking_id = ?
-        ''', (entry_time, booking_id))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            old_window = self._live_window(cursor, booking_id)
+            cursor.execute('''
+                UPDATE bookings SET actual_entry_time = ?, status = 'active' 
+                WHERE booking_id = ?
+            ''', (entry_time, booking_id))
+            self._track_booking(cursor, booking_id, old_window, self._live_window(cursor, booking_id))
     
     def update_exit_time(self, booking_id, exit_time):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE bookings SET actual_exit_time = ?, status = 'completed' 
-            WHERE booking_id = ?
-        ''', (exit_time, booking_id))
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            old_window = self._live_window(cursor, booking_id)
+            cursor.execute('''
+                UPDATE bookings SET actual_exit_time = ?, status = 'completed' 
+                WHERE booking_id = ?
+            ''', (exit_time, booking_id))
+            self._track_booking(cursor, booking_id, old_window, self._live_window(cursor, booking_id))
     
     def extend_booking_time(self, booking_id, new_exit_time, additional_amount):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Update the scheduled exit time and add to the amount
-        cursor.execute('''
-            UPDATE bookings 
-            SET exit_time = ?, amount = amount + ?
-            WHERE booking_id = ?
-        ''', (new_exit_time, additional_amount, booking_id))
-        
-        conn.commit()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            old_window = self._live_window(cursor, booking_id)
+            
+            # Update the scheduled exit time and add to the amount
+            cursor.execute('''
+                UPDATE bookings 
+                SET exit_time = ?, amount = amount + ?
+                WHERE booking_id = ?
+            ''', (new_exit_time, additional_amount, booking_id))
+            self._track_booking(cursor, booking_id, old_window, self._live_window(cursor, booking_id))
+            
     
     def pay_pending_fines(self, user_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE fines SET status = 'paid' 
-            WHERE user_id = ? AND status = 'pending'
-        ''', (user_id,))
-        conn.commit()
-        conn.close()
-    
-    def create_transaction(self, transaction_data):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        import uuid
-        transaction_id = str(uuid.uuid4())[:16].upper()
-        
-        cursor.execute('''
-            INSERT INTO transactions (transaction_id, user_id, booking_id, transaction_type,
-                                    parking_amount, fine_amount, extension_amount, total_amount,
-                                    payment_method, description)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (transaction_id, transaction_data['user_id'], transaction_data.get('booking_id'),
-              transaction_data['transaction_type'], transaction_data.get('parking_amount', 0),
-              transaction_data.get('fine_amount', 0), transaction_data.get('extension_amount', 0),
-              transaction_data['total_amount'], transaction_data.get('payment_method', 'cash'),
-              transaction_data.get('description', '')))
-        
-        conn.commit()
-        conn.close()
-        return transaction_id
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE fines SET status = 'paid' 
+                WHERE user_id = ? AND status = 'pending'
+            ''', (user_id,))
+    
+    def create_transaction(self, transaction_data):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            import uuid
+            transaction_id = str(uuid.uuid4())[:16].upper()
+            
+            cursor.execute('''
+                INSERT INTO transactions (transaction_id, user_id, booking_id, transaction_type,
+                                        parking_amount, fine_amount, extension_amount, total_amount,
+                                        payment_method, description)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (transaction_id, transaction_data['user_id'], transaction_data.get('booking_id'),
+                  transaction_data['transaction_type'], transaction_data.get('parking_amount', 0),
+                  transaction_data.get('fine_amount', 0), transaction_data.get('extension_amount', 0),
+                  transaction_data['total_amount'], transaction_data.get('payment_method', 'cash'),
+                  transaction_data.get('description', '')))
+            
+            return transaction_id
     
     def get_transaction_by_id(self, transaction_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM transactions WHERE transaction_id = ?', (transaction_id,))
-        transaction = cursor.fetchone()
-        conn.close()
-        return transaction
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM transactions WHERE transaction_id = ?', (transaction_id,))
+            transaction = cursor.fetchone()
+            return transaction
     
     def get_user_transactions(self, user_id, limit=10):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM transactions WHERE user_id = ? 
-            ORDER BY created_at DESC LIMIT ?
-        ''', (user_id, limit))
-        transactions = cursor.fetchall()
-        conn.close()
-        return transactions
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # Column order is the one transactions.html indexes into
+            cursor.execute('''
+                SELECT id, transaction_id, booking_id, transaction_type, parking_amount, fine_amount,
+                       extension_amount, total_amount, payment_method, description, transaction_status,
+                       user_id, created_at
+                FROM transactions WHERE user_id = ?
+                ORDER BY created_epoch DESC LIMIT ?
+            ''', (user_id, limit))
+            transactions = cursor.fetchall()
+            return transactions
     
     def find_available_spot(self, vehicle_type, entry_time, exit_time):
         """Find the best available parking spot for the given time period"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Find spots that are available during the entire booking period
+        with self.connection() as conn:
+            cursor = conn.cursor()
+
+            # Pick among spots free for the entire booking period using the configured strategy
+            start, end = to_epoch(entry_time), to_epoch(exit_time)
+            if self.interval_backend == 'memory':
+                with self._spot_index_lock:
+                    if self._refresh_spot_index(cursor):
+                        return self.spot_strategy(self._spot_index.candidates(vehicle_type, start, end))
+            return self.spot_strategy(self._rtree_spot_candidates(cursor, vehicle_type, start, end))
+
+    def _reservation_windows(self, cursor, vehicle_type, start, end):
+        """Active reservations of a vehicle type that may overlap [start, end), from the R*Tree.
+
+        Returns (reserved_from, reserved_until, spot_number) with exact epoch
+        seconds; since the R*Tree bounds are rounded outwards, callers still
+        have to check the overlap themselves.
+        """
+        cursor.execute('''
+            SELECT rw.reserved_from, rw.reserved_until, sr.spot_number,
+                   sr.reserved_from_epoch, sr.reserved_until_epoch
+            FROM reservation_windows rw
+            -- CROSS JOIN pins the R*Tree range scan as the outer loop; otherwise the
+            -- planner may walk every spot's full reservation history instead
+            CROSS JOIN slot_reservations sr ON sr.id = rw.id
+            CROSS JOIN parking_spots ps ON ps.spot_number = sr.spot_number
+            WHERE rw.reserved_from < ? AND rw.reserved_until > ? AND ps.slot_type = ?
+        ''', (end, start, vehicle_type))
+        # Swap the rounded R*Tree bounds for the exact ones
+        return [(exact_from, exact_until, spot_number)
+                for _, _, spot_number, exact_from, exact_until in cursor.fetchall()]
+
+    def _rtree_spot_candidates(self, cursor, vehicle_type, start, end):
+        """Yield (spot, gap_before, gap_after) for spots free for [start, end), in zone order,
+        like SpotIndex.candidates() but answered from the R*Tree.
+
+        Neighbouring reservations are only looked for within BEST_FIT_HORIZON_SECONDS
+        of the window; a larger gap counts as open-ended.
+        """
+        horizon = 0 if self.spot_strategy is first_fit else BEST_FIT_HORIZON_SECONDS
+        busy, ends_before, starts_after = set(), {}, {}
+        for window_start, window_end, spot_number in self._reservation_windows(
+                cursor, vehicle_type, start - horizon, end + horizon):
+            if window_start < end and window_end > start:
+                busy.add(spot_number)
+            elif window_end <= start:
+                ends_before[spot_number] = max(window_end, ends_before.get(spot_number, window_end))
+            else:
+                starts_after[spot_number] = min(window_start, starts_after.get(spot_number, window_start))
+
         cursor.execute('''
-            SELECT spot_number, zone, floor_level FROM parking_spots 
+            SELECT spot_number, zone, floor_level FROM parking_spots
             WHERE slot_type = ? AND status = 'available'
-            AND spot_number NOT IN (
-                SELECT spot_number FROM slot_reservations 
-                WHERE status = 'active' 
-                AND ((reserved_from <= ? AND reserved_until > ?) OR 
-                     (reserved_from < ? AND reserved_until >= ?) OR
-                     (reserved_from >= ? AND reserved_until <= ?))
-            )
             ORDER BY zone, spot_number
-            LIMIT 1
-        ''', (vehicle_type, entry_time, entry_time, exit_time, exit_time, entry_time, exit_time))
-        
-        spot = cursor.fetchone()
-        conn.close()
-        return spot
-    
+        ''', (vehicle_type,))
+        for spot in cursor.fetchall():
+            spot_number = spot[0]
+            if spot_number in busy:
+                continue
+            gap_before = start - ends_before[spot_number] if spot_number in ends_before else float('inf')
+            gap_after = starts_after[spot_number] - end if spot_number in starts_after else float('inf')
+            yield spot, gap_before, gap_after
+
+    def _refresh_spot_index(self, cursor):
+        """(Re)load the spot index if any process has changed spots or reservations since it was built.
+
+        Like _refresh_availability(), returns False rather than load a
+        transaction's uncommitted writes into the shared index.
+        """
+        generation = self._generation(cursor, 'spots')
+        if self._spot_index is not None and generation == self._spot_index_generation:
+            return True
+        if cursor.connection.in_transaction:
+            return False
+
+        while True:
+            cursor.execute('''
+                SELECT spot_number, slot_type, zone, floor_level, status FROM parking_spots
+                ORDER BY zone, spot_number
+            ''')
+            spots = cursor.fetchall()
+            cursor.execute('''
+                SELECT spot_number, reserved_from_epoch, reserved_until_epoch, booking_id FROM slot_reservations
+                WHERE status = 'active'
+            ''')
+            reservations = cursor.fetchall()
+            # Outside a transaction each SELECT sees its own snapshot; retry until stable
+            loaded_generation = self._generation(cursor, 'spots')
+            if loaded_generation == generation:
+                break
+            generation = loaded_generation
+
+        by_spot = {}
+        for spot_number, reserved_from, reserved_until, booking_id in reservations:
+            by_spot.setdefault(spot_number, []).append((reserved_from, reserved_until, booking_id))
+
+        index = SpotIndex()
+        for spot_number, slot_type, zone, floor_level, status in spots:
+            index.add_spot(spot_number, slot_type, zone, floor_level)
+            index.set_spot(spot_number, status == 'available', by_spot.get(spot_number, ()))
+        self._spot_index = index
+        self._spot_index_generation = generation
+        return True
+
+    def _invalidate_spot_index(self):
+        with self._spot_index_lock:
+            self._spot_index = None
+
+    @contextmanager
+    def _spot_changes(self):
+        """Unit of work that changes parking spots or their reservations.
+
+        Yields a set for the caller to fill with the spot numbers it touches.
+        The write lock is held throughout, so every generation bump seen at
+        the end is ours: once the unit commits, the touched spots as read at
+        the end bring an index that was current at the start up to date.
+        """
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            generation = self._generation(cursor, 'spots')
+            version = self._generation(cursor, 'spot_version')
+            touched = set()
+            yield touched
+
+            if touched and (self.spot_feed.active or self._occupancy is not None):
+                rows = self.spot_feed.read_spots(cursor, touched)
+                version_after = self._generation(cursor, 'spot_version')
+                self._on_commit(lambda: self._spots_committed(version, version_after, rows))
+
+            if touched and self._spot_index is not None:
+                states = []
+                for spot_number in touched:
+                    cursor.execute('SELECT status FROM parking_spots WHERE spot_number = ?', (spot_number,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        continue
+                    cursor.execute('''
+                        SELECT reserved_from_epoch, reserved_until_epoch, booking_id FROM slot_reservations
+                        WHERE spot_number = ? AND status = 'active'
+                    ''', (spot_number,))
+                    states.append((spot_number, row[0] == 'available', cursor.fetchall()))
+                generation_after = self._generation(cursor, 'spots')
+                self._on_commit(lambda: self._spot_index_committed(generation, generation_after, states))
+
+    def _spot_index_committed(self, generation, generation_after, states):
+        """After a spot change commits: set the touched spots' (spot_number, available, reservations)"""
+        with self._spot_index_lock:
+            # Only an index that was current when the change began is current after it
+            if self._spot_index is None or self._spot_index_generation != generation:
+                return
+            for spot_number, available, reservations in states:
+                self._spot_index.set_spot(spot_number, available, reservations)
+            self._spot_index_generation = generation_after
+
+    def _spots_committed(self, version, version_after, rows):
+        """After a spot change commits: pass the touched rows (SPOT_EVENT_FIELDS) to the live views"""
+        self.spot_feed.publish(version_after, rows)
+        with self._occupancy_lock:
+            # Only a snapshot that was current when the change began is current after it
+            if self._occupancy is None or self._occupancy_version != version:
+                return
+            for row in rows:
+                spot = dict(zip(SPOT_EVENT_FIELDS, row))
+                self._occupancy.set_spot(spot['spot_number'], spot['status'], spot['is_occupied'],
+                                         spot['is_reserved'])
+            self._occupancy_version = version_after
+
     def reserve_parking_spot(self, booking_id, spot_number, entry_time, exit_time):
         """Reserve a specific parking spot for a booking"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Create reservation
-        cursor.execute('''
-            INSERT INTO slot_reservations (booking_id, spot_number, reserved_from, reserved_until)
-            VALUES (?, ?, ?, ?)
-        ''', (booking_id, spot_number, entry_time, exit_time))
-        
-        # Update parking spot status
-        cursor.execute('''
-            UPDATE parking_spots 
-            SET is_reserved = 1, current_booking_id = ?, 
-                occupied_from = ?, occupied_until = ?, last_updated = CURRENT_TIMESTAMP
-            WHERE spot_number = ?
-        ''', (booking_id, entry_time, exit_time, spot_number))
-        
-        conn.commit()
-        conn.close()
+        with self._spot_changes() as touched, self.connection() as conn:
+            cursor = conn.cursor()
+            touched.add(spot_number)
+
+            # Create reservation
+            cursor.execute('''
+                INSERT INTO slot_reservations (booking_id, spot_number, reserved_from, reserved_until)
+                VALUES (?, ?, ?, ?)
+            ''', (booking_id, spot_number, entry_time, exit_time))
+            
+            # Update parking spot status
+            cursor.execute('''
+                UPDATE parking_spots 
+                SET is_reserved = 1, current_booking_id = ?, 
+                    occupied_from = ?, occupied_until = ?, last_updated = CURRENT_TIMESTAMP
+                WHERE spot_number = ?
+            ''', (booking_id, entry_time, exit_time, spot_number))
+            
     
     def occupy_parking_spot(self, booking_id, spot_number):
         """Mark a spot as occupied when vehicle enters"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE parking_spots 
-            SET is_occupied = 1, status = 'occupied', last_updated = CURRENT_TIMESTAMP
-            WHERE spot_number = ? AND current_booking_id = ?
-        ''', (spot_number, booking_id))
-        
-        conn.commit()
-        conn.close()
+        with self._spot_changes() as touched, self.connection() as conn:
+            cursor = conn.cursor()
+            touched.add(spot_number)
+            
+            cursor.execute('''
+                UPDATE parking_spots 
+                SET is_occupied = 1, status = 'occupied', last_updated = CURRENT_TIMESTAMP
+                WHERE spot_number = ? AND current_booking_id = ?
+            ''', (spot_number, booking_id))
+            
     
     def free_parking_spot(self, booking_id, spot_number):
         """Free up a parking spot when vehicle exits"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Update spot status
-        cursor.execute('''
-            UPDATE parking_spots 
-            SET is_occupied = 0, is_reserved = 0, status = 'available',
-                current_booking_id = NULL, occupied_from = NULL, 
-                occupied_until = NULL, last_updated = CURRENT_TIMESTAMP
-            WHERE spot_number = ? AND current_booking_id = ?
-        ''', (spot_number, booking_id))
-        
-        # Update reservation status
+        with self._spot_changes() as touched, self.connection() as conn:
+            cursor = conn.cursor()
+            touched.add(spot_number)
+            
+            # Update spot status
+            cursor.execute('''
+                UPDATE parking_spots 
+                SET is_occupied = 0, is_reserved = 0, status = 'available',
+                    current_booking_id = NULL, occupied_from = NULL, 
+                    occupied_until = NULL, last_updated = CURRENT_TIMESTAMP
+                WHERE spot_number = ? AND current_booking_id = ?
+            ''', (spot_number, booking_id))
+            
+            # Update reservation status
+            cursor.execute('''
+                UPDATE slot_reservations 
+                SET status = 'completed'
+                WHERE booking_id = ? AND spot_number = ?
+            ''', (booking_id, spot_number))
+            
+    
+    def _reserved_spots(self, cursor, booking_id):
+        """Spot numbers held by a booking's active reservations"""
         cursor.execute('''
-            UPDATE slot_reservations 
-            SET status = 'completed'
-            WHERE booking_id = ? AND spot_number = ?
-        ''', (booking_id, spot_number))
-        
-        conn.commit()
-        conn.close()
+            SELECT spot_number FROM slot_reservations WHERE booking_id = ? AND status = 'active'
+        ''', (booking_id,))
+        return [row[0] for row in cursor.fetchall()]
     
+    def sweep_reservations(self, now=None, no_show_window=NO_SHOW_WINDOW, grace=RESERVATION_GRACE,
+                           batch_size=SWEEP_BATCH_SIZE):
+        """Release spots held for cars that never came.
+
+        A booking still 'booked' no_show_window after its entry time becomes
+        'no_show'. An active reservation that ended more than grace ago
+        becomes 'expired' (its booking, if still 'booked', a no-show) unless
+        the car is parked: an overstay keeps its spot. The spots these held
+        are released. Works through batch_size bookings and reservations per
+        transaction, found through indexes, and logs each release in
+        reservation_sweeps. Returns counts of no_show bookings, expired
+        reservations and released spots.
+        """
+        now = now or datetime.now()
+        no_show_before, expired_before = to_epoch(now - no_show_window), to_epoch(now - grace)
+        counts = {'no_show': 0, 'expired': 0, 'released': 0}
+        while True:
+            with self._spot_changes() as touched, self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT booking_id FROM bookings
+                    WHERE status = 'booked' AND entry_epoch < ?
+                    LIMIT ?
+                ''', (no_show_before, batch_size))
+                no_shows = {row[0] for row in cursor.fetchall()}
+                cursor.execute('''
+                    SELECT sr.booking_id, b.status FROM slot_reservations sr
+                    JOIN bookings b ON b.booking_id = sr.booking_id
+                    WHERE sr.status = 'active' AND sr.reserved_until_epoch < ? AND b.status != 'active'
+                    LIMIT ?
+                ''', (expired_before, batch_size))
+                stranded = cursor.fetchall()
+                if not no_shows and not stranded:
+                    return counts
+                no_shows.update(booking_id for booking_id, status in stranded if status == 'booked')
+                booking_ids = sorted(no_shows | {booking_id for booking_id, _ in stranded})
+                bookings = [(booking_id,) for booking_id in booking_ids]
+
+                # Every active reservation of these bookings, then the spots they still hold
+                reserved = [(booking_id, spot_number) for booking_id in booking_ids
+                            for spot_number in self._reserved_spots(cursor, booking_id)]
+                cursor.executemany('''
+                    UPDATE slot_reservations SET status = 'expired'
+                    WHERE booking_id = ? AND status = 'active'
+                ''', bookings)
+                counts['expired'] += cursor.rowcount
+                cursor.executemany('''
+                    UPDATE bookings SET status = 'no_show' WHERE booking_id = ? AND status = 'booked'
+                ''', [(booking_id,) for booking_id in sorted(no_shows)])
+                counts['no_show'] += cursor.rowcount
+                held = []
+                for booking_id in booking_ids:
+                    cursor.execute('''
+                        SELECT spot_number FROM parking_spots WHERE current_booking_id = ? AND is_occupied = 0
+                    ''', (booking_id,))
+                    held.extend((booking_id, row[0]) for row in cursor.fetchall())
+                cursor.executemany('''
+                    UPDATE parking_spots
+                    SET is_reserved = 0, current_booking_id = NULL, occupied_from = NULL,
+                        occupied_until = NULL, last_updated = CURRENT_TIMESTAMP
+                    WHERE current_booking_id = ? AND is_occupied = 0
+                ''', bookings)
+                counts['released'] += len(held)
+
+                spots = {booking_id: set() for booking_id in booking_ids}
+                for booking_id, spot_number in reserved + held:
+                    spots[booking_id].add(spot_number)
+                    touched.add(spot_number)
+                cursor.executemany('''
+                    INSERT INTO reservation_sweeps (booking_id, spot_number, outcome, swept_at)
+                    VALUES (?, ?, ?, ?)
+                ''', [(booking_id, spot_number, 'no_show' if booking_id in no_shows else 'expired', now)
+                      for booking_id in booking_ids for spot_number in sorted(spots[booking_id]) or [None]])
+
     def get_parking_spot_by_booking(self, booking_id):
         """Get the parking spot assigned to a booking"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT ps.spot_number, ps.zone, ps.floor_level, ps.status, ps.is_occupied
-            FROM parking_spots ps
-            WHERE ps.current_booking_id = ?
-        ''', (booking_id,))
-        spot = cursor.fetchone()
-        conn.close()
-        return spot
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ps.spot_number, ps.zone, ps.floor_level, ps.status, ps.is_occupied
+                FROM parking_spots ps
+                WHERE ps.current_booking_id = ?
+            ''', (booking_id,))
+            spot = cursor.fetchone()
+            return spot
     
     def get_live_parking_status(self, vehicle_type=None):
-        """Get real-time parking availability status"""
-        conn = self.get_connection()
+        """Get real-time parking availability status.
+
+        Rows are (zone, total, available, occupied, reserved) for one vehicle
+        type, or (slot_type, zone, ...) for all, from the occupancy snapshot.
+        """
+        with self._occupancy_lock:
+            self._refresh_occupancy()
+            return self._occupancy.rows(vehicle_type)
+
+    def _refresh_occupancy(self):
+        """Bring the occupancy snapshot up to date with commits made through other connections.
+
+        The snapshot has a connection of its own, whose PRAGMA data_version
+        changes once any other connection, in any process, commits. That is
+        the cue to compare the 'spot_version' counter; if spots changed, the
+        rows stamped with a newer version are applied. Caller holds _occupancy_lock.
+        """
+        if self._occupancy_conn is None or self._occupancy_conn[1] != os.getpid():
+            self._occupancy_conn = (sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS,
+                                                    check_same_thread=False), os.getpid())
+            self._occupancy = None
+        conn = self._occupancy_conn[0]
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if self._occupancy is not None and data_version == self._occupancy_data_version:
+            return
+        self._occupancy_data_version = data_version
         cursor = conn.cursor()
-        
-        if vehicle_type:
+        # The version is read first, so the rows read after it are at least that new
+        version = self._generation(cursor, 'spot_version')
+        occupancy = self._occupancy
+        if occupancy is not None and version == self._occupancy_version:
+            return
+        if occupancy is not None and version > self._occupancy_version:
             cursor.execute('''
-                SELECT 
-                    zone,
-                    COUNT(*) as total_spots,
-                    SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available,
-                    SUM(CASE WHEN status = 'occupied' THEN 1 ELSE 0 END) as occupied,
-                    SUM(CASE WHEN is_reserved = 1 AND is_occupied = 0 THEN 1 ELSE 0 END) as reserved
-                FROM parking_spots 
-                WHERE slot_type = ?
-                GROUP BY zone
-                ORDER BY zone
-            ''', (vehicle_type,))
-        else:
-            cursor.execute('''
-                SELECT 
-                    slot_type,
-                    zone,
-                    COUNT(*) as total_spots,
-                    SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available,
-                    SUM(CASE WHEN status = 'occupied' THEN 1 ELSE 0 END) as occupied,
-                    SUM(CASE WHEN is_reserved = 1 AND is_occupied = 0 THEN 1 ELSE 0 END) as reserved
-                FROM parking_spots 
-                GROUP BY slot_type, zone
-                ORDER BY slot_type, zone
-            ''')
-        
-        status = cursor.fetchall()
-        conn.close()
-        return status
+                SELECT spot_number, slot_type, zone, status, is_occupied, is_reserved
+                FROM parking_spots WHERE version > ?
+            ''', (self._occupancy_version,))
+            rows = cursor.fetchall()
+            # A spot that is new or moved zone changes the groups: rebuild instead
+            if all(occupancy.zone_of(row[0]) == row[1:3] for row in rows):
+                for spot_number, _, _, status, is_occupied, is_reserved in rows:
+                    occupancy.set_spot(spot_number, status, is_occupied, is_reserved)
+                self._occupancy_version = version
+                return
+        cursor.execute('''
+            SELECT spot_number, slot_type, zone, status, is_occupied, is_reserved
+            FROM parking_spots ORDER BY slot_type, zone, spot_number
+        ''')
+        occupancy = OccupancySnapshot()
+        for row in cursor.fetchall():
+            occupancy.add_spot(*row)
+        self._occupancy = occupancy
+        self._occupancy_version = version
     
     def get_all_spots_with_status(self, vehicle_type=None):
         """Get all parking spots with their current status"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if vehicle_type:
-            cursor.execute('''
-                SELECT spot_number, zone, floor_level, status, is_occupied, is_reserved,
-                       current_booking_id, occupied_from, occupied_until
-                FROM parking_spots 
-                WHERE slot_type = ?
-                ORDER BY zone, spot_number
-            ''', (vehicle_type,))
-        else:
-            cursor.execute('''
-                SELECT spot_number, slot_type, zone, floor_level, status, is_occupied, is_reserved,
-                       current_booking_id, occupied_from, occupied_until
-                FROM parking_spots 
-                ORDER BY slot_type, zone, spot_number
-            ''')
-        
-        spots = cursor.fetchall()
-        conn.close()
-        return spots
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            if vehicle_type:
+                cursor.execute('''
+                    SELECT spot_number, zone, floor_level, status, is_occupied, is_reserved,
+                           current_booking_id, occupied_from, occupied_until, version
+                    FROM parking_spots 
+                    WHERE slot_type = ?
+                    ORDER BY zone, spot_number
+                ''', (vehicle_type,))
+            else:
+                cursor.execute('''
+                    SELECT spot_number, slot_type, zone, floor_level, status, is_occupied, is_reserved,
+                           current_booking_id, occupied_from, occupied_until, version
+                    FROM parking_spots 
+                    ORDER BY slot_type, zone, spot_number
+                ''')
+            
+            spots = cursor.fetchall()
+            return spots
+
+    def get_spot_version(self):
+        """State version of the lot: bumped by every visible change to any spot"""
+        with self.connection() as conn:
+            return self._generation(conn.cursor(), 'spot_version')
+
+    def get_spots_changed_since(self, version, vehicle_type=None):
+        """Spots changed after state version, in get_all_spots_with_status() row shape"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            if vehicle_type:
+                cursor.execute('''
+                    SELECT spot_number, zone, floor_level, status, is_occupied, is_reserved,
+                           current_booking_id, occupied_from, occupied_until, version
+                    FROM parking_spots 
+                    WHERE version > ? AND slot_type = ?
+                    ORDER BY version
+                ''', (version, vehicle_type))
+            else:
+                cursor.execute('''
+                    SELECT spot_number, slot_type, zone, floor_level, status, is_occupied, is_reserved,
+                           current_booking_id, occupied_from, occupied_until, version
+                    FROM parking_spots 
+                    WHERE version > ?
+                    ORDER BY version
+                ''', (version,))
+            
+            return cursor.fetchall()
     
     def extend_spot_reservation(self, booking_id, new_exit_time):
         """Extend the reservation time for a parking spot"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Update reservation
-        cursor.execute('''
-            UPDATE slot_reservations 
-            SET reserved_until = ?
-            WHERE booking_id = ? AND status = 'active'
-        ''', (new_exit_time, booking_id))
-        
-        # Update parking spot
-        cursor.execute('''
-            UPDATE parking_spots 
-            SET occupied_until = ?, last_updated = CURRENT_TIMESTAMP
-            WHERE current_booking_id = ?
-        ''', (new_exit_time, booking_id))
-        
-        conn.commit()
-        conn.close()
+        with self._spot_changes() as touched, self.connection() as conn:
+            cursor = conn.cursor()
+            touched.update(self._reserved_spots(cursor, booking_id))
+            
+            # Update reservation
+            cursor.execute('''
+                UPDATE slot_reservations 
+                SET reserved_until = ?
+                WHERE booking_id = ? AND status = 'active'
+            ''', (new_exit_time, booking_id))
+            
+            # Update parking spot
+            cursor.execute('''
+                UPDATE parking_spots 
+                SET occupied_until = ?, last_updated = CURRENT_TIMESTAMP
+                WHERE current_booking_id = ?
+            ''', (new_exit_time, booking_id))
+            
     
+    def book_spot(self, booking_data):
+        """Book a parking spot as a single unit of work.
+
+        The availability check, spot selection, booking, spot reservation,
+        transaction record and fine settlement all run in one BEGIN IMMEDIATE
+        transaction with a single commit, so two concurrent requests can never
+        be handed the same spot.
+
+        Returns a dict describing the outcome. 'spot_number' is None when no
+        spot could be booked; 'available_slots' tells the caller why.
+        """
+        user_id = booking_data['user_id']
+        vehicle_type = booking_data['vehicle_type']
+        entry_time = booking_data['entry_time']
+        exit_time = booking_data['exit_time']
+
+        with self.transaction():
+            available_slots = self.check_slot_availability(vehicle_type, entry_time, exit_time)
+            spot = None
+            if available_slots > 0:
+                spot = self.find_available_spot(vehicle_type, entry_time, exit_time)
+
+            if not spot:
+                return {'available_slots': available_slots, 'spot_number': None}
+
+            spot_number, zone, floor_level = spot
+            pending_fines = self.get_pending_fines(user_id)
+            total_amount = booking_data['amount'] + pending_fines
+            duration = (exit_time - entry_time).total_seconds() / 3600
+
+            booking_id = self.create_booking(booking_data)
+            self.reserve_parking_spot(booking_id, spot_number, entry_time, exit_time)
+
+            transaction_id = self.create_transaction({
+                'user_id': user_id,
+                'booking_id': booking_id,
+                'transaction_type': 'booking',
+                'parking_amount': booking_data['amount'],
+                'fine_amount': pending_fines,
+                'total_amount': total_amount,
+                'description': f'Parking booking for {vehicle_type} {booking_data["vehicle_number"]} - {duration:.1f} hours - Spot {spot_number}'
+            })
+
+            if pending_fines > 0:
+                self.pay_pending_fines(user_id)
+
+        return {
+            'available_slots': available_slots,
+            'booking_id': booking_id,
+            'transaction_id': transaction_id,
+            'spot_number': spot_number,
+            'zone': zone,
+            'floor_level': floor_level,
+            'pending_fines': pending_fines,
+            'total_amount': total_amount
+        }
+
     # Admin authentication methods
     def authenticate_admin(self, username, password):
         """Authenticate admin user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT admin_id, name, role FROM admins 
-            WHERE username = ? AND password = ?
-        ''', (username, password))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'admin_id': result[0],
-                'name': result[1],
-                'role': result[2],
-                'username': username
-            }
-        return None
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT admin_id, name, role FROM admins 
+                WHERE username = ? AND password = ?
+            ''', (username, password))
+            
+            result = cursor.fetchone()
+            
+            if result:
+                return {
+                    'admin_id': result[0],
+                    'name': result[1],
+                    'role': result[2],
+                    'username': username
+                }
+            return None
     
     def get_admin_by_id(self, admin_id):
         """Get admin details by admin_id"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT admin_id, username, name, role FROM admins 
-            WHERE admin_id = ?
-        ''', (admin_id,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'admin_id': result[0],
-                'username': result[1],
-                'name': result[2],
-                'role': result[3]
-            }
-        return None
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT admin_id, username, name, role FROM admins 
+                WHERE admin_id = ?
+            ''', (admin_id,))
+            
+            result = cursor.fetchone()
+            
+            if result:
+                return {
+                    'admin_id': result[0],
+                    'username': result[1],
+                    'name': result[2],
+                    'role': result[3]
+                }
+            return None
     
     # QR Code verification methods
     def verify_qr_booking(self, booking_id):
         """Verify if booking exists and get details"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        with self.connection() as conn:
+            return self._gate_booking(conn.cursor(), booking_id)
+
+    def _gate_booking(self, cursor, booking_id):
+        """A live booking with its user and reserved spot, as a GATE_BOOKING_FIELDS dict, else None"""
         cursor.execute('''
-            SELECT b.*, u.name, u.mobile, ps.spot_number, ps.zone, ps.floor_level
+            SELECT b.booking_id, b.user_id, b.vehicle_number, b.vehicle_type, b.entry_time, b.exit_time,
+                   b.amount, b.status, u.name, u.mobile, ps.spot_number, ps.zone, ps.floor_level
             FROM bookings b
             JOIN users u ON b.user_id = u.user_id
             LEFT JOIN slot_reservations sr ON b.booking_id = sr.booking_id AND sr.status = 'active'
             LEFT JOIN parking_spots ps ON sr.spot_number = ps.spot_number
             WHERE b.booking_id = ? AND b.status IN ('booked', 'active')
         ''', (booking_id,))
-        
         result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'booking_id': result[1],
-                'user_id': result[2],
-                'vehicle_number': result[3],
-                'vehicle_type': result[4],
-                'entry_time': result[5],
-                'exit_time': result[6],
-                'amount': result[8],
-                'status': result[9],
-                'user_name': result[12],
-                'user_mobile': result[13],
-                'spot_number': result[14],
-                'zone': result[15],
-                'floor_level': result[16]
-            }
-        return None
+        return dict(zip(GATE_BOOKING_FIELDS, result)) if result else None
+
+    def process_gate_event(self, booking_id, action_type, admin_id, now=None):
+        """Verify and record a gate scan as a single unit of work.
+
+        Booking lookup, duplicate detection, the timing rules, the log entry
+        and the booking and spot updates share one BEGIN IMMEDIATE
+        transaction, so two gates scanning the same code at once cannot both
+        record it. An exit reports the late-exit fine the overstay job has
+        accrued (accrue_overstay_fines()); it does not charge one itself.
+
+        Returns a GateEvent; its booking is the verify_qr_booking() dict, or
+        None if there is no live booking.
+        """
+        if action_type not in GATE_ACTIONS:
+            return GateEvent(False, f'Unknown gate action {action_type!r}', None)
+        now = now or datetime.now()
+
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            booking = self._gate_booking(cursor, booking_id)
+            if booking is None:
+                return GateEvent(False, 'Invalid or expired booking', None)
+
+            cursor.execute('''
+                SELECT COALESCE(MAX(action_type = 'entry'), 0), COALESCE(MAX(action_type = 'exit'), 0)
+                FROM entry_exit_logs WHERE booking_id = ?
+            ''', (booking_id,))
+            entered, exited = cursor.fetchone()
+            if entered if action_type == 'entry' else exited:
+                return GateEvent(False, f'{action_type.title()} already recorded for this booking', booking)
+
+            if action_type == 'entry' and now < _to_datetime(booking['entry_time']) - GATE_ENTRY_GRACE:
+                return GateEvent(False, 'Too early for entry', booking)
+            if action_type == 'exit' and not entered:
+                return GateEvent(False, 'Must enter before exit', booking)
+
+            fine = self.get_late_exit_fine(booking_id) if action_type == 'exit' else 0
+            self.record_entry_exit(booking_id, action_type, admin_id, booking['spot_number'])
+            return GateEvent(True, f'{action_type.title()} verified successfully', booking, fine)
+
+    def record_exit(self, booking_id, spot_number, now=None):
+        """Record a car leaving: exit time and freed spot in one transaction. Returns the
+        late-exit fine the overstay job accrued on the booking, 0 if none."""
+        now = now or datetime.now()
+        with self.transaction():
+            self.update_exit_time(booking_id, now)
+            if spot_number:
+                self.free_parking_spot(booking_id, spot_number)
+            return self.get_late_exit_fine(booking_id)
     
     def record_entry_exit(self, booking_id, action_type, admin_id, spot_number=None):
         """Record entry or exit action"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO entry_exit_logs (booking_id, action_type, verified_by, spot_number)
-            VALUES (?, ?, ?, ?)
-        ''', (booking_id, action_type, admin_id, spot_number))
-        
-        # Update booking status if needed
-        if action_type == 'entry':
-            cursor.execute('''
-                UPDATE bookings SET status = 'active' WHERE booking_id = ?
-            ''', (booking_id,))
-            
-            # Occupy the parking spot
+        with self._spot_changes() as touched, self.connection() as conn:
+            cursor = conn.cursor()
             if spot_number:
-                cursor.execute('''
-                    UPDATE parking_spots 
-                    SET is_occupied = 1, current_booking_id = ?, last_updated = CURRENT_TIMESTAMP
-                    WHERE spot_number = ?
-                ''', (booking_id, spot_number))
-                
-        elif action_type == 'exit':
+                touched.add(spot_number)
+                touched.update(self._reserved_spots(cursor, booking_id))
+            
             cursor.execute('''
-                UPDATE bookings SET status = 'completed' WHERE booking_id = ?
-            ''', (booking_id,))
+                INSERT INTO entry_exit_logs (booking_id, action_type, verified_by, spot_number)
+                VALUES (?, ?, ?, ?)
+            ''', (booking_id, action_type, admin_id, spot_number))
             
-            # Free the parking spot
-            if spot_number:
+            # Update booking status if needed
+            old_window = self._live_window(cursor, booking_id)
+            if action_type == 'entry':
                 cursor.execute('''
-                    UPDATE parking_spots 
-                    SET is_occupied = 0, current_booking_id = NULL, occupied_until = NULL, last_updated = CURRENT_TIMESTAMP
-                    WHERE spot_number = ?
-                ''', (spot_number,))
+                    UPDATE bookings SET status = 'active' WHERE booking_id = ?
+                ''', (booking_id,))
+                self._track_booking(cursor, booking_id, old_window, self._live_window(cursor, booking_id))
                 
-                # Mark reservation as completed
+                # Occupy the parking spot
+                if spot_number:
+                    cursor.execute('''
+                        UPDATE parking_spots 
+                        SET is_occupied = 1, current_booking_id = ?, last_updated = CURRENT_TIMESTAMP
+                        WHERE spot_number = ?
+                    ''', (booking_id, spot_number))
+                    
+            elif action_type == 'exit':
                 cursor.execute('''
-                    UPDATE slot_reservations 
-                    SET status = 'completed'
-                    WHERE booking_id = ? AND status = 'active'
+                    UPDATE bookings SET status = 'completed' WHERE booking_id = ?
                 ''', (booking_id,))
-        
-        conn.commit()
-        conn.close()
-        return True
+                self._track_booking(cursor, booking_id, old_window, None)
+                
+                # Free the parking spot
+                if spot_number:
+                    cursor.execute('''
+                        UPDATE parking_spots 
+                        SET is_occupied = 0, current_booking_id = NULL, occupied_until = NULL, last_updated = CURRENT_TIMESTAMP
+                        WHERE spot_number = ?
+                    ''', (spot_number,))
+                    
+                    # Mark reservation as completed
+                    cursor.execute('''
+                        UPDATE slot_reservations 
+                        SET status = 'completed'
+                        WHERE booking_id = ? AND status = 'active'
+                    ''', (booking_id,))
+            
+            return True
     
     def get_entry_exit_logs(self, booking_id=None, limit=100):
         """Get entry/exit logs"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if booking_id:
-            cursor.execute('''
-                SELECT eel.*, b.vehicle_number, b.vehicle_type, u.name as user_name, a.name as admin_name
-                FROM entry_exit_logs eel
-                JOIN bookings b ON eel.booking_id = b.booking_id
-                JOIN users u ON b.user_id = u.user_id
-                JOIN admins a ON eel.verified_by = a.admin_id
-                WHERE eel.booking_id = ?
-                ORDER BY eel.timestamp DESC
-            ''', (booking_id,))
-        else:
-            cursor.execute('''
-                SELECT eel.*, b.vehicle_number, b.vehicle_type, u.name as user_name, a.name as admin_name
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            if booking_id:
+                cursor.execute('''
+                    SELECT eel.id, eel.booking_id, eel.action_type, eel.timestamp, eel.verified_by,
+                           eel.spot_number, eel.status, b.vehicle_number, b.vehicle_type,
+                           u.name as user_name, a.name as admin_name, eel.timestamp_epoch
+                    FROM entry_exit_logs eel
+                    JOIN bookings b ON eel.booking_id = b.booking_id
+                    JOIN users u ON b.user_id = u.user_id
+                    JOIN admins a ON eel.verified_by = a.admin_id
+                    WHERE eel.booking_id = ?
+                    ORDER BY eel.timestamp_epoch DESC
+                ''', (booking_id,))
+            else:
+                cursor.execute('''
+                    SELECT eel.id, eel.booking_id, eel.action_type, eel.timestamp, eel.verified_by,
+                           eel.spot_number, eel.status, b.vehicle_number, b.vehicle_type,
+                           u.name as user_name, a.name as admin_name, eel.timestamp_epoch
+                    FROM entry_exit_logs eel
+                    JOIN bookings b ON eel.booking_id = b.booking_id
+                    JOIN users u ON b.user_id = u.user_id
+                    JOIN admins a ON eel.verified_by = a.admin_id
+                    ORDER BY eel.timestamp_epoch DESC
+                    LIMIT ?
+                ''', (limit,))
+            
+            results = cursor.fetchall()
+            
+            logs = []
+            for row in results:
+                logs.append({
+                    'id': row[0],
+                    'booking_id': row[1],
+                    'action_type': row[2],
+                    'timestamp': row[3],
+                    'verified_by': row[4],
+                    'spot_number': row[5],
+                    'status': row[6],
+                    'vehicle_number': row[7],
+                    'vehicle_type': row[8],
+                    'user_name': row[9],
+                    'admin_name': row[10],
+                    'timestamp_epoch': row[11]
+                })
+            
+            return logs
+    
+    def get_log_page(self, before=None, limit=LOG_PAGE_SIZE, since=None, until=None, action_type=None,
+                     vehicle_number=None, vehicle_type=None, zone=None, verified_by=None):
+        """One page of gate logs, newest first, as a LogPage.
+
+        before is the (timestamp_epoch, id) cursor of a previous page. since
+        and until (datetimes or epoch seconds) bound the log time to
+        [since, until); the other filters match exactly, vehicle_number
+        ignoring case. Pages are read in (timestamp_epoch, id) index order,
+        so a page costs the same however much history there is.
+        """
+        conditions, parameters = [], []
+        if before:
+            conditions.append('(eel.timestamp_epoch, eel.id) < (?, ?)')
+            parameters.extend(before)
+        if since is not None:
+            conditions.append('eel.timestamp_epoch >= ?')
+            parameters.append(since if isinstance(since, int) else to_epoch(since))
+        if until is not None:
+            conditions.append('eel.timestamp_epoch < ?')
+            parameters.append(until if isinstance(until, int) else to_epoch(until))
+        if action_type:
+            conditions.append('eel.action_type = ?')
+            parameters.append(action_type)
+        if verified_by:
+            conditions.append('eel.verified_by = ?')
+            parameters.append(verified_by)
+        if zone:
+            conditions.append('eel.spot_number IN (SELECT spot_number FROM parking_spots WHERE zone = ?)')
+            parameters.append(zone)
+        if vehicle_number:
+            conditions.append('''eel.booking_id IN (SELECT booking_id FROM bookings
+                                                 WHERE vehicle_number = ? COLLATE NOCASE)''')
+            parameters.append(vehicle_number)
+        if vehicle_type:
+            conditions.append('b.vehicle_type = ?')
+            parameters.append(vehicle_type)
+
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT eel.id, eel.booking_id, eel.action_type, eel.timestamp, eel.verified_by,
+                       eel.spot_number, eel.status, b.vehicle_number, b.vehicle_type,
+                       u.name, a.name, eel.timestamp_epoch, ps.zone
                 FROM entry_exit_logs eel
                 JOIN bookings b ON eel.booking_id = b.booking_id
                 JOIN users u ON b.user_id = u.user_id
                 JOIN admins a ON eel.verified_by = a.admin_id
-                ORDER BY eel.timestamp DESC
+                LEFT JOIN parking_spots ps ON ps.spot_number = eel.spot_number
+                {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+                ORDER BY eel.timestamp_epoch DESC, eel.id DESC
                 LIMIT ?
-            ''', (limit,))
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        logs = []
-        for row in results:
-            logs.append({
-                'id': row[0],
-                'booking_id': row[1],
-                'action_type': row[2],
-                'timestamp': row[3],
-                'verified_by': row[4],
-                'spot_number': row[5],
-                'status': row[6],
-                'vehicle_number': row[7],
-                'vehicle_type': row[8],
-                'user_name': row[9],
-                'admin_name': row[10]
-            })
-        
-        return logs
-    
+            ''', parameters + [limit + 1])
+            logs = [dict(zip(LOG_FIELDS, row)) for row in cursor.fetchall()]
+        if len(logs) <= limit:
+            return LogPage(logs, None)
+        last = logs[limit - 1]
+        return LogPage(logs[:limit], (last['timestamp_epoch'], last['id']))
+
+    def get_gate_stats(self, day=None):
+        """A local day's gate scans from gate_stats_daily, as GateStats.
+
+        by_zone maps zone to {'entry': n, 'exit': n}; by_admin maps admin
+        name likewise. Scans without a spot count under zone ''.
+        """
+        day = (day or datetime.now().date()).isoformat()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT g.zone, g.action_type, COALESCE(a.name, g.verified_by), g.count
+                FROM gate_stats_daily g
+                LEFT JOIN admins a ON a.admin_id = g.verified_by
+                WHERE g.day = ? AND g.count != 0
+            ''', (day,))
+            totals, by_zone, by_admin = {'entry': 0, 'exit': 0}, {}, {}
+            for zone, action_type, admin, count in cursor.fetchall():
+                totals[action_type] = totals.get(action_type, 0) + count
+                for breakdown, key in ((by_zone, zone), (by_admin, admin)):
+                    counts = breakdown.setdefault(key, {'entry': 0, 'exit': 0})
+                    counts[action_type] = counts.get(action_type, 0) + count
+        return GateStats(day, totals['entry'], totals['exit'], by_zone, by_admin)
+
+    def rebuild_gate_stats(self):
+        """Recompute gate_stats_daily from entry_exit_logs; returns the number of rows"""
+        with self.transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM gate_stats_daily')
+            cursor.execute(f'''
+                INSERT INTO gate_stats_daily (day, zone, action_type, verified_by, count)
+                {GATE_STATS_SQL}
+            ''')
+            return cursor.rowcount
+
+    def verify_gate_stats(self):
+        """gate_stats_daily counts that disagree with entry_exit_logs:
+        [((day, zone, action_type, verified_by), stored, recomputed)]"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(GATE_STATS_SQL)
+            actual = {tuple(key): count for *key, count in cursor.fetchall()}
+            cursor.execute('SELECT day, zone, action_type, verified_by, count FROM gate_stats_daily')
+            stored = {tuple(key): count for *key, count in cursor.fetchall()}
+        return [(key, stored.get(key, 0), actual.get(key, 0))
+                for key in sorted(actual.keys() | stored.keys())
+                if stored.get(key, 0) != actual.get(key, 0)]
+
+    def export_rows(self, kind, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+        """Stream an EXPORTS table as batches (lists) of row tuples in EXPORTS[kind].columns order.
+
+        since and until (datetimes or epoch seconds) bound the export to
+        [since, until). Rows are read fetchmany(batch_size) at a time from
+        a connection of the export's own, which holds one read snapshot
+        until the generator is exhausted or closed, so memory stays flat
+        and concurrent writes neither block nor tear the export.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(*self._export_query(kind, since, until))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            conn.close()
+
+    def _export_query(self, kind, since=None, until=None):
+        """(sql, parameters) of an export_rows() export"""
+        export = EXPORTS[kind]
+        conditions, parameters = [], []
+        for bound, op in ((since, '>='), (until, '<')):
+            if bound is not None:
+                conditions.append(f'{export.epoch} {op} ?')
+                parameters.append(bound if isinstance(bound, int) else to_epoch(bound))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f'{export.sql} {where} ORDER BY {export.epoch}, {export.id}', parameters
+
+    def get_log_filters(self):
+        """Choices for the log browser's filters: {'zones': [zone], 'admins': [(admin_id, name)]}"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT DISTINCT zone FROM parking_spots ORDER BY zone')
+            zones = [row[0] for row in cursor.fetchall()]
+            cursor.execute('SELECT admin_id, name FROM admins ORDER BY name')
+            return {'zones': zones, 'admins': cursor.fetchall()}
+
     def check_duplicate_entry_exit(self, booking_id, action_type):
         """Check if entry/exit has already been recorded"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*) FROM entry_exit_logs 
-            WHERE booking_id = ? AND action_type = ?
-        ''', (booking_id, action_type))
-        
-        count = cursor.fetchone()[0]
-        conn.close()
-        
-        return count > 0
\ No newline at end of file
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT COUNT(*) FROM entry_exit_logs 
+                WHERE booking_id = ? AND action_type = ?
+            ''', (booking_id, action_type))
+            
+            count = cursor.fetchone()[0]
+            
+            return count > 0
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Streaming CSV and NDJSON encoding for bulk exports
+
+encode() turns the row batches of Database.export_rows() into text
+chunks, one per batch: CSV with a header row and formula-like text
+cells neutralised, or NDJSON with one object per row. gzipped()
+compresses a chunk stream on the fly. Neither holds more than one batch,
+so an export of any size runs in constant memory, whether it is
+streamed over HTTP or written to a file.
+"""
+
+import csv
+import io
+import json
+import zlib
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# Leading characters that make a spreadsheet read a CSV cell as a formula. Text cells
+# starting with one get a ' prefix in CSV output, so a vehicle number or description
+# like =HYPERLINK(...) opens as text; NDJSON is left as stored.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# Compress at level 6 (gzip's default); the output is read once and rarely kept
+GZIP_LEVEL = 6
+
+
+def encode(columns, batches, fmt):
+    """Text chunks of the batches in fmt ('csv' or 'ndjson')"""
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown export format {fmt!r}')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writerow(columns)
+        yield _drain(buffer)
+    for rows in batches:
+        if fmt == 'csv':
+            writer.writerows([_csv_cell(value) for value in row] for row in rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=str))
+                buffer.write('\n')
+        yield _drain(buffer)
+
+
+def gzipped(chunks):
+    """gzip-compressed bytes of the text chunks, compressed as they come"""
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _csv_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
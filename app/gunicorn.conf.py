@@ -0,0 +1,9 @@
+# Picked up by `cd app && gunicorn app:app` (gunicorn reads ./gunicorn.conf.py)
+#
+# Threaded workers: an open /api/live_status/stream holds a thread for its
+# lifetime, which would stall a sync worker. app.LIVE_STREAM_LIMIT keeps
+# streams below the thread count so ordinary requests still get served.
+import os
+
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 64))
@@ -0,0 +1,234 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+instrument_app() times every Flask request by route, instrument_database()
+wraps the public Database methods (latency, calls, errors, rows returned,
+commits), and track_occupancy() publishes live occupancy per slot type and
+zone whenever /metrics is scraped.
+
+Each process keeps its own registry: under gunicorn, a scrape shows the
+counters of whichever worker answered it. Timings of Database methods that
+call each other are inclusive, as are their commits.
+"""
+
+import bisect
+import threading
+import time
+from functools import wraps
+
+from flask import g, request
+
+from database import BookingPage, LogPage
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; the same buckets serve HTTP requests and Database calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Plumbing rather than queries, and generators (export_rows), whose queries run after the call
+# returns, paced by whoever consumes them
+UNINSTRUMENTED_METHODS = ('connection', 'transaction', 'get_connection', 'close', 'init_database', 'export_rows')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for v in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name, self.labelnames, labels, value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def replace(self, values):
+        """Set every labelled value at once, dropping label sets that are gone"""
+        with self._lock:
+            self._values = dict(values)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(counts)) for labels, counts in self._values.items())
+        bucket_names = self.labelnames + ('le',)
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', bucket_names, labels + (_format_value(bound),), cumulative
+            yield f'{self.name}_sum', self.labelnames, labels, counts[-1]
+            yield f'{self.name}_count', self.labelnames, labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """Call collect() before every render, e.g. to refresh gauges"""
+        self._collectors.append(collect)
+
+    def render(self):
+        for collect in self._collectors:
+            collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labelnames, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def instrument_app(app, registry):
+    """Record latency and status of every request, labelled by route rule"""
+    duration = registry.register(Histogram(
+        'parking_http_request_duration_seconds', 'Time spent handling a request', ('method', 'route')))
+    requests_total = registry.register(Counter(
+        'parking_http_requests_total', 'Requests handled, by response status', ('method', 'route', 'status')))
+    exceptions = registry.register(Counter(
+        'parking_http_exceptions_total', 'Requests that raised an unhandled exception', ('method', 'route')))
+
+    def route():
+        return request.url_rule.rule if request.url_rule else '<unmatched>'
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            duration.observe(time.perf_counter() - started, request.method, route())
+            requests_total.inc(request.method, route(), str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def record_exception(exc):
+        if exc is not None:
+            exceptions.inc(request.method, route())
+
+
+def _rows(result):
+    """Rows a Database method returned, or None if it does not return a list of rows"""
+    if isinstance(result, (BookingPage, LogPage)):
+        result = result[0]
+    if isinstance(result, list):
+        return len(result)
+    return None
+
+
+def instrument_database(db, registry):
+    """Wrap db's public methods in place; calls between them are wrapped too"""
+    duration = registry.register(Histogram(
+        'parking_db_call_duration_seconds', 'Time spent in a Database method', ('method',)))
+    calls = registry.register(Counter(
+        'parking_db_calls_total', 'Database method calls', ('method',)))
+    errors = registry.register(Counter(
+        'parking_db_errors_total', 'Database method calls that raised', ('method',)))
+    rows = registry.register(Counter(
+        'parking_db_rows_total', 'Rows returned by Database methods', ('method',)))
+    commits = registry.register(Counter(
+        'parking_db_commits_total', 'Commits made during Database method calls', ('method',)))
+
+    def wrap(name, method):
+        @wraps(method)
+        def instrumented(*args, **kwargs):
+            commits_before = db.thread_commits
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                duration.observe(time.perf_counter() - started, name)
+                calls.inc(name)
+                committed = db.thread_commits - commits_before
+                if committed:
+                    commits.inc(name, amount=committed)
+            returned = _rows(result)
+            if returned:
+                rows.inc(name, amount=returned)
+            return result
+        return instrumented
+
+    for name, attribute in vars(type(db)).items():
+        if name.startswith('_') or name in UNINSTRUMENTED_METHODS or not callable(attribute):
+            continue
+        setattr(db, name, wrap(name, getattr(db, name)))
+
+
+def track_occupancy(db, registry):
+    """Occupancy gauges per slot type and zone, from the Database's occupancy snapshot at scrape time"""
+    labelnames = ('slot_type', 'zone')
+    total = registry.register(Gauge('parking_spots_total', 'Parking spots', labelnames))
+    available = registry.register(Gauge('parking_spots_available', 'Spots free right now', labelnames))
+    occupied = registry.register(Gauge('parking_spots_occupied', 'Spots with a vehicle parked', labelnames))
+    reserved = registry.register(Gauge(
+        'parking_spots_reserved', 'Spots held for a booking whose vehicle has not arrived', labelnames))
+    fill = registry.register(Gauge(
+        'parking_spots_fill_ratio', 'Share of spots not available (0-1)', labelnames))
+
+    def collect():
+        status = db.get_live_parking_status()
+        total.replace(((slot_type, zone), n) for slot_type, zone, n, _, _, _ in status)
+        available.replace(((slot_type, zone), n or 0) for slot_type, zone, _, n, _, _ in status)
+        occupied.replace(((slot_type, zone), n or 0) for slot_type, zone, _, _, n, _ in status)
+        reserved.replace(((slot_type, zone), n or 0) for slot_type, zone, _, _, _, n in status)
+        fill.replace(((slot_type, zone), (n - (free or 0)) / n if n else 0.0)
+                     for slot_type, zone, n, free, _, _ in status)
+
+    registry.add_collector(collect)
@@ -0,0 +1,132 @@
+"""
+Compact, signed booking tokens for gate QR codes
+
+A token is base32 (upper case, no padding), so the QR code can use the
+dense alphanumeric mode. Decoded, it is:
+
+    version      1 byte   TOKEN_VERSION
+    flags        1 byte   FLAG_PACKED_ID if the booking ID is packed
+    booking_id   6 bytes  packed 'XXXXXXXX-XXX' hex ID, or 1 length byte + UTF-8
+    spot_number  1 length byte + ASCII (length 0: no spot)
+    vehicle_type 1 byte   VEHICLE_TYPE_CODES
+    valid_from   4 bytes  UTC epoch seconds, big-endian
+    valid_until  4 bytes  UTC epoch seconds, big-endian
+    mac          8 bytes  HMAC-SHA256 of everything above, truncated
+
+Gates can check the MAC and the validity window without a database
+lookup. parse_qr() still accepts the older JSON payloads, which carry
+no signature and have to be checked against the database.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import re
+import struct
+from collections import namedtuple
+from datetime import datetime
+
+TOKEN_VERSION = 1
+FLAG_PACKED_ID = 0x01
+MAC_BYTES = 8
+
+VEHICLE_TYPE_CODES = {'bike': 1, 'car': 2}
+VEHICLE_TYPES = {code: vehicle_type for vehicle_type, code in VEHICLE_TYPE_CODES.items()}
+
+# Booking IDs as generated by book(): str(uuid4())[:12].upper()
+PACKED_ID = re.compile(r'[0-9A-F]{8}-[0-9A-F]{3}')
+
+# signed is False for legacy JSON payloads, whose other fields may be None
+QRBooking = namedtuple('QRBooking', 'booking_id spot_number vehicle_type valid_from valid_until signed')
+
+
+class InvalidQRCode(ValueError):
+    """The scanned data is neither a genuine token nor a legacy JSON payload"""
+
+
+def derive_key(secret_key):
+    """Token signing key, kept separate from the session signing key"""
+    if isinstance(secret_key, str):
+        secret_key = secret_key.encode()
+    return hmac.new(secret_key, b'parking-qr-token', hashlib.sha256).digest()
+
+
+def _to_epoch(value):
+    """UTC epoch seconds of a naive local time (a datetime or stored timestamp text)"""
+    return int(datetime.fromisoformat(str(value)).timestamp())
+
+
+def encode_token(key, booking_id, spot_number, vehicle_type, valid_from, valid_until):
+    flags = 0
+    if PACKED_ID.fullmatch(booking_id):
+        flags |= FLAG_PACKED_ID
+        body = int(booking_id.replace('-', ''), 16).to_bytes(6, 'big')
+    else:
+        encoded = booking_id.encode()
+        body = bytes([len(encoded)]) + encoded
+    spot = (spot_number or '').encode('ascii')
+    body += bytes([len(spot)]) + spot
+    body += struct.pack('>BII', VEHICLE_TYPE_CODES[vehicle_type], _to_epoch(valid_from), _to_epoch(valid_until))
+
+    data = bytes([TOKEN_VERSION, flags]) + body
+    mac = hmac.new(key, data, hashlib.sha256).digest()[:MAC_BYTES]
+    return base64.b32encode(data + mac).decode().rstrip('=')
+
+
+def decode_token(key, token):
+    """Verify a token's MAC and unpack it; raises InvalidQRCode"""
+    token = token.strip().upper()
+    try:
+        raw = base64.b32decode(token + '=' * (-len(token) % 8))
+    except ValueError:
+        raise InvalidQRCode('Not a QR token')
+
+    data, mac = raw[:-MAC_BYTES], raw[-MAC_BYTES:]
+    if len(data) < 2 or data[0] != TOKEN_VERSION:
+        raise InvalidQRCode('Unknown QR token version')
+    if not hmac.compare_digest(mac, hmac.new(key, data, hashlib.sha256).digest()[:MAC_BYTES]):
+        raise InvalidQRCode('QR token signature mismatch')
+
+    try:
+        flags, offset = data[1], 2
+        if flags & FLAG_PACKED_ID:
+            digits = f"{int.from_bytes(data[offset:offset + 6], 'big'):011X}"
+            booking_id, offset = f'{digits[:8]}-{digits[8:]}', offset + 6
+        else:
+            length = data[offset]
+            booking_id, offset = data[offset + 1:offset + 1 + length].decode(), offset + 1 + length
+        length = data[offset]
+        spot_number, offset = data[offset + 1:offset + 1 + length].decode('ascii') or None, offset + 1 + length
+        vehicle_code, valid_from, valid_until = struct.unpack_from('>BII', data, offset)
+        if offset + struct.calcsize('>BII') != len(data):
+            raise ValueError('trailing bytes')
+        vehicle_type = VEHICLE_TYPES[vehicle_code]
+    except (IndexError, KeyError, UnicodeDecodeError, struct.error, ValueError):
+        raise InvalidQRCode('Malformed QR token')
+
+    return QRBooking(booking_id, spot_number, vehicle_type,
+                     datetime.fromtimestamp(valid_from), datetime.fromtimestamp(valid_until), True)
+
+
+def parse_qr(key, qr_data):
+    """Read scanner input: a token, a legacy JSON payload, or the JSON already decoded"""
+    if isinstance(qr_data, str) and not qr_data.lstrip().startswith('{'):
+        return decode_token(key, qr_data)
+
+    if isinstance(qr_data, str):
+        try:
+            qr_data = json.loads(qr_data)
+        except ValueError:
+            raise InvalidQRCode('Invalid QR code format')
+    if not isinstance(qr_data, dict) or not qr_data.get('booking_id'):
+        raise InvalidQRCode('Invalid QR code format')
+
+    def optional_time(name):
+        try:
+            return datetime.fromisoformat(qr_data[name]) if qr_data.get(name) else None
+        except (TypeError, ValueError):
+            return None
+
+    return QRBooking(str(qr_data['booking_id']), None, qr_data.get('vehicle_type'),
+                     optional_time('entry_time'), optional_time('exit_time'), False)
@@ -25,9 +25,9 @@ window.addEventListener('click', function(event) {
 });
 
 // Show QR Code
-function showQRCode(qrCodeData) {
+function showQRCode(qrCodeUrl) {
     const qrDisplay = document.getElementById('qrCodeDisplay');
-    qrDisplay.innerHTML = `<img src="data:image/png;base64,${qrCodeData}" alt="QR Code" style="max-width: 300px;">`;
+    qrDisplay.innerHTML = `<img src="${qrCodeUrl}" alt="QR Code" style="max-width: 300px;">`;
     showModal('qrModal');
 }
 
@@ -0,0 +1,27 @@
+"""
+Benchmarks for the parking portal
+
+Standalone scripts, each run as `python benchmarks/<name>.py`:
+
+  connection_pool      connections and commits per request, unpooled vs pooled
+  booking_contention   parallel bookings racing for the last spot
+  query_plans          fails if a hot query falls back to a full table scan
+  reservation_rtree    availability lookups over a large reservation history
+  gate_scan            gate scan latency, legacy sequence vs process_gate_event
+  live_stream          live status change feed fan-out vs polling
+  occupancy_snapshot   live occupancy reads, GROUP BY vs the in-memory snapshot
+  row_cache            user/booking lookups through change_log row caches, another process writing
+  export_stream        fails if a CSV export leaves a formula live; export memory on many gate logs
+
+Load-test suite, run as modules from the repository root:
+
+  python -m benchmarks.seed PATH       seed a database with users, history and live bookings
+  python -m benchmarks.loadtest        drive route mixes and write JSON results
+"""
+
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parallel bookings racing for the last free parking spot
+
+Fills every car spot but one for a time window, then fires concurrent
+bookings for that window from many threads. The legacy pipeline (separate
+availability check, spot lookup and inserts, each on its own sqlite3
+connection and commit, as before book_spot) is run first and is expected
+to double-book, followed by Database.book_spot. The run fails if
+book_spot ever assigns one spot to overlapping bookings.
+
+Usage: python benchmarks/booking_contention.py [threads] [rounds]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import Database  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix='parking-bench-')
+
+
+def booking_for(user_id, entry_time, exit_time, n):
+    return {
+        'booking_id': str(uuid.uuid4())[:12].upper(),
+        'user_id': user_id,
+        'vehicle_number': f'KA01CD{n:04d}',
+        'vehicle_type': 'car',
+        'entry_time': entry_time,
+        'exit_time': exit_time,
+        'amount': 30,
+        'qr_code': None
+    }
+
+
+def legacy_book(db, data):
+    """The pre-book_spot pipeline from app.book(): each step on a fresh sqlite3 connection
+    committing on its own, with the baseline queries, so nothing stops two bookings both
+    seeing the last spot free"""
+    def step(sql, parameters):
+        conn = sqlite3.connect(db.db_path, timeout=30)
+        try:
+            row = conn.execute(sql, parameters).fetchone()
+            conn.commit()
+            return row
+        finally:
+            conn.close()
+
+    entry, exit = data['entry_time'], data['exit_time']
+    total = step("SELECT total_slots FROM parking_slots WHERE slot_type = 'car'", ())[0]
+    occupied = step('''
+        SELECT COUNT(*) FROM bookings
+        WHERE vehicle_type = 'car' AND status IN ('booked', 'active')
+        AND ((entry_time <= ? AND exit_time > ?) OR
+             (entry_time < ? AND exit_time >= ?) OR
+             (entry_time >= ? AND exit_time <= ?))
+    ''', (entry, entry, exit, exit, entry, exit))[0]
+    if total - occupied <= 0:
+        return False
+    spot = step('''
+        SELECT spot_number FROM parking_spots
+        WHERE slot_type = 'car' AND status = 'available'
+        AND spot_number NOT IN (
+            SELECT spot_number FROM slot_reservations
+            WHERE status = 'active'
+            AND ((reserved_from <= ? AND reserved_until > ?) OR
+                 (reserved_from < ? AND reserved_until >= ?) OR
+                 (reserved_from >= ? AND reserved_until <= ?))
+        )
+        ORDER BY zone, spot_number
+        LIMIT 1
+    ''', (entry, entry, exit, exit, entry, exit))
+    if not spot:
+        return False
+    step('''
+        INSERT INTO bookings (booking_id, user_id, vehicle_number, vehicle_type, entry_time, exit_time, amount)
+        VALUES (?, ?, ?, 'car', ?, ?, ?)
+    ''', (data['booking_id'], data['user_id'], data['vehicle_number'], entry, exit, data['amount']))
+    step('''
+        INSERT INTO slot_reservations (booking_id, spot_number, reserved_from, reserved_until)
+        VALUES (?, ?, ?, ?)
+    ''', (data['booking_id'], spot[0], entry, exit))
+    step('''
+        UPDATE parking_spots
+        SET is_reserved = 1, current_booking_id = ?, occupied_from = ?, occupied_until = ?
+        WHERE spot_number = ?
+    ''', (data['booking_id'], entry, exit, spot[0]))
+    step('''
+        INSERT INTO transactions (transaction_id, user_id, booking_id, transaction_type,
+                                  parking_amount, total_amount)
+        VALUES (?, ?, ?, 'booking', ?, ?)
+    ''', (str(uuid.uuid4())[:16].upper(), data['user_id'], data['booking_id'], data['amount'], data['amount']))
+    return True
+
+
+def unit_of_work_book(db, data):
+    return db.book_spot(data)['spot_number'] is not None
+
+
+def double_assignments(db):
+    """Count pairs of active reservations that share a spot and overlap in time"""
+    with db.connection() as conn:
+        return conn.execute('''
+            SELECT COUNT(*) FROM slot_reservations a
+            JOIN slot_reservations b
+              ON a.spot_number = b.spot_number AND a.id < b.id
+            WHERE a.status = 'active' AND b.status = 'active'
+              AND a.reserved_from < b.reserved_until AND b.reserved_from < a.reserved_until
+        ''').fetchone()[0]
+
+
+def run_round(book, threads, round_no):
+    db = Database(os.path.join(TMP_DIR, f'{book.__name__}-{round_no}.db'))
+    user_id = db.create_user({
+        'name': 'Bench User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'bench@example.edu'
+    })
+    entry = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+    exit = entry + timedelta(hours=2)
+
+    with db.connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM parking_spots WHERE slot_type = 'car'").fetchone()[0]
+    for n in range(total - 1):
+        db.book_spot(booking_for(user_id, entry, exit, n))
+
+    barrier = threading.Barrier(threads)
+    wins = []
+
+    def contender(n):
+        data = booking_for(user_id, entry, exit, 1000 + n)
+        barrier.wait()
+        if book(db, data):
+            wins.append(n)
+
+    workers = [threading.Thread(target=contender, args=(n,)) for n in range(threads)]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - began
+
+    doubles = double_assignments(db)
+    db.close()
+    return len(wins), doubles, elapsed
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    print(f"🏁 {threads} parallel bookings for the last free car spot, {rounds} rounds\n")
+
+    failed = False
+    for book in (legacy_book, unit_of_work_book):
+        winners = doubles = 0
+        elapsed = 0.0
+        for round_no in range(rounds):
+            w, d, e = run_round(book, threads, round_no)
+            winners += w
+            doubles += d
+            elapsed += e
+        print(f"{book.__name__:<20} bookings granted: {winners:>4} (expected {rounds})  "
+              f"double assignments: {doubles:>4}  mean round: {elapsed / rounds * 1000:.1f} ms")
+        if book is unit_of_work_book and (winners != rounds or doubles):
+            failed = True
+
+    if failed:
+        print("\n❌ book_spot granted the last spot more than once")
+        sys.exit(1)
+    print("\n✅ book_spot granted the last spot exactly once per round")
+
+
+if __name__ == "__main__":
+    main()
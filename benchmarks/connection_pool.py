@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SQLite connections opened per request, unpooled vs pooled Database
+
+Drives /book, /dashboard and /admin/verify_qr through the Flask test client
+against a throwaway database and reports connections opened, commits and
+mean latency per request.
+
+Usage: python benchmarks/connection_pool.py [requests_per_route]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+
+TMP_DIR = tempfile.mkdtemp(prefix='parking-bench-')
+os.environ['PARKING_DB_PATH'] = os.path.join(TMP_DIR, 'import.db')
+
+import app as parking_app  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def run_scenario(pooled, iterations):
+    db_path = os.path.join(TMP_DIR, f'{"pooled" if pooled else "unpooled"}.db')
+    db = Database(db_path, pooled=pooled)
+    parking_app.db = db
+
+    user_id = db.create_user({
+        'name': 'Bench User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'bench@example.edu'
+    })
+    admin = db.authenticate_admin('admin', 'admin123')
+    client = parking_app.app.test_client()
+
+    results = {}
+    start = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=5)
+    booking_ids = []
+
+    def measure(route, call):
+        opened, commits = db.connections_opened, db.commits
+        began = time.perf_counter()
+        for i in range(iterations):
+            call(i)
+        elapsed = time.perf_counter() - began
+        results[route] = {
+            'connections_per_request': (db.connections_opened - opened) / iterations,
+            'commits_per_request': (db.commits - commits) / iterations,
+            'mean_ms': elapsed / iterations * 1000,
+        }
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['user_name'] = 'Bench User'
+
+    def book(i):
+        # One-hour slots spread over the day so every booking finds a spot
+        entry = start + timedelta(hours=i % 20, days=i // 20)
+        client.post('/book', data={
+            'vehicle_type': 'car',
+            'vehicle_number': f'KA01AB{i:04d}',
+            'entry_time': entry.strftime('%Y-%m-%dT%H:%M'),
+            'exit_time': (entry + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M'),
+        })
+
+    measure('POST /book', book)
+    measure('GET /dashboard', lambda i: client.get('/dashboard'))
+
+    with db.connection() as conn:
+        booking_ids = [row[0] for row in conn.execute('SELECT booking_id FROM bookings')]
+
+    with client.session_transaction() as sess:
+        sess['is_admin'] = True
+        sess['admin_id'] = admin['admin_id']
+        sess['admin_name'] = admin['name']
+        sess['admin_role'] = admin['role']
+
+    def verify(i):
+        client.post('/admin/verify_qr', json={
+            'qr_data': json.dumps({'booking_id': booking_ids[i % len(booking_ids)]}),
+            'action_type': 'entry',
+        })
+
+    measure('POST /admin/verify_qr', verify)
+    db.close()
+    return results
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"🔬 Connection pool benchmark ({iterations} requests per route)\n")
+
+    before = run_scenario(pooled=False, iterations=iterations)
+    after = run_scenario(pooled=True, iterations=iterations)
+
+    print(f"{'route':<24}{'conns/req':>22}{'commits/req':>22}{'mean ms':>22}")
+    print(f"{'':<24}{'before → after':>22}{'before → after':>22}{'before → after':>22}")
+    for route in before:
+        b, a = before[route], after[route]
+        print(f"{route:<24}"
+              f"{b['connections_per_request']:>11.2f} → {a['connections_per_request']:<8.2f}"
+              f"{b['commits_per_request']:>11.2f} → {a['commits_per_request']:<8.2f}"
+              f"{b['mean_ms']:>11.2f} → {a['mean_ms']:<8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Check: streamed exports are safe to open in a spreadsheet and stay in constant memory
+
+Books a spot for a vehicle number of =HYPERLINK(...) in a throwaway
+database and exports bookings as CSV and NDJSON: the CSV cell must be
+prefixed with ' so that a spreadsheet shows it as text, the NDJSON value
+must be left as stored and the gzipped CSV must decompress to the plain
+one. Then adds [logs] gate log rows and reports the peak Python memory of
+a gzipped CSV export of them. Exits non-zero if a check fails.
+
+Usage: python benchmarks/export_stream.py [logs]
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import EXPORTS, Database  # noqa: E402
+import exports  # noqa: E402
+
+FORMULA = '=HYPERLINK("http://example.com/x","KA01")'
+
+
+def export(db, kind, fmt, gzip_it=False):
+    chunks = exports.encode(EXPORTS[kind].columns, db.export_rows(kind), fmt)
+    if gzip_it:
+        return gzip.decompress(b''.join(exports.gzipped(chunks))).decode()
+    return ''.join(chunks)
+
+
+def main():
+    logs = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    db = Database(os.path.join(tempfile.mkdtemp(prefix='parking-export-'), 'export.db'))
+    user_id = db.create_user({
+        'name': 'Export User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'export@example.edu'
+    })
+    entry = datetime.now().replace(second=0, microsecond=0) + timedelta(hours=1)
+    booking_id = db.book_spot({
+        'booking_id': 'EXPORT-0001', 'user_id': user_id, 'vehicle_number': FORMULA,
+        'vehicle_type': 'car', 'entry_time': entry, 'exit_time': entry + timedelta(hours=1),
+        'amount': 30, 'qr_code': None
+    })['booking_id']
+
+    failures = []
+    text = export(db, 'bookings', 'csv')
+    row = list(csv.DictReader(io.StringIO(text)))[0]
+    if row['vehicle_number'] != "'" + FORMULA:
+        failures.append(f"CSV vehicle_number {row['vehicle_number']!r} would run as a formula")
+    if row['amount'] != '30':
+        failures.append(f"CSV amount {row['amount']!r} should be left as a number")
+    if json.loads(export(db, 'bookings', 'ndjson'))['vehicle_number'] != FORMULA:
+        failures.append('NDJSON vehicle_number was altered')
+    if export(db, 'bookings', 'csv', gzip_it=True) != text:
+        failures.append('gzipped CSV differs from the plain CSV')
+    print(f"{'❌' if failures else '✅'} formula-like cells exported as text")
+
+    admin_id = db.authenticate_admin('admin', 'admin123')['admin_id']
+    with db.connection() as conn:
+        conn.executemany('INSERT INTO entry_exit_logs (booking_id, action_type, verified_by) VALUES (?, ?, ?)',
+                         ((booking_id, ('entry', 'exit')[n % 2], admin_id) for n in range(logs)))
+    tracemalloc.start()
+    size = sum(len(chunk) for chunk in exports.gzipped(
+        exports.encode(EXPORTS['logs'].columns, db.export_rows('logs'), 'csv')))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"📦 {logs} gate logs: {size / 1024:.0f} KiB gzipped CSV, peak {peak / 1024:.0f} KiB of Python memory")
+    db.close()
+
+    for failure in failures:
+        print(f"   {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
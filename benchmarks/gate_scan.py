@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark: gate scan latency, legacy verify_qr sequence vs process_gate_event
+
+Books every spot for a window starting now, then has several gates scan
+all the cars in (each code scanned twice, as happens when a driver
+re-presents it) and back out again. The legacy sequence is the one
+/admin/verify_qr used to run: verify_qr_booking, check_duplicate_entry_exit
+(twice on exit) and record_entry_exit, each its own unit of work. It is
+compared with Database.process_gate_event, which does all of it in one
+transaction, called directly and queued on a GroupCommitWriter (one
+writer thread, many scans per commit). Reports p50/p99 latency per scan,
+SQL statements and commits per scan, duplicate log rows and scans per
+group commit. The run fails if process_gate_event ever records a scan
+twice.
+
+Each gate pauses between scans (default 5 ms, i.e. 200 scans/s per gate,
+far above a real lane). With no pause at all, the gates just queue for
+SQLite's single writer, and p99 measures that queue rather than a scan;
+that gate rush is where group commit pays off.
+
+Usage: python benchmarks/gate_scan.py [gates] [rounds] [pause_ms]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import GATE_ENTRY_GRACE, Database, GroupCommitWriter  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix='parking-bench-')
+
+
+def legacy_scan(db, booking_id, action_type, admin_id, now):
+    """The pre-process_gate_event sequence from /admin/verify_qr"""
+    booking_info = db.verify_qr_booking(booking_id)
+    if not booking_info:
+        return False
+    if db.check_duplicate_entry_exit(booking_id, action_type):
+        return False
+    if action_type == 'entry':
+        if now < datetime.fromisoformat(booking_info['entry_time']) - GATE_ENTRY_GRACE:
+            return False
+    elif not db.check_duplicate_entry_exit(booking_id, 'entry'):
+        return False
+    return db.record_entry_exit(booking_id, action_type, admin_id, booking_info['spot_number'])
+
+
+def fused_scan(db, booking_id, action_type, admin_id, now):
+    return db.process_gate_event(booking_id, action_type, admin_id, now).success
+
+
+WRITERS = {}  # Database -> its GroupCommitWriter, for grouped_scan
+
+
+def grouped_scan(db, booking_id, action_type, admin_id, now):
+    """process_gate_event queued on a GroupCommitWriter, as with PARKING_GROUP_COMMIT_MS set"""
+    return WRITERS[db].submit(db.process_gate_event, booking_id, action_type, admin_id, now).result().success
+
+
+def set_trace(db, callback):
+    with db.connection() as conn:
+        conn.set_trace_callback(callback)
+
+
+def seed_round(db, user_id, round_no):
+    """Book every spot from now; returns the booking IDs"""
+    entry = datetime.now().replace(second=0, microsecond=0)
+    booking_ids = []
+    for vehicle_type in ('car', 'bike'):
+        with db.connection() as conn:
+            total = conn.execute('SELECT COUNT(*) FROM parking_spots WHERE slot_type = ?',
+                                 (vehicle_type,)).fetchone()[0]
+        for n in range(total):
+            result = db.book_spot({
+                'booking_id': str(uuid.uuid4())[:12].upper(), 'user_id': user_id,
+                'vehicle_number': f'KA01GS{round_no:02d}{n:02d}', 'vehicle_type': vehicle_type,
+                'entry_time': entry, 'exit_time': entry + timedelta(hours=2), 'amount': 30, 'qr_code': None
+            })
+            booking_ids.append(result['booking_id'])
+    return booking_ids
+
+
+def run_gates(scan, db, admin_id, booking_ids, action_type, gates, pause):
+    """Every gate takes its share of the cars; each code is scanned twice. Returns latencies in ms."""
+    scans = [booking_id for booking_id in booking_ids for _ in range(2)]
+    barrier = threading.Barrier(gates)
+    latencies = []
+    lock = threading.Lock()
+
+    def gate(n):
+        mine = []
+        barrier.wait()
+        for booking_id in scans[n::gates]:
+            started = time.perf_counter()
+            scan(db, booking_id, action_type, admin_id, datetime.now())
+            mine.append((time.perf_counter() - started) * 1000)
+            time.sleep(pause)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=gate, args=(n,)) for n in range(gates)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies
+
+
+def run(scan, gates, rounds, pause):
+    db = Database(os.path.join(TMP_DIR, f'{scan.__name__}.db'))
+    WRITERS[db] = GroupCommitWriter(db)
+    user_id = db.create_user({
+        'name': 'Bench User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'bench@example.edu'
+    })
+    admin_id = db.authenticate_admin('admin', 'admin123')['admin_id']
+
+    latencies = []
+    commits = scans = 0
+    for round_no in range(rounds):
+        booking_ids = seed_round(db, user_id, round_no)
+        commits_before = db.commits
+        for action_type in ('entry', 'exit'):
+            latencies += run_gates(scan, db, admin_id, booking_ids, action_type, gates, pause)
+        commits += db.commits - commits_before
+        scans += 4 * len(booking_ids)
+
+    # Statements per scan, traced on a single-threaded pass (one scan per code)
+    statements = []
+    booking_ids = seed_round(db, user_id, rounds)
+    # Grouped scans run on the writer thread's connection
+    trace = (lambda callback: WRITERS[db].submit(set_trace, db, callback).result()) if scan is grouped_scan \
+        else (lambda callback: set_trace(db, callback))
+    trace(statements.append)
+    for action_type in ('entry', 'exit'):
+        for booking_id in booking_ids:
+            scan(db, booking_id, action_type, admin_id, datetime.now())
+    trace(None)
+    statements_per_scan = len(statements) / (2 * len(booking_ids))
+
+    with db.connection() as conn:
+        duplicates = conn.execute('''
+            SELECT COALESCE(SUM(n - 1), 0) FROM (
+                SELECT COUNT(*) AS n FROM entry_exit_logs GROUP BY booking_id, action_type
+            )
+        ''').fetchone()[0]
+    writer = WRITERS.pop(db)
+    batch = writer.calls / max(1, writer.batches)
+    writer.close()
+    db.close()
+
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies),
+        'p99': latencies[int(len(latencies) * 0.99) - 1],
+        'statements': statements_per_scan,
+        'commits': commits / scans,
+        'duplicates': duplicates,
+        'batch': batch if scan is grouped_scan else 1,
+    }
+
+
+def main():
+    gates = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    pause_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f"🚧 {gates} gates scanning every car in and out (each code twice, {pause_ms:g} ms apart), "
+          f"{rounds} rounds\n")
+    print(f"{'path':<14}{'p50 ms':>10}{'p99 ms':>10}{'stmts/scan':>12}{'commits/scan':>14}{'duplicates':>12}"
+          f"{'batch':>8}")
+
+    results = {}
+    for scan in (legacy_scan, fused_scan, grouped_scan):
+        results[scan] = r = run(scan, gates, rounds, pause_ms / 1000)
+        print(f"{scan.__name__:<14}{r['p50']:>10.2f}{r['p99']:>10.2f}{r['statements']:>12.1f}"
+              f"{r['commits']:>14.2f}{r['duplicates']:>12}{r['batch']:>8.1f}")
+
+    if results[fused_scan]['duplicates'] or results[grouped_scan]['duplicates']:
+        print("\n❌ process_gate_event recorded a scan more than once")
+        sys.exit(1)
+    print("\n✅ process_gate_event recorded every scan exactly once, directly and group-committed")
+
+
+if __name__ == "__main__":
+    main()
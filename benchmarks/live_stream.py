@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: live status updates, change feed fan-out vs polling
+
+Opens N listeners on Database.spot_feed (what /api/live_status/stream
+serves) and makes spot changes: bookings, gate entries and exits. Reports
+how long each change takes to reach every listener and how many SQL
+statements the listeners cost (none: they only wait on the feed). It then
+has N clients poll once, as live_slots.html did every 30 seconds
+(get_live_parking_status + get_all_spots_with_status), to show what one
+refresh round costs.
+
+Usage: python benchmarks/live_stream.py [listeners] [changes]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import Database  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix='parking-bench-')
+
+
+def main():
+    listeners = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    db = Database(os.path.join(TMP_DIR, 'live_stream.db'))
+    user_id = db.create_user({
+        'name': 'Bench User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'bench@example.edu'
+    })
+    admin_id = db.authenticate_admin('admin', 'admin123')['admin_id']
+    position = db.spot_feed.position()
+
+    # event id -> when each listener received it
+    received = {}
+    lock = threading.Lock()
+    ready = threading.Barrier(listeners + 1)
+    statements = []
+
+    def listen():
+        stream = db.spot_feed.listen(position, heartbeat=1)
+        ready.wait()
+        seen = 0
+        for events in stream:
+            now = time.perf_counter()
+            with lock:
+                for event_id, _ in events:
+                    received.setdefault(event_id, []).append(now)
+            seen += len(events)
+            if seen >= expected[0]:
+                return
+
+    expected = [float('inf')]
+    threads = [threading.Thread(target=listen, daemon=True) for _ in range(listeners)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+
+    print(f"📡 {listeners} listeners, {changes} spot changes\n")
+    entry = datetime.now().replace(second=0, microsecond=0)
+    events_before = int(db.spot_feed.position().rsplit('-', 1)[1])
+    with db.connection() as conn:
+        conn.set_trace_callback(statements.append)
+    for n in range(changes // 3):
+        result = db.book_spot({
+            'booking_id': str(uuid.uuid4())[:12].upper(), 'user_id': user_id,
+            'vehicle_number': f'KA01LS{n:04d}', 'vehicle_type': 'car' if n % 2 else 'bike',
+            'entry_time': entry, 'exit_time': entry + timedelta(hours=2), 'amount': 30
+        })
+        if not result['spot_number']:
+            break
+        for action_type in ('entry', 'exit'):
+            db.process_gate_event(result['booking_id'], action_type, admin_id)
+        time.sleep(0.01)
+    with db.connection() as conn:
+        conn.set_trace_callback(None)
+
+    published_events = int(db.spot_feed.position().rsplit('-', 1)[1]) - events_before
+    expected[0] = published_events
+    deadline = time.monotonic() + 10
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+
+    # Fan-out latency: from the first to the last listener receiving each event
+    spreads = sorted((max(times) - min(times)) * 1000 for times in received.values())
+    delivered = sum(len(times) for times in received.values())
+    print(f"{'feed':<10}{published_events:>4} events, {delivered} deliveries "
+          f"({delivered / max(1, published_events):.0f} per event)")
+    if spreads:
+        print(f"{'':<10}fan-out p50 {statistics.median(spreads):.2f} ms, "
+              f"p99 {spreads[int(len(spreads) * 0.99) - 1]:.2f} ms")
+    print(f"{'':<10}{len(statements)} statements by the writer, 0 by listeners "
+          f"(the feed's watcher reads one row a second)")
+
+    # One polling round, every client at once
+    barrier = threading.Barrier(listeners)
+    poll_statements = []
+
+    def poll():
+        with db.connection() as conn:
+            conn.set_trace_callback(poll_statements.append)
+            barrier.wait()
+            db.get_live_parking_status()
+            db.get_all_spots_with_status()
+            conn.set_trace_callback(None)
+
+    started = time.perf_counter()
+    pollers = [threading.Thread(target=poll) for _ in range(listeners)]
+    for thread in pollers:
+        thread.start()
+    for thread in pollers:
+        thread.join()
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"{'polling':<10}one refresh round: {len(poll_statements)} statements, {elapsed:.0f} ms, "
+          f"every 30 s whether or not anything changed")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+Load test: realistic route mixes against the parking portal
+
+Seeds a throwaway database (see benchmarks.seed), then drives scenarios
+from several client threads, each logged in as a user and as the admin:
+
+  live_status     a fan of clients polling GET /api/live_status
+  mixed           dashboard, my_spot, transactions, QR images, availability checks, bookings
+  booking_storm   GET /check_availability then POST /book for random upcoming windows
+  gate_burst      every live booking scanned in, re-scanned, then scanned out (POST /admin/verify_qr)
+
+Requests go through the Flask test client in this process, or with
+--gunicorn N over HTTP to a local gunicorn with N workers. For every route
+it reports p50/p95/p99 latency and requests per second. In-process runs
+also report SQLite statements and commits per request, as seen by each
+thread's connection (statements run by triggers are included). Results
+can be written as JSON (--json) and compared with an earlier run
+(--compare).
+
+Usage: python -m benchmarks.loadtest [--scenario NAME ...] [--threads N] [--requests N]
+                                     [--users N] [--history N] [--gunicorn WORKERS]
+                                     [--json PATH] [--compare BASELINE.json]
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from benchmarks import APP_DIR
+from benchmarks.seed import ADMIN_PASSWORD, ADMIN_USERNAME, seed
+from database import Database
+
+SCENARIOS = ('live_status', 'mixed', 'booking_storm', 'gate_burst')
+
+# label is the route as reported; form and body are sent as form fields and as JSON
+Request = namedtuple('Request', 'label method path form body')
+Sample = namedtuple('Sample', 'label ms status statements commits')
+
+
+def get(label, path):
+    return Request(label, 'GET', path, None, None)
+
+
+def booking_form(rng):
+    entry = (datetime.now() + timedelta(days=rng.randint(1, 30))).replace(
+        hour=rng.randint(6, 20), minute=0, second=0, microsecond=0)
+    exit = entry + timedelta(hours=rng.randint(1, 4))
+    return {'vehicle_type': rng.choice(('car', 'bike')), 'vehicle_number': f'KA01LB{rng.randint(0, 9999):04d}',
+            'entry_time': entry.strftime('%Y-%m-%dT%H:%M'), 'exit_time': exit.strftime('%Y-%m-%dT%H:%M')}
+
+
+def availability_request(form):
+    query = urllib.parse.urlencode({'vehicle_type': form['vehicle_type'],
+                                    'entry_time': form['entry_time'], 'exit_time': form['exit_time']})
+    return get('GET /check_availability', f'/check_availability?{query}')
+
+
+# Each scenario returns a list of sequences; a sequence runs in order on one client thread
+
+def live_status_scenario(fixture, rng, requests):
+    paths = ['/api/live_status'] * 6 + ['/api/live_status?type=car', '/api/live_status?type=bike']
+    return [[get('GET /api/live_status', rng.choice(paths))] for _ in range(requests)]
+
+
+def mixed_scenario(fixture, rng, requests):
+    live = fixture['live_bookings']
+    mix = [
+        (25, lambda: [get('GET /dashboard', '/dashboard')]),
+        (10, lambda: [get('GET /my_spot', '/my_spot')]),
+        (10, lambda: [get('GET /transactions', '/transactions')]),
+        (20, lambda: [get('GET /api/live_status', '/api/live_status')]),
+        (10, lambda: [get('GET /qr/<booking_id>.png', f'/qr/{rng.choice(live)}.png')] if live else []),
+        (15, lambda: [availability_request(booking_form(rng))]),
+        (10, lambda: [Request('POST /book', 'POST', '/book', booking_form(rng), None)]),
+    ]
+    weights = [weight for weight, _ in mix]
+    makers = [make for _, make in mix]
+    return [rng.choices(makers, weights)[0]() for _ in range(requests)]
+
+
+def booking_storm_scenario(fixture, rng, requests):
+    sequences = []
+    for _ in range(requests // 2):
+        form = booking_form(rng)
+        sequences.append([availability_request(form), Request('POST /book', 'POST', '/book', form, None)])
+    return sequences
+
+
+def gate_burst_scenario(fixture, rng, requests):
+    """Ignores requests: three scans per live booking"""
+    def scan(token, action_type):
+        return Request('POST /admin/verify_qr', 'POST', '/admin/verify_qr', None,
+                       {'qr_data': token, 'action_type': action_type})
+    return [[scan(token, 'entry'), scan(token, 'entry'), scan(token, 'exit')] for token in fixture['tokens']]
+
+
+SCENARIO_BUILDERS = {
+    'live_status': live_status_scenario,
+    'mixed': mixed_scenario,
+    'booking_storm': booking_storm_scenario,
+    'gate_burst': gate_burst_scenario,
+}
+
+
+class InProcessClient:
+    """Flask test client; counts the SQLite statements and commits of the calling thread"""
+
+    def __init__(self, flask_app, db):
+        self.client = flask_app.test_client()
+        self.db = db
+        self.statements = 0
+        self.commits = 0
+
+    def _trace(self, sql):
+        if sql.startswith('--'):  # virtual table internals
+            return
+        self.statements += 1
+        if sql == 'COMMIT':
+            self.commits += 1
+
+    def start_counting(self):
+        with self.db.connection() as conn:
+            conn.set_trace_callback(self._trace)
+
+    def stop_counting(self):
+        with self.db.connection() as conn:
+            conn.set_trace_callback(None)
+
+    def send(self, method, path, form=None, body=None):
+        return self.client.open(path, method=method, data=form, json=body).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPClient:
+    """Cookie-keeping HTTP client for a running server; SQLite counters are not available"""
+
+    statements = None
+    commits = None
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+
+    def start_counting(self):
+        pass
+
+    def stop_counting(self):
+        pass
+
+    def send(self, method, path, form=None, body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def run_scenario(make_client, fixture, sequences, threads):
+    """Run the sequences round-robin over client threads; returns (samples, elapsed seconds)"""
+    barrier = threading.Barrier(threads + 1)
+    samples = []
+    lock = threading.Lock()
+
+    def worker(n):
+        client = make_client()
+        client.send('POST', '/login', {'user_id': fixture['users'][n % len(fixture['users'])]})
+        client.send('POST', '/admin/login', {'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+        client.start_counting()
+        mine = []
+        barrier.wait()
+        for sequence in sequences[n::threads]:
+            for request in sequence:
+                statements, commits = client.statements, client.commits
+                started = time.perf_counter()
+                status = client.send(request.method, request.path, request.form, request.body)
+                ms = (time.perf_counter() - started) * 1000
+                mine.append(Sample(request.label, ms, status,
+                                   None if statements is None else client.statements - statements,
+                                   None if commits is None else client.commits - commits))
+        client.stop_counting()
+        with lock:
+            samples.extend(mine)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for w in workers:
+        w.join()
+    return samples, time.perf_counter() - started
+
+
+def percentile(ordered, fraction):
+    return ordered[max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(samples, elapsed):
+    by_route = {}
+    for sample in samples:
+        by_route.setdefault(sample.label, []).append(sample)
+
+    routes = {}
+    for label, route_samples in sorted(by_route.items()):
+        latencies = sorted(s.ms for s in route_samples)
+        counted = [s for s in route_samples if s.statements is not None]
+        routes[label] = {
+            'requests': len(route_samples),
+            'errors': sum(s.status >= 400 for s in route_samples),
+            'rps': len(route_samples) / elapsed,
+            'mean_ms': sum(latencies) / len(latencies),
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'statements_per_request': sum(s.statements for s in counted) / len(counted) if counted else None,
+            'commits_per_request': sum(s.commits for s in counted) / len(counted) if counted else None,
+        }
+    return {'requests': len(samples), 'elapsed_s': elapsed, 'rps': len(samples) / elapsed, 'routes': routes}
+
+
+def print_summary(name, summary):
+    print(f"\n📊 {name}: {summary['requests']} requests in {summary['elapsed_s']:.2f}s "
+          f"({summary['rps']:.0f} req/s)")
+    print(f"   {'route':<30}{'reqs':>7}{'errs':>6}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'stmts':>8}{'commits':>9}")
+    for label, r in summary['routes'].items():
+        statements = '-' if r['statements_per_request'] is None else f"{r['statements_per_request']:.1f}"
+        commits = '-' if r['commits_per_request'] is None else f"{r['commits_per_request']:.2f}"
+        print(f"   {label:<30}{r['requests']:>7}{r['errors']:>6}{r['rps']:>8.0f}{r['p50_ms']:>9.2f}"
+              f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{statements:>8}{commits:>9}")
+
+
+def print_comparison(baseline, results):
+    print(f"\n🔁 Compared with {baseline.get('git_commit') or 'baseline'}")
+    print(f"   {'scenario / route':<45}{'p99 ms before → after':>26}{'req/s before → after':>26}")
+    for name, summary in results['scenarios'].items():
+        before_routes = baseline.get('scenarios', {}).get(name, {}).get('routes', {})
+        for label, after in summary['routes'].items():
+            before = before_routes.get(label)
+            if not before:
+                continue
+            print(f"   {name + ' ' + label:<45}{before['p99_ms']:>12.2f} → {after['p99_ms']:<11.2f}"
+                  f"{before['rps']:>12.0f} → {after['rps']:<11.0f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def gunicorn_server(db_path, workers):
+    """A local gunicorn serving app:app against db_path; yields its base URL"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=APP_DIR, env={**os.environ, 'PARKING_DB_PATH': db_path},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start (is it installed?)')
+                time.sleep(0.1)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the parking portal routes')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run (repeatable; default: all)')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario (gate_burst: 3 per live booking)')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=20000, help='completed bookings to seed')
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help='serve over HTTP from a local gunicorn')
+    parser.add_argument('--json', metavar='PATH', help='write results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results of an earlier run')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    scenarios = args.scenario or list(SCENARIOS)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='parking-load-'), 'load.db')
+    seeding_db = Database(db_path)
+    fixture = seed(seeding_db, users=args.users, history=args.history, rng=random.Random(args.seed))
+    seeding_db.close()
+
+    os.environ['PARKING_DB_PATH'] = db_path
+    import app as parking_app
+    fixture['tokens'] = [parking_app.qr_payload(*parking_app.db.get_qr_booking(booking_id))
+                         for booking_id in fixture['live_bookings']]
+
+    mode = f'gunicorn:{args.gunicorn}' if args.gunicorn else 'in-process'
+    print(f"🚦 {mode}, {args.threads} client threads, {args.users} users, {args.history} past bookings")
+
+    results = {'git_commit': git_commit(), 'created_at': datetime.now().isoformat(timespec='seconds'),
+               'mode': mode, 'config': vars(args), 'scenarios': {}}
+    with (gunicorn_server(db_path, args.gunicorn) if args.gunicorn else _in_process()) as base_url:
+        if base_url:
+            def make_client():
+                return HTTPClient(base_url)
+        else:
+            def make_client():
+                return InProcessClient(parking_app.app, parking_app.db)
+
+        rng = random.Random(args.seed)
+        for name in scenarios:
+            sequences = SCENARIO_BUILDERS[name](fixture, rng, args.requests)
+            samples, elapsed = run_scenario(make_client, fixture, sequences, args.threads)
+            results['scenarios'][name] = summary = summarize(samples, elapsed)
+            print_summary(name, summary)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+@contextmanager
+def _in_process():
+    yield None
+
+
+if __name__ == "__main__":
+    main()
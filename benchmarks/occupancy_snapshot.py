@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark: live occupancy reads, GROUP BY over parking_spots vs the snapshot
+
+Seeds a database (live bookings hold every spot) and reads occupancy per
+slot type and zone the way get_live_parking_status used to, with a
+GROUP BY over parking_spots, and through the in-memory occupancy
+snapshot it now serves. Reads are timed three ways: with no writes, with
+this process changing spots between reads (the snapshot is updated in
+place), and with a second Database on the same file (standing in for
+another gunicorn worker) changing spots between reads (the snapshot
+notices via PRAGMA data_version and reloads). The run fails if the two
+ever disagree.
+
+Usage: python benchmarks/occupancy_snapshot.py [reads]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.seed import ADMIN_PASSWORD, ADMIN_USERNAME, seed  # noqa: E402
+from database import Database  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix='parking-bench-')
+
+GROUP_BY_SQL = '''
+    SELECT
+        slot_type,
+        zone,
+        COUNT(*) as total_spots,
+        SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END) as available,
+        SUM(CASE WHEN status = 'occupied' THEN 1 ELSE 0 END) as occupied,
+        SUM(CASE WHEN is_reserved = 1 AND is_occupied = 0 THEN 1 ELSE 0 END) as reserved
+    FROM parking_spots
+    GROUP BY slot_type, zone
+    ORDER BY slot_type, zone
+'''
+
+
+def group_by(db):
+    with db.connection() as conn:
+        return conn.execute(GROUP_BY_SQL).fetchall()
+
+
+def timed(read, reads, between=None):
+    """Per-read latencies in microseconds; between() runs untimed before each read"""
+    latencies = []
+    for n in range(reads):
+        if between:
+            between(n)
+        started = time.perf_counter()
+        read()
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return latencies
+
+
+def report(label, latencies):
+    latencies.sort()
+    print(f"{label:<32}p50 {statistics.median(latencies):8.1f} µs   "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:8.1f} µs")
+
+
+def main():
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    path = os.path.join(TMP_DIR, 'occupancy.db')
+    db = Database(path)
+    live = seed(db, users=50, history=500)['live_bookings']
+    other = Database(path)
+    admin_id = db.authenticate_admin(ADMIN_USERNAME, ADMIN_PASSWORD)['admin_id']
+
+    print(f"📊 {reads} occupancy reads\n")
+    for label, read in (('GROUP BY', lambda: group_by(db)), ('snapshot', db.get_live_parking_status)):
+        report(f'{label}, no writes', timed(read, reads))
+
+    # Every car is scanned in, then out; the runs share the sequence
+    scans = iter([(booking_id, 'entry') for booking_id in live] + [(booking_id, 'exit') for booking_id in live])
+
+    def changer(writer):
+        def change(n):
+            # The previous read has caught up with the previous change by now
+            assert db.get_live_parking_status() == group_by(db), 'snapshot disagrees with parking_spots'
+            booking_id, action_type = next(scans)
+            writer.process_gate_event(booking_id, action_type, admin_id)
+        return change
+
+    changes = min(reads, len(live) // 2)
+    for label, writer in (('this process', db), ('other process', other)):
+        report(f'GROUP BY, {label} writes', timed(lambda: group_by(db), changes, changer(writer)))
+        report(f'snapshot, {label} writes', timed(db.get_live_parking_status, changes, changer(writer)))
+    other.close()
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Check that the hot Database queries are answered from an index
+
+Calls each hot-path Database method against a freshly migrated throwaway
+database, captures the SQL it runs (and builds each date-range export's
+query) and checks the EXPLAIN QUERY PLAN output: every table access must
+be an index SEARCH, never a full SCAN, apart from the fixed-size
+configuration tables and the FULL_LOADS that read a whole table on
+purpose. Exits non-zero if any plan regresses.
+
+Usage: python benchmarks/query_plans.py
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import EXPORTS, Database  # noqa: E402
+
+# Tables with a fixed handful of rows, where a scan is cheaper than an index
+SMALL_TABLES = {'parking_slots', 'schema_version'}
+
+# hot_queries() labels that read a whole table on purpose, and the table they may scan.
+# parking_spots grows with every lot, so any other scan of it fails the check.
+FULL_LOADS = {'spot index reload': 'parking_spots'}
+
+# Partial indexes holding only live rows, where walking the whole index is intended
+PARTIAL_INDEXES = {'idx_bookings_live'}
+
+# Indexes walked in ORDER BY order under a LIMIT, where the scan stops after one page
+PAGED_INDEXES = {'idx_entry_exit_logs_time'}
+
+
+def hot_queries(db, rtree_db, user_id, booking_id, admin_id):
+    """(label, database, callable) triples for every hot-path query"""
+    entry = datetime.now().replace(second=0, microsecond=0)
+    exit = entry + timedelta(hours=2)
+    return [
+        ('check_slot_availability', db, lambda: db.check_slot_availability('car', entry, exit)),
+        ('find_available_spot', db, lambda: db.find_available_spot('car', entry, exit)),
+        ('availability index reload', db, lambda: (db._invalidate_availability(),
+                                                   db.check_slot_availability('car', entry, exit))),
+        ('spot index reload', db, lambda: (db._invalidate_spot_index(),
+                                           db.find_available_spot('car', entry, exit))),
+        ('check_slot_availability [rtree]', rtree_db, lambda: rtree_db.check_slot_availability('car', entry, exit)),
+        ('find_available_spot [rtree]', rtree_db, lambda: rtree_db.find_available_spot('car', entry, exit)),
+        ('check_duplicate_entry_exit', db, lambda: db.check_duplicate_entry_exit(booking_id, 'entry')),
+        ('get_pending_fines', db, lambda: db.get_pending_fines(user_id)),
+        ('get_user_transactions', db, lambda: db.get_user_transactions(user_id)),
+        ('get_parking_spot_by_booking', db, lambda: db.get_parking_spot_by_booking(booking_id)),
+        ('get_active_booking', db, lambda: db.get_active_booking(user_id)),
+        ('get_user_bookings_page', db, lambda: db.get_user_bookings_page(user_id)),
+        ('get_user_bookings_page [before]', db, lambda: db.get_user_bookings_page(user_id, (2 ** 31, 1))),
+        ('verify_qr_booking', db, lambda: db.verify_qr_booking(booking_id)),
+        ('sweep_reservations', db, lambda: db.sweep_reservations()),
+        ('accrue_overstay_fines', db, lambda: db.accrue_overstay_fines({'car': 60, 'bike': 40})),
+        ('get_overstays', db, lambda: db.get_overstays()),
+        ('get_log_page', db, lambda: db.get_log_page()),
+        ('get_log_page [filtered]', db, lambda: db.get_log_page((2 ** 31, 1), action_type='entry',
+                                                                verified_by=admin_id)),
+        ('get_log_page [vehicle]', db, lambda: db.get_log_page(vehicle_number='ka01ef0001')),
+        ('get_gate_stats', db, lambda: db.get_gate_stats()),
+        # Last: it records an entry
+        ('process_gate_event', db, lambda: db.process_gate_event(booking_id, 'entry', admin_id)),
+    ]
+
+
+def captured_statements(db, call):
+    statements = []
+    with db.connection() as conn:
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+
+
+def is_full_scan(step, label):
+    """A SCAN step over a real table, or over a virtual table with no usable constraint"""
+    if not step.startswith('SCAN') or step.split()[1] in SMALL_TABLES:
+        return False
+    if FULL_LOADS.get(label) == step.split()[1]:
+        return False
+    if any(step.endswith(f' INDEX {index}') for index in PARTIAL_INDEXES | PAGED_INDEXES):
+        return False
+    if ' VIRTUAL TABLE INDEX ' in step:
+        return step.endswith(':')
+    return True
+
+
+def main():
+    db_path = os.path.join(tempfile.mkdtemp(prefix='parking-plans-'), 'plans.db')
+    db = Database(db_path)
+    rtree_db = Database(db_path, interval_backend='rtree')
+    user_id = db.create_user({
+        'name': 'Plan User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'plans@example.edu'
+    })
+    entry = datetime.now().replace(second=0, microsecond=0)
+    result = db.book_spot({
+        'booking_id': 'PLAN-0001', 'user_id': user_id, 'vehicle_number': 'KA01EF0001',
+        'vehicle_type': 'car', 'entry_time': entry, 'exit_time': entry + timedelta(hours=1),
+        'amount': 30, 'qr_code': None
+    })
+    admin_id = db.authenticate_admin('admin', 'admin123')['admin_id']
+    # Load the in-memory indexes, so the plain lookups below show their steady-state queries
+    db.check_slot_availability('car', entry, entry + timedelta(hours=1))
+    db.find_available_spot('car', entry, entry + timedelta(hours=1))
+    print(f"🔎 Checking query plans (schema version {db.get_schema_version()})\n")
+
+    failures = 0
+    statements = [(label, sql, ())
+                  for label, target, call in hot_queries(db, rtree_db, user_id, result['booking_id'], admin_id)
+                  for sql in captured_statements(target, call)]
+    statements += [(f'export_rows [{kind}]', *db._export_query(kind, entry - timedelta(days=365), entry))
+                   for kind in EXPORTS]
+    for label, sql, parameters in statements:
+        with db.connection() as conn:
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+        scans = [step for step in plan if is_full_scan(step, label)]
+        ok = not scans
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {label}")
+        for step in plan:
+            print(f"     {step}")
+
+    db.close()
+    rtree_db.close()
+    if failures:
+        print(f"\n❌ {failures} hot queries fall back to a full table scan")
+        sys.exit(1)
+    print("\n✅ All hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
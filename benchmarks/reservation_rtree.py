@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark: reservation window lookups over a long booking history
+
+Seeds a throwaway database with a large history of slot reservations (all
+completed bar a few upcoming ones per spot, with matching bookings) and
+times check_slot_availability() and find_available_spot() for random
+upcoming windows three ways:
+
+  legacy  - the original OR-window COUNT / NOT IN queries against the tables
+  memory  - the per-process interval indexes (interval_backend='memory')
+  rtree   - range queries on the reservation_windows R*Tree (interval_backend='rtree')
+
+The memory backend is timed both warm and right after another process
+wrote a booking, which forces it to reload.
+
+Usage: python benchmarks/reservation_rtree.py [reservations] [queries]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from database import Database  # noqa: E402
+
+# Upcoming reservations per spot, back to back, in the week after now
+ACTIVE_PER_SPOT = 20
+
+LEGACY_AVAILABILITY_SQL = '''
+    SELECT COUNT(*) FROM bookings
+    WHERE vehicle_type = ? AND status IN ('booked', 'active')
+    AND ((entry_time <= ? AND exit_time > ?) OR
+         (entry_time < ? AND exit_time >= ?) OR
+         (entry_time >= ? AND exit_time <= ?))
+'''
+
+LEGACY_SPOT_SQL = '''
+    SELECT spot_number, zone, floor_level FROM parking_spots
+    WHERE slot_type = ? AND status = 'available'
+    AND spot_number NOT IN (
+        SELECT spot_number FROM slot_reservations
+        WHERE status = 'active'
+        AND ((reserved_from <= ? AND reserved_until > ?) OR
+             (reserved_from < ? AND reserved_until >= ?) OR
+             (reserved_from >= ? AND reserved_until <= ?))
+    )
+    ORDER BY zone, spot_number
+    LIMIT 1
+'''
+
+
+def seed(db, user_id, total, now):
+    """Insert `total` reservations with matching bookings; returns the number still active"""
+    with db.connection() as conn:
+        spots = conn.execute('SELECT spot_number, slot_type FROM parking_spots').fetchall()
+
+    rows = []
+    # Upcoming, non-overlapping per spot
+    for spot_number, slot_type in spots:
+        start = now + timedelta(minutes=30 * random.randint(0, 4))
+        for _ in range(ACTIVE_PER_SPOT):
+            end = start + timedelta(minutes=30 * random.randint(1, 6))
+            rows.append((spot_number, slot_type, start, end, 'booked', 'active'))
+            start = end + timedelta(minutes=30 * random.randint(0, 4))
+    active = len(rows)
+
+    # History over the last three years
+    for _ in range(max(total - active, 0)):
+        spot_number, slot_type = random.choice(spots)
+        start = now - timedelta(minutes=30 * random.randint(48, 3 * 365 * 48))
+        end = start + timedelta(minutes=30 * random.randint(1, 8))
+        rows.append((spot_number, slot_type, start, end, 'completed', 'completed'))
+
+    bookings = [(f'BENCH-{i:08d}', user_id, f'KA01BN{i % 10000:04d}', slot_type, str(start), str(end), 30, status)
+                for i, (_, slot_type, start, end, status, _) in enumerate(rows)]
+    reservations = [(f'BENCH-{i:08d}', spot_number, str(start), str(end), status)
+                    for i, (spot_number, _, start, end, _, status) in enumerate(rows)]
+    with db.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO bookings (booking_id, user_id, vehicle_number, vehicle_type,
+                                  entry_time, exit_time, amount, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', bookings)
+        conn.executemany('''
+            INSERT INTO slot_reservations (booking_id, spot_number, reserved_from, reserved_until, status)
+            VALUES (?, ?, ?, ?, ?)
+        ''', reservations)
+    return active
+
+
+def legacy_availability(db, vehicle_type, entry, exit):
+    with db.connection() as conn:
+        total = conn.execute('SELECT total_slots FROM parking_slots WHERE slot_type = ?',
+                             (vehicle_type,)).fetchone()[0]
+        occupied = conn.execute(LEGACY_AVAILABILITY_SQL,
+                                (vehicle_type, entry, entry, exit, exit, entry, exit)).fetchone()[0]
+        return total - occupied
+
+
+def legacy_spot(db, vehicle_type, entry, exit):
+    with db.connection() as conn:
+        return conn.execute(LEGACY_SPOT_SQL,
+                            (vehicle_type, entry, entry, exit, exit, entry, exit)).fetchone()
+
+
+def time_calls(call, windows, before=None):
+    """Mean and p95 milliseconds of call(*window) over all windows"""
+    samples = []
+    for window in windows:
+        if before:
+            before()
+        started = time.perf_counter()
+        call(*window)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    random.seed(42)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='parking-rtree-'), 'rtree.db')
+    legacy = Database(db_path)
+    memory = Database(db_path, interval_backend='memory')
+    rtree = Database(db_path, interval_backend='rtree')
+    writer = Database(db_path)
+    user_id = legacy.create_user({
+        'name': 'Bench User', 'mobile': '0000000000', 'address': 'Campus',
+        'department': 'CS', 'university_id': 'U0001', 'email': 'bench@example.edu'
+    })
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    print(f"🌱 Seeding {total:,} reservations...")
+    started = time.perf_counter()
+    active = seed(legacy, user_id, total, now)
+    with legacy.connection() as conn:
+        conn.execute('ANALYZE')
+    print(f"   {active:,} active, seeded in {time.perf_counter() - started:.1f}s\n")
+
+    windows = []
+    for _ in range(queries):
+        entry = now + timedelta(minutes=30 * random.randint(0, 7 * 48))
+        vehicle_type = random.choice(('car', 'bike'))
+        windows.append((vehicle_type, entry, entry + timedelta(minutes=30 * random.randint(1, 8))))
+
+    # Same answers from both interval backends, also once some bookings are cancelled while
+    # their reservations still wait for the sweeper
+    for cancelled in (False, True):
+        if cancelled:
+            with writer.connection() as conn:
+                conn.execute("""
+                    UPDATE bookings SET status = 'cancelled'
+                    WHERE status = 'booked' AND id % 7 = 0
+                """)
+        for window in windows:
+            assert memory.check_slot_availability(*window) == rtree.check_slot_availability(*window), window
+            assert memory.find_available_spot(*window) == rtree.find_available_spot(*window), window
+    print(f"✅ memory and rtree backends agree on {queries} windows, before and after cancellations\n")
+
+    far_future = iter(range(10 ** 9))
+
+    def other_process_writes():
+        # A booking a year out: outside every timed window, but it bumps both generations
+        entry = now + timedelta(days=365, hours=next(far_future))
+        writer.book_spot({
+            'booking_id': f'WRITE-{entry:%Y%m%d%H}', 'user_id': user_id, 'vehicle_number': 'KA01WR0001',
+            'vehicle_type': 'car', 'entry_time': entry, 'exit_time': entry + timedelta(hours=1),
+            'amount': 30, 'qr_code': None
+        })
+
+    scenarios = [
+        ('check_slot_availability', [
+            ('legacy', partial(legacy_availability, legacy), None),
+            ('memory (warm)', memory.check_slot_availability, None),
+            ('memory (after a write)', memory.check_slot_availability, other_process_writes),
+            ('rtree', rtree.check_slot_availability, None),
+        ]),
+        ('find_available_spot', [
+            ('legacy', partial(legacy_spot, legacy), None),
+            ('memory (warm)', memory.find_available_spot, None),
+            ('memory (after a write)', memory.find_available_spot, other_process_writes),
+            ('rtree', rtree.find_available_spot, None),
+        ]),
+    ]
+    for method, variants in scenarios:
+        print(f"⏱  {method} ({queries} queries)")
+        print(f"   {'backend':<24}{'mean ms':>10}{'p95 ms':>10}")
+        for label, call, before in variants:
+            mean, p95 = time_calls(call, windows, before)
+            print(f"   {label:<24}{mean:>10.3f}{p95:>10.3f}")
+        print()
+
+    for db in (legacy, memory, rtree, writer):
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: user and booking lookups through the change_log row caches
+
+Seeds a database and looks users and bookings up by ID (get_user_by_id,
+get_booking_by_id, as most pages do) from several reader threads, while
+a second Database on the same file, standing in for another gunicorn
+worker, keeps renaming users and extending bookings. Reports lookup
+latency with the caches against plain SELECTs, the cache hit rate and how
+many change_log entries the readers' process took in. The run fails if
+any cached row differs from the table once the writer stops.
+
+Usage: python benchmarks/row_cache.py [readers] [lookups] [writes]
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.seed import seed  # noqa: E402
+from database import Database  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix='parking-bench-')
+
+
+def run_readers(lookup, keys, readers, lookups, rng_seed):
+    """Latencies in microseconds of every lookup from every reader"""
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(readers)
+
+    def read(n):
+        rng = random.Random(rng_seed + n)
+        mine = []
+        barrier.wait()
+        for _ in range(lookups):
+            key = rng.choice(keys)
+            started = time.perf_counter()
+            lookup(key)
+            mine.append((time.perf_counter() - started) * 1e6)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=read, args=(n,)) for n in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies)
+
+
+def main():
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    writes = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+    path = os.path.join(TMP_DIR, 'row_cache.db')
+    db = Database(path)
+    seeded = seed(db, users=200, history=2000)
+    users = seeded['users']
+    user_ids = set(users)
+    with db.connection() as conn:
+        bookings = [row[0] for row in conn.execute('SELECT booking_id FROM bookings')]
+    other = Database(path)
+    db.changes.poll()
+
+    stop = threading.Event()
+    written = [0]
+
+    def write():
+        rng = random.Random(7)
+        while not stop.is_set() and written[0] < writes:
+            with other.connection() as conn:
+                if written[0] % 2:
+                    conn.execute('UPDATE users SET name = ? WHERE user_id = ?',
+                                 (f'Renamed {written[0]}', rng.choice(users)))
+                else:
+                    conn.execute("UPDATE bookings SET exit_time = datetime(exit_time, '+1 minute') "
+                                 "WHERE booking_id = ?", (rng.choice(bookings),))
+            written[0] += 1
+            time.sleep(0.001)
+
+    print(f"🗂  {readers} readers x {lookups} lookups, another process writing\n")
+    for label, lookup_user, lookup_booking in (
+            ('SELECT', db._load_user, db._load_booking),
+            ('row cache', db.get_user_by_id, db.get_booking_by_id)):
+        written[0] = 0
+        stop.clear()
+        writer = threading.Thread(target=write)
+        seq_before = db.changes.seq or 0
+        writer.start()
+        latencies = run_readers(
+            lambda key: lookup_user(key) if key in user_ids else lookup_booking(key),
+            users + bookings[:len(users)], readers, lookups, 1)
+        stop.set()
+        writer.join()
+        print(f"{label:<12}p50 {statistics.median(latencies):7.1f} µs   "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1]:7.1f} µs   ({written[0]} writes meanwhile)")
+
+    hits = db._users.hits + db._bookings.hits
+    misses = db._users.misses + db._bookings.misses
+    print(f"\n{'':<12}hit rate {hits / max(1, hits + misses):.1%}, "
+          f"{(db.changes.seq or 0) - seq_before} change_log entries taken in")
+
+    # Once the writer has stopped, every cached row must match the table
+    for key in users:
+        assert db.get_user_by_id(key) == db._load_user(key), f'stale user {key}'
+    for key in bookings[:len(users)]:
+        assert db.get_booking_by_id(key) == db._load_booking(key), f'stale booking {key}'
+    print(f"{'':<12}all cached rows match the tables")
+    other.close()
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Seed a parking database for load tests
+
+Adds users, a history of completed bookings (with their reservations,
+transactions and gate logs, inserted in bulk), and live bookings that
+fill every spot from now, ready to be scanned in at the gates.
+
+Usage: python -m benchmarks.seed PATH [--users N] [--history N] [--no-live]
+"""
+
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from database import Database  # app/ is on sys.path via benchmarks/__init__.py
+
+ADMIN_USERNAME = 'admin'
+ADMIN_PASSWORD = 'admin123'
+
+
+def seed(db, users=200, history=5000, live=True, rng=None):
+    """Seed db; returns {'users': [user_id, ...], 'live_bookings': [booking_id, ...]}"""
+    rng = rng or random.Random(42)
+    now = datetime.now().replace(second=0, microsecond=0)
+
+    user_ids = [str(uuid.uuid4())[:8].upper() for _ in range(users)]
+    with db.connection() as conn:
+        conn.executemany('''
+            INSERT INTO users (user_id, name, mobile, address, department, university_id, email)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [(user_id, f'Load User {n}', f'9{n:09d}', 'Campus', 'CS', f'U{n:05d}', f'load{n}@example.edu')
+              for n, user_id in enumerate(user_ids)])
+        spots = conn.execute('SELECT spot_number, slot_type FROM parking_spots').fetchall()
+        admin_id = conn.execute('SELECT admin_id FROM admins WHERE username = ?',
+                                (ADMIN_USERNAME,)).fetchone()[0]
+
+    bookings, reservations, transactions, logs = [], [], [], []
+    for n in range(history):
+        booking_id = str(uuid.uuid4())[:12].upper()
+        user_id = rng.choice(user_ids)
+        spot_number, vehicle_type = rng.choice(spots)
+        entry = now - timedelta(minutes=30 * rng.randint(48, 365 * 48))
+        exit = entry + timedelta(minutes=30 * rng.randint(1, 8))
+        amount = 30 if vehicle_type == 'car' else 20
+        bookings.append((booking_id, user_id, f'KA01LT{n % 10000:04d}', vehicle_type,
+                         str(entry), str(exit), amount, 'completed', str(entry)))
+        reservations.append((booking_id, spot_number, str(entry), str(exit), 'completed'))
+        transactions.append((str(uuid.uuid4())[:16].upper(), user_id, booking_id, 'booking',
+                             amount, amount, str(entry)))
+        logs.append((booking_id, 'entry', str(entry), admin_id, spot_number))
+        logs.append((booking_id, 'exit', str(exit), admin_id, spot_number))
+
+    with db.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO bookings (booking_id, user_id, vehicle_number, vehicle_type,
+                                  entry_time, exit_time, amount, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', bookings)
+        conn.executemany('''
+            INSERT INTO slot_reservations (booking_id, spot_number, reserved_from, reserved_until, status)
+            VALUES (?, ?, ?, ?, ?)
+        ''', reservations)
+        conn.executemany('''
+            INSERT INTO transactions (transaction_id, user_id, booking_id, transaction_type,
+                                      parking_amount, total_amount, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', transactions)
+        conn.executemany('''
+            INSERT INTO entry_exit_logs (booking_id, action_type, timestamp, verified_by, spot_number)
+            VALUES (?, ?, ?, ?, ?)
+        ''', logs)
+
+    live_bookings = []
+    if live:
+        for spot_number, vehicle_type in spots:
+            result = db.book_spot({
+                'booking_id': str(uuid.uuid4())[:12].upper(), 'user_id': rng.choice(user_ids),
+                'vehicle_number': f'KA01LV{len(live_bookings):04d}', 'vehicle_type': vehicle_type,
+                'entry_time': now, 'exit_time': now + timedelta(hours=2),
+                'amount': 60 if vehicle_type == 'car' else 40
+            })
+            if result['spot_number']:
+                live_bookings.append(result['booking_id'])
+
+    with db.connection() as conn:
+        conn.execute('ANALYZE')
+    return {'users': user_ids, 'live_bookings': live_bookings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a parking database for load tests')
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--history', type=int, default=5000, help='completed bookings')
+    parser.add_argument('--no-live', dest='live', action='store_false', help='skip the live bookings')
+    args = parser.parse_args()
+
+    db = Database(args.path)
+    result = seed(db, users=args.users, history=args.history, live=args.live)
+    db.close()
+    print(f"🌱 Seeded {args.path}: {len(result['users'])} users, {args.history} completed bookings, "
+          f"{len(result['live_bookings'])} live bookings")
+
+
+if __name__ == "__main__":
+    main()
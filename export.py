@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Export transactions, bookings or gate logs as CSV or NDJSON
+
+Streams the rows, oldest first, from Database.export_rows() to a file or
+stdout a batch at a time, so a year of transactions or gate logs exports
+in constant memory. --since and --until are local dates, --until
+inclusive. The admin pages serve the same exports at /admin/export/<kind>.
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+from app.database import EXPORT_BATCH_SIZE, EXPORTS, Database
+from app.exports import FORMATS, encode, gzipped
+
+
+def local_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('kind', choices=sorted(EXPORTS), help='what to export')
+    parser.add_argument('--db', default=os.environ.get('PARKING_DB_PATH', 'parking.db'),
+                        help='database path (default: $PARKING_DB_PATH or parking.db)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='output format (default: csv)')
+    parser.add_argument('--since', type=local_date, metavar='YYYY-MM-DD', help='first day to export')
+    parser.add_argument('--until', type=local_date, metavar='YYYY-MM-DD', help='last day to export')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--batch', type=int, default=EXPORT_BATCH_SIZE, help='rows fetched at a time')
+    parser.add_argument('-o', '--output', help='file to write (default: stdout)')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    until = args.until + timedelta(days=1) if args.until else None
+    chunks = encode(EXPORTS[args.kind].columns,
+                    db.export_rows(args.kind, args.since, until, batch_size=args.batch), args.format)
+    chunks = gzipped(chunks) if args.gzip else (chunk.encode() for chunk in chunks)
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    except BrokenPipeError:
+        # e.g. piped into head; stop quietly
+        sys.stderr.close()
+    finally:
+        if args.output:
+            out.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Check the gate_stats_daily rollup against the gate logs
+
+Recounts gate scans per local day, zone, action and verifying admin from
+entry_exit_logs and reports every count that disagrees with
+gate_stats_daily. With --rebuild, rewrites gate_stats_daily from the logs
+instead (the backfill for logs written before the rollup existed, or by
+a process that bypassed it). Exits non-zero if mismatches were found and
+not rebuilt.
+"""
+
+import argparse
+import os
+import sys
+
+from app.database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=os.environ.get('PARKING_DB_PATH', 'parking.db'),
+                        help='database path (default: $PARKING_DB_PATH or parking.db)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='rewrite gate_stats_daily from entry_exit_logs')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        if args.rebuild:
+            print(f"🔁 Rebuilt {db.rebuild_gate_stats()} daily gate statistics rows")
+            return
+        mismatches = db.verify_gate_stats()
+        for (day, zone, action_type, verified_by), stored, actual in mismatches:
+            print(f"❌ {day} zone {zone or '-'} {action_type} by {verified_by or '-'}: "
+                  f"stored {stored}, actual {actual}")
+        if mismatches:
+            print(f"\n{len(mismatches)} counts disagree; run with --rebuild to fix them")
+            sys.exit(1)
+        print("✅ Daily gate statistics match the gate logs")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
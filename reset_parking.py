@@ -13,6 +13,10 @@ def reset_parking_spots():
     if os.path.exists('parking.db'):
         os.remove('parking.db')
         print("✅ Deleted old database")
+    # WAL mode keeps a write-ahead log and shared-memory index next to the database
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists('parking.db' + suffix):
+            os.remove('parking.db' + suffix)
     
     # Reinitialize database
     db = Database()
@@ -46,6 +50,7 @@ def reset_parking_spots():
         print(f"  {admin[0]} ({admin[1]}) - Role: {admin[2]}")
     
     conn.close()
+    db.close()
     print("\n✅ Database reset complete!")
     print("\n🎯 System Configuration:")
     print("  - Bike Slots: 20 (₹20/hour)")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Release parking spots held by no-shows and expired reservations
+
+Runs Database.sweep_reservations() once, or every --every seconds. The
+web app runs the same sweep in-process (PARKING_SWEEP_SECONDS); this is
+for running it from cron or by hand instead.
+"""
+
+import argparse
+import os
+import time
+from datetime import timedelta
+
+from app.database import NO_SHOW_WINDOW, RESERVATION_GRACE, SWEEP_BATCH_SIZE, Database
+
+
+def sweep(db, args):
+    counts = db.sweep_reservations(no_show_window=timedelta(minutes=args.no_show_minutes),
+                                   grace=timedelta(minutes=args.grace_minutes),
+                                   batch_size=args.batch)
+    print(f"🧹 {counts['no_show']} no-show bookings, {counts['expired']} expired reservations, "
+          f"{counts['released']} spots released")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=os.environ.get('PARKING_DB_PATH', 'parking.db'),
+                        help='database path (default: $PARKING_DB_PATH or parking.db)')
+    parser.add_argument('--no-show-minutes', type=float, default=NO_SHOW_WINDOW.total_seconds() / 60,
+                        help='minutes after entry time before an unentered booking is a no-show')
+    parser.add_argument('--grace-minutes', type=float, default=RESERVATION_GRACE.total_seconds() / 60,
+                        help='minutes after a reservation ends before it is released')
+    parser.add_argument('--batch', type=int, default=SWEEP_BATCH_SIZE,
+                        help='bookings and reservations per transaction')
+    parser.add_argument('--every', type=float, metavar='SECONDS',
+                        help='keep sweeping at this interval instead of once')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        sweep(db, args)
+        while args.every:
+            time.sleep(args.every)
+            sweep(db, args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Check the user_accounts summary against fines and transactions
+
+Recomputes every user's pending fines, lifetime spend and transaction
+count from the fines and transactions tables and reports any account that
+disagrees with user_accounts. With --rebuild, rewrites user_accounts from
+the recomputed figures instead. Exits non-zero if mismatches were found
+and not rebuilt.
+"""
+
+import argparse
+import os
+import sys
+
+from app.database import Database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=os.environ.get('PARKING_DB_PATH', 'parking.db'),
+                        help='database path (default: $PARKING_DB_PATH or parking.db)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='rewrite user_accounts from fines and transactions')
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        if args.rebuild:
+            print(f"🔁 Rebuilt {db.rebuild_user_accounts()} user accounts")
+            return
+        mismatches = db.verify_user_accounts()
+        for user_id, stored, actual in mismatches:
+            print(f"❌ {user_id}: stored {tuple(stored)}, actual {tuple(actual)}")
+        if mismatches:
+            print(f"\n{len(mismatches)} accounts disagree; run with --rebuild to fix them")
+            sys.exit(1)
+        print("✅ All user accounts match fines and transactions")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()